@@ -5,13 +5,23 @@ from flask_login import LoginManager
 from database import db
 from models import User, Meal, Ingredient, MealIngredient, Product, FlexibleSubscription
 from routes import routes
+from notification_queue import dispatcher
+import avatars
+from assets import assets
+import menu_cache
+import migrations
+from instrumentation import instrumentation
+from metrics import metrics
+from passwords import hasher, login_throttle
+from idempotency import idempotency
 import os
 from flask_wtf.csrf import CSRFProtect
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY") or os.urandom(32).hex()
 #csrf = CSRFProtect(app)  # Включаем защиту
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///school_food.db'
+# DATABASE_URL позволяет запустить приложение на отдельной базе (бенчмарки, профилирование)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///school_food.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # === СЕКРЕТНЫЕ КОДЫ ДОСТУПА ===
@@ -27,7 +37,48 @@ AVATARS_FOLDER = os.path.join('static', 'avatars')
 os.makedirs(AVATARS_FOLDER, exist_ok=True)
 app.config['AVATARS_FOLDER'] = AVATARS_FOLDER
 
+# Хэширование паролей: алгоритм и его стоимость (подбирается через
+# benchmarks/password_hash.py), пул для входа и регистрации, потоки для импорта
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_HASH_POOL_SIZE'] = max(1, (os.cpu_count() or 2) // 2)
+app.config['PASSWORD_HASH_QUEUE_SIZE'] = 32
+app.config['PASSWORD_HASH_WORKERS'] = os.cpu_count() or 2
+
+# Неудачные входы за LOGIN_THROTTLE_WINDOW секунд, после которых вход временно закрыт
+app.config['LOGIN_THROTTLE_WINDOW'] = 300
+app.config['LOGIN_MAX_FAILURES_PER_IP'] = 30
+app.config['LOGIN_MAX_FAILURES_PER_ACCOUNT'] = 10
+
+# Сколько минут можно отменить архивирование учеников
+app.config['ARCHIVE_UNDO_MINUTES'] = 15
+
+# Повтор POST оплаты/заявки с тем же ключом отдаёт сохранённый ответ
+app.config['IDEMPOTENCY_TTL_HOURS'] = 24
+app.config['IDEMPOTENCY_WAIT_SECONDS'] = 10
+
+# Фоновая запись уведомлений (в тестах — синхронно)
+app.config['NOTIFICATIONS_ASYNC'] = True
+app.config['NOTIFICATIONS_FLUSH_INTERVAL_MS'] = 200
+app.config['NOTIFICATIONS_QUEUE_SIZE'] = 10000
+
+# Счётчики SQL по маршрутам и журнал медленных запросов
+app.config['INSTRUMENTATION_ENABLED'] = True
+app.config['SLOW_REQUEST_MS'] = 500
+
+# Метрики Prometheus (/admin/metrics): сборщик авторизуется заголовком
+# Authorization: Bearer <METRICS_TOKEN>, администратор — обычной сессией
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+
 db.init_app(app)
+instrumentation.init_app(app, db)
+metrics.init_app(app, db)
+dispatcher.init_app(app)
+hasher.init_app(app)
+login_throttle.init_app(app)
+idempotency.init_app(app)
+avatars.init_app(app)
+assets.init_app(app)
+menu_cache.init_app(app)
 
 login_manager = LoginManager(app)
 
@@ -40,6 +91,13 @@ app.register_blueprint(routes)
 with app.app_context():
     db.create_all()
 
+    # create_all не меняет уже существующие таблицы — догоняем схему миграциями
+    migrations.migrate()
+
+    # Миниатюры аватарок: стандартная и загруженные до перехода на WebP
+    avatars.prepare_default_avatar()
+    avatars.migrate_legacy_avatars()
+
     # === Меню ===
     if Meal.query.count() == 0:
         meals_data = [
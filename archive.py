@@ -0,0 +1,105 @@
+# archive.py
+
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, insert, update, delete, func, literal, case, DateTime
+
+from database import db
+from models import User, DeletionLog
+
+REFUND_REASON = "Архивирование ученика с возвратом средств"
+
+
+class ArchiveUndoError(ValueError):
+    """Архивирование нельзя отменить (нет такой пачки или окно отмены прошло)"""
+
+
+def _archivable(student_ids=None, class_name=None):
+    """Условие отбора: активные ученики из списка id или из класса"""
+    condition = [User.role == "student", User.is_active == True]
+    if student_ids is not None:
+        condition.append(User.id.in_(student_ids))
+    if class_name is not None:
+        condition.append(User.class_name == class_name)
+    return condition
+
+
+def archive_students(admin, reason, student_ids=None, class_name=None):
+    """Архивирует учеников несколькими запросами на всю выборку.
+
+    Записи журнала (возврат и удаление) пишутся INSERT ... SELECT, ученики
+    архивируются одним UPDATE; все записи получают общий batch_id, по которому
+    архивирование можно отменить. Коммит — за вызывающим.
+    Возвращает (batch_id, число учеников, сумма возврата).
+    """
+    condition = _archivable(student_ids, class_name)
+    count, refund_total = db.session.execute(
+        select(func.count(User.id), func.coalesce(func.sum(case((User.balance > 0, User.balance), else_=0)), 0))
+        .where(*condition)
+    ).one()
+    if not count:
+        return None, 0, 0.0
+
+    batch_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    columns = ["user_id", "user_email", "user_full_name", "deleted_by_admin_id", "deleted_by_admin_email",
+               "refund_amount", "reason", "deleted_at", "batch_id"]
+
+    def log_rows(log_reason, *extra):
+        return select(User.id, User.email, User.full_name, literal(admin.id), literal(admin.email),
+                      User.balance, literal(log_reason), literal(now, DateTime), literal(batch_id)) \
+            .where(*condition, *extra)
+
+    # Порядок как при архивировании по одному: сначала возврат, затем удаление
+    db.session.execute(insert(DeletionLog).from_select(columns, log_rows(REFUND_REASON, User.balance > 0)))
+    db.session.execute(insert(DeletionLog).from_select(columns, log_rows(reason)))
+    db.session.execute(
+        update(User).where(*condition).values(is_active=False, deleted_at=now, deleted_by=admin.id)
+        .execution_options(synchronize_session=False)
+    )
+    return batch_id, count, float(refund_total)
+
+
+def recent_batches(undo_minutes):
+    """Пачки архивирования, которые ещё можно отменить (новые сначала)"""
+    since = datetime.utcnow() - timedelta(minutes=undo_minutes)
+    rows = db.session.execute(
+        select(DeletionLog.batch_id, func.min(DeletionLog.deleted_at), func.count(func.distinct(DeletionLog.user_id)),
+               func.min(DeletionLog.deleted_by_admin_email))
+        .where(DeletionLog.batch_id.is_not(None), DeletionLog.deleted_at >= since)
+        .group_by(DeletionLog.batch_id)
+        .order_by(func.min(DeletionLog.deleted_at).desc())
+    ).all()
+    return [{
+        "batch_id": batch_id,
+        "archived_at": archived_at,
+        "count": count,
+        "admin_email": admin_email,
+        "undo_until": archived_at + timedelta(minutes=undo_minutes)
+    } for batch_id, archived_at, count, admin_email in rows]
+
+
+def undo_archive(batch_id, undo_minutes):
+    """Возвращает учеников пачки и удаляет её записи журнала. Коммит — за вызывающим.
+
+    Восстанавливаются только ученики, которых с тех пор не трогали
+    (по-прежнему в архиве с той же датой). Возвращает число восстановленных.
+    """
+    archived_at = db.session.scalar(
+        select(func.min(DeletionLog.deleted_at)).where(DeletionLog.batch_id == batch_id)
+    )
+    if archived_at is None:
+        raise ArchiveUndoError("Архивирование не найдено или уже отменено")
+    if archived_at < datetime.utcnow() - timedelta(minutes=undo_minutes):
+        raise ArchiveUndoError(f"Отменить архивирование можно только в течение {undo_minutes} мин.")
+
+    restored = db.session.execute(
+        update(User)
+        .where(User.id.in_(select(DeletionLog.user_id).where(DeletionLog.batch_id == batch_id)),
+               User.is_active == False, User.deleted_at == archived_at)
+        .values(is_active=True, deleted_at=None, deleted_by=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.execute(delete(DeletionLog).where(DeletionLog.batch_id == batch_id))
+    return restored
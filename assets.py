@@ -0,0 +1,134 @@
+# assets.py
+
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import abort, request, Response, url_for
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен — без него отдаём gzip
+    brotli = None
+
+# Какие каталоги static/ проходят через конвейер
+ASSET_DIRS = ("css", "js")
+
+# Файлы меньше этого размера не сжимаем — заголовки съедят выигрыш
+MIN_COMPRESS_SIZE = 512
+
+
+class Asset:
+    """Один статический файл: хэш содержимого и заранее сжатые варианты"""
+
+    __slots__ = ('path', 'mtime', 'digest', 'mimetype', 'variants')
+
+    def __init__(self, path, mtime, digest, mimetype, variants):
+        self.path = path
+        self.mtime = mtime
+        self.digest = digest
+        self.mimetype = mimetype
+        self.variants = variants  # {"identity"|"gzip"|"br": bytes}
+
+
+class AssetManifest:
+    """Статика с хэшем содержимого в URL и заранее сжатыми копиями.
+
+    При старте каждый файл из static/css и static/js читается один раз,
+    для него считается sha256 и готовятся gzip/brotli-версии в памяти.
+    Шаблоны получают URL вида /assets/css/style.<hash>.css: содержимое
+    по такому адресу никогда не меняется, поэтому кэшируется на год.
+    В режиме отладки изменённые файлы пересобираются при обращении.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._assets = {}
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['assets'] = self
+        app.add_url_rule('/assets/<path:filename>', 'asset_file', self.serve)
+        app.add_template_global(self.url, 'asset_url')
+        self.build()
+
+    def build(self):
+        for folder in ASSET_DIRS:
+            root = os.path.join(self.app.static_folder, folder)
+            if not os.path.isdir(root):
+                continue
+            for name in sorted(os.listdir(root)):
+                path = os.path.join(root, name)
+                if os.path.isfile(path):
+                    self._load(f"{folder}/{name}", path)
+
+    def _load(self, logical, path):
+        with open(path, "rb") as f:
+            content = f.read()
+
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if mimetype.startswith("text/") or mimetype.endswith("javascript"):
+            mimetype += "; charset=utf-8"
+
+        variants = {"identity": content}
+        if len(content) >= MIN_COMPRESS_SIZE:
+            variants["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+            if brotli is not None:
+                variants["br"] = brotli.compress(content, quality=11)
+
+        asset = Asset(path, os.path.getmtime(path), hashlib.sha256(content).hexdigest()[:12],
+                      mimetype, variants)
+        self._assets[logical] = asset
+        return asset
+
+    def _get(self, logical):
+        asset = self._assets.get(logical)
+        if asset is not None and self.app.debug:
+            try:
+                if os.path.getmtime(asset.path) != asset.mtime:
+                    asset = self._load(logical, asset.path)
+            except OSError:
+                return None
+        return asset
+
+    def url(self, logical):
+        """URL файла с хэшем содержимого (для шаблонов: asset_url('css/style.css'))"""
+        asset = self._get(logical)
+        if asset is None:
+            return url_for('static', filename=logical)
+        base, ext = os.path.splitext(logical)
+        return url_for('asset_file', filename=f"{base}.{asset.digest}{ext}")
+
+    def serve(self, filename):
+        base, ext = os.path.splitext(filename)
+        logical, _, digest = base.rpartition(".")
+        asset = self._get(logical + ext)
+        # Устаревший хэш — 404: иначе кэш запомнит под старым адресом новое содержимое
+        if asset is None or digest != asset.digest:
+            abort(404)
+
+        etag = f'"{asset.digest}"'
+        headers = {
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "Vary": "Accept-Encoding",
+            "ETag": etag
+        }
+        if request.headers.get("If-None-Match") == etag:
+            return Response(status=304, headers=headers)
+
+        encoding = self._pick_encoding(asset)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(asset.variants[encoding], content_type=asset.mimetype, headers=headers)
+
+    @staticmethod
+    def _pick_encoding(asset):
+        accepted = request.accept_encodings
+        for encoding in ("br", "gzip"):
+            if encoding in asset.variants and accepted[encoding]:
+                return encoding
+        return "identity"
+
+
+assets = AssetManifest()
@@ -0,0 +1,179 @@
+# avatars.py
+
+import hashlib
+import io
+import os
+import re
+
+from flask import current_app, send_from_directory, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from database import db
+from models import User
+
+DEFAULT_AVATAR = 'default_avatar.png'
+
+# Размеры квадратных миниатюр: sm — для списков, md — для профиля (120px на retina)
+AVATAR_SIZES = {"sm": 64, "md": 240}
+
+# Форматы, которые принимаем на вход (по содержимому файла, а не по расширению)
+ACCEPTED_FORMATS = {"PNG", "JPEG", "GIF", "WEBP"}
+
+# Обработанные аватарки: <sha256[:20]>.webp, файлы миниатюр — <hash>_<size>.webp
+HASHED_NAME = re.compile(r'^([0-9a-f]{20})\.webp$')
+HASHED_FILE = re.compile(r'^([0-9a-f]{20})_(sm|md)\.webp$')
+
+
+class AvatarError(ValueError):
+    """Файл не является допустимым изображением"""
+
+
+def init_app(app):
+    app.config.setdefault('AVATAR_MAX_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('AVATAR_MAX_PIXELS', 40_000_000)
+    app.config.setdefault('AVATAR_WEBP_QUALITY', 80)
+    app.add_url_rule('/avatars/<filename>', 'avatar_file', serve_avatar)
+    app.add_template_global(avatar_url)
+
+
+def process_avatar(stream):
+    """Проверяет и перекодирует загруженное изображение.
+
+    Возвращает (имя файла для User.avatar_filename, {размер: байты WebP}).
+    Имя — хэш содержимого, поэтому одинаковые картинки хранятся один раз.
+    """
+    max_bytes = current_app.config['AVATAR_MAX_BYTES']
+    data = stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise AvatarError(f"Файл больше {max_bytes // (1024 * 1024)} МБ")
+
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            if probe.format not in ACCEPTED_FORMATS:
+                raise AvatarError("Недопустимый формат изображения")
+            width, height = probe.size
+            if width * height > current_app.config['AVATAR_MAX_PIXELS']:
+                raise AvatarError("Слишком большое разрешение изображения")
+            probe.verify()
+
+        # После verify() объект непригоден — открываем заново
+        with Image.open(io.BytesIO(data)) as image:
+            image.seek(0)  # у GIF берём первый кадр
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGBA" if _has_alpha(image) else "RGB")
+    except AvatarError:
+        raise
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError):
+        raise AvatarError("Файл не является изображением")
+
+    quality = current_app.config['AVATAR_WEBP_QUALITY']
+    files = {}
+    for size, side in AVATAR_SIZES.items():
+        thumb = ImageOps.fit(image, (side, side), Image.LANCZOS)
+        buffer = io.BytesIO()
+        thumb.save(buffer, "WEBP", quality=quality, method=6)
+        files[size] = buffer.getvalue()
+
+    digest = hashlib.sha256(files["md"]).hexdigest()[:20]
+    return f"{digest}.webp", files
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def save_avatar(filename, files):
+    """Записывает миниатюры; уже существующие файлы с тем же хэшем не трогаются"""
+    folder = current_app.config['AVATARS_FOLDER']
+    digest = HASHED_NAME.match(filename).group(1)
+    for size, content in files.items():
+        path = os.path.join(folder, f"{digest}_{size}.webp")
+        if os.path.exists(path):
+            continue
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+def remove_avatar_if_unused(filename):
+    """Удаляет файлы аватарки, если на неё больше не ссылается ни один пользователь.
+
+    Вызывать после коммита, в котором пользователю назначена новая аватарка.
+    """
+    if not filename or filename in (DEFAULT_AVATAR, current_app.config.get('DEFAULT_AVATAR_HASHED')):
+        return
+    if db.session.query(User.id).filter_by(avatar_filename=filename).first():
+        return
+
+    folder = current_app.config['AVATARS_FOLDER']
+    match = HASHED_NAME.match(filename)
+    names = [f"{match.group(1)}_{size}.webp" for size in AVATAR_SIZES] if match else [filename]
+    for name in names:
+        path = os.path.join(folder, os.path.basename(name))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Не удалось удалить аватарку {name}: {e}")
+
+
+def avatar_url(user, size="md"):
+    """URL миниатюры аватарки пользователя (для шаблонов)"""
+    filename = getattr(user, "avatar_filename", None) or DEFAULT_AVATAR
+    if filename == DEFAULT_AVATAR:
+        filename = current_app.config.get('DEFAULT_AVATAR_HASHED') or DEFAULT_AVATAR
+    match = HASHED_NAME.match(filename)
+    if match:
+        return url_for('avatar_file', filename=f"{match.group(1)}_{size}.webp")
+    return url_for('static', filename='avatars/' + filename)
+
+
+def serve_avatar(filename):
+    """Отдаёт миниатюру: имя содержит хэш содержимого, поэтому кэш — на год"""
+    if not HASHED_FILE.match(filename):
+        return "Not found", 404
+    response = send_from_directory(current_app.config['AVATARS_FOLDER'], filename,
+                                   mimetype="image/webp", max_age=31536000)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+def prepare_default_avatar():
+    """Готовит миниатюры стандартной аватарки, которую видит большинство пользователей"""
+    path = os.path.join(current_app.config['AVATARS_FOLDER'], DEFAULT_AVATAR)
+    try:
+        with open(path, "rb") as f:
+            filename, files = process_avatar(f)
+    except (OSError, AvatarError) as e:
+        print(f"Стандартная аватарка не обработана: {e}")
+        return
+    save_avatar(filename, files)
+    current_app.config['DEFAULT_AVATAR_HASHED'] = filename
+
+
+def migrate_legacy_avatars():
+    """Перекодирует аватарки, загруженные до появления миниатюр"""
+    folder = current_app.config['AVATARS_FOLDER']
+    legacy = db.session.query(User.avatar_filename).filter(
+        User.avatar_filename.isnot(None),
+        User.avatar_filename != DEFAULT_AVATAR
+    ).distinct().all()
+
+    for (old_name,) in legacy:
+        if HASHED_NAME.match(old_name):
+            continue
+        path = os.path.join(folder, os.path.basename(old_name))
+        try:
+            with open(path, "rb") as f:
+                new_name, files = process_avatar(f)
+        except (OSError, AvatarError) as e:
+            print(f"Аватарка {old_name} пропущена: {e}")
+            continue
+
+        save_avatar(new_name, files)
+        User.query.filter_by(avatar_filename=old_name) \
+            .update({"avatar_filename": new_name}, synchronize_session=False)
+        db.session.commit()
+        remove_avatar_if_unused(old_name)
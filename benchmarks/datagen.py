@@ -0,0 +1,374 @@
+# benchmarks/datagen.py
+"""Генератор синтетической школы для профилирования и бенчмарков.
+
+Создаёт базу SQLite со школой промышленного масштаба: тысячи учеников по
+классам, учебный год заказов с реалистичной долей оплат, выдач и
+подтверждений, гибкие абонементы, отзывы, списания, заявки на закупку и
+миллионы уведомлений. Всё пишется пачками executemany, поэтому
+большая база готова за секунды, а не за часы построчных commit.
+
+Запуск из корня репозитория:
+    python benchmarks/datagen.py --database /tmp/school.db --students 3000
+    DATABASE_URL=sqlite:////tmp/school.db python app.py
+
+Пароль всех созданных пользователей — PASSWORD; входить как
+student0@bench.local, cook@bench.local, admin@bench.local.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = "Bench-Passw0rd!"
+CLASSES = [f"{grade}{letter}" for grade in range(1, 12) for letter in "АБВ"]
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday"]
+MEAL_TYPES = ["breakfast", "lunch"]
+
+COOKS = ["cook@bench.local", "cook2@bench.local"]
+ADMINS = ["admin@bench.local"]
+
+REVIEW_TEXTS = ["Вкусно", "Суп был холодный", "Спасибо поварам!", "Маленькая порция",
+                "Хотелось бы больше овощей", "Очень понравилось", "Слишком солёно"]
+WRITE_OFF_REASONS = ["Порча", "Истёк срок годности", "Брак поставки"]
+NOTIFICATION_TEMPLATES = [
+    ("success", "✅ Оплата прошла успешно", "Обед на понедельник оплачен. Сумма: 100.0 ₽"),
+    ("info", "🍽️ Питание выдано", "Обед выдан в столовой. Пожалуйста, подтвердите получение в вашем кабинете."),
+    ("info", "🔐 Вход в систему", "Вы успешно вошли в систему."),
+    ("success", "💰 Баланс пополнен", "Ваш баланс пополнен на 500.0 ₽."),
+    ("warning", "⚠️ Заканчиваются средства", "На балансе осталось меньше 100 ₽."),
+]
+
+
+def load_app(db_path):
+    """Импортирует приложение, направив его на базу db_path (меню и склад создаются при импорте)"""
+    # Конфигурация читается при импорте app.py, поэтому адрес базы задаём заранее
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.chdir(ROOT)
+    import app as app_module
+    return app_module.app
+
+
+def school_days(end, count):
+    """count последних будних дней до end включительно, по возрастанию"""
+    days = []
+    current = end
+    while len(days) < count:
+        if current.weekday() < 5:
+            days.append(current)
+        current -= timedelta(days=1)
+    return sorted(days)
+
+
+class BulkWriter:
+    """Копит строки по таблицам и пишет их пачками executemany.
+
+    Строки уходят в DBAPI напрямую, минуя обработчики типов SQLAlchemy
+    (на миллионах строк они занимают больше времени, чем сама вставка);
+    даты, время, JSON и суммы (в копейки) приводятся к тому виду, в каком
+    их хранит SQLAlchemy.
+    """
+
+    def __init__(self, conn, batch_size):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, model, row):
+        buffer = self.buffers.setdefault(model, [])
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model=None):
+        for item in ([model] if model is not None else list(self.buffers)):
+            rows = self.buffers.get(item)
+            if rows:
+                sql, convert = self._statement(item, list(rows[0]))
+                self.conn.exec_driver_sql(sql, [convert(row) for row in rows])
+                name = item.__tablename__
+                self.counts[name] = self.counts.get(name, 0) + len(rows)
+                self.buffers[item] = []
+
+    def _statement(self, model, columns):
+        from functools import partial
+        from sqlalchemy import JSON, Date, DateTime
+        from money import Money, to_minor
+
+        quote = self.conn.dialect.identifier_preparer.quote
+        sql = (f"INSERT INTO {quote(model.__tablename__)} ({', '.join(quote(c) for c in columns)}) "
+               f"VALUES ({', '.join('?' for _ in columns)})")
+
+        converters = []
+        for column in columns:
+            column_type = model.__table__.c[column].type
+            if isinstance(column_type, DateTime):
+                converters.append(_format_datetime)
+            elif isinstance(column_type, Date):
+                converters.append(date.isoformat)
+            elif isinstance(column_type, JSON):
+                converters.append(_format_json)
+            elif isinstance(column_type, Money):
+                converters.append(partial(to_minor, places=column_type.places))
+            else:
+                converters.append(None)
+
+        convert = [(i, f) for i, f in enumerate(converters) if f is not None]
+
+        def to_tuple(row):
+            values = list(row.values())
+            for i, f in convert:
+                if values[i] is not None:
+                    values[i] = f(values[i])
+            return tuple(values)
+        return sql, to_tuple
+
+
+def _format_datetime(value):
+    # Тот же вид, что у SQLAlchemy для SQLite, но isoformat в разы быстрее strftime
+    return value.isoformat(" ", "microseconds")
+
+
+def _format_json(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def generate(app, rng, students=2000, days=170, notifications_per_student=600,
+             today_lunch_share=0.6, batch_size=10000):
+    """Заполняет базу приложения синтетической школой; возвращает {таблица: строк}"""
+    from sqlalchemy import select
+    from werkzeug.security import generate_password_hash
+    from database import db
+    from models import (User, Order, Notification, Review, Meal, MealIngredient, Ingredient,
+                        FlexibleSubscription, WriteOff, PurchaseRequest, OrderWeek)
+    from order_weeks import slot_bit, week_start
+
+    with app.app_context(), db.engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            # База одноразовая: надёжность записи на диск не нужна
+            conn.exec_driver_sql("PRAGMA synchronous = OFF")
+            conn.exec_driver_sql("PRAGMA journal_mode = OFF")
+            conn.exec_driver_sql("PRAGMA cache_size = -262144")  # 256 МБ: индексы не вытесняются на диск
+        writer = BulkWriter(conn, batch_size)
+
+        # Вторичные индексы дешевле построить один раз по готовым данным,
+        # чем обновлять на каждой из миллионов вставок
+        indexes = list(Order.__table__.indexes) + list(Notification.__table__.indexes)
+        for index in indexes:
+            index.drop(conn, checkfirst=True)
+
+        # Хэш один на всех: pbkdf2 на каждого пользователя занял бы минуты
+        password_hash = generate_password_hash(PASSWORD)
+        now = datetime.utcnow()
+        today = date.today()
+
+        def user_row(email, full_name, role, class_name="", balance=0.0):
+            return {"full_name": full_name, "email": email, "password": password_hash, "role": role,
+                    "balance": balance, "class_name": class_name, "is_active": True,
+                    "avatar_filename": "default_avatar.png", "timestamp": now}
+
+        for i in range(students):
+            writer.add(User, user_row(f"student{i}@bench.local", f"Ученик {i:05d}", "student",
+                                      CLASSES[i % len(CLASSES)], float(rng.randint(0, 3000))))
+        for i, email in enumerate(COOKS, 1):
+            writer.add(User, user_row(email, f"Повар {i}", "cook"))
+        for i, email in enumerate(ADMINS, 1):
+            writer.add(User, user_row(email, f"Администратор {i}", "admin"))
+        writer.flush(User)
+
+        student_ids = list(conn.scalars(
+            select(User.id).where(User.role == "student", User.email.like("%@bench.local")).order_by(User.id)))
+        cook_ids = list(conn.scalars(select(User.id).where(User.email.in_(COOKS))))
+        staff_ids = cook_ids + list(conn.scalars(select(User.id).where(User.email.in_(ADMINS))))
+
+        # Снимки рецептов, как их фиксирует оплата
+        recipes = {}
+        meals = conn.execute(select(Meal.id, Meal.day_of_week, Meal.meal_type, Meal.name, Meal.price)).all()
+        items = conn.execute(select(MealIngredient.meal_id, Ingredient.name, MealIngredient.quantity, MealIngredient.unit)
+                             .join(Ingredient, Ingredient.id == MealIngredient.ingredient_id)
+                             .order_by(MealIngredient.id)).all()
+        for meal_id, day_key, meal_type, name, price in meals:
+            recipe = [{"name": n, "qty": q, "unit": u} for m, n, q, u in items if m == meal_id]
+            recipes[(day_key, meal_type)] = (name, price, json.dumps(recipe, ensure_ascii=False))
+        ingredients = conn.execute(select(Ingredient.id, Ingredient.name)).all()
+
+        # === ЗАКАЗЫ И АБОНЕМЕНТЫ ===
+        weeks = {}
+        for day in school_days(today - timedelta(days=1), days):
+            weeks.setdefault(day - timedelta(days=day.weekday()), []).append(day)
+
+        for student_id in student_ids:
+            # У каждого ученика свои привычки: кто-то всегда обедает, кто-то редко
+            appetite = {"breakfast": rng.uniform(0.2, 0.9), "lunch": rng.uniform(0.5, 0.95)}
+            uses_flexible = rng.random() < 0.3
+            # Маски недель копятся вместе с заказами: [оплачено, выдано, подтверждено]
+            masks = {}
+
+            for monday, week_days in weeks.items():
+                flexible_config = None
+                if uses_flexible and rng.random() < 0.7:
+                    flexible_config = {day_key: {mt: rng.random() < appetite[mt] for mt in MEAL_TYPES}
+                                       for day_key in WEEKDAYS}
+
+                week_meals = 0
+                week_price = 0.0
+                for day in week_days:
+                    day_key = WEEKDAYS[day.weekday()]
+                    for meal_type in MEAL_TYPES:
+                        if flexible_config is not None:
+                            if not flexible_config[day_key][meal_type]:
+                                continue
+                            source = "flexible"
+                            paid_at = datetime.combine(monday, datetime.min.time()) - timedelta(days=1 + int(rng.random() * 3))
+                        else:
+                            if rng.random() >= appetite[meal_type]:
+                                continue
+                            source = "single"
+                            paid_at = datetime.combine(day, datetime.min.time()) - timedelta(
+                                days=int(rng.random() * 5), minutes=int(rng.random() * 600))
+
+                        name, price, recipe = recipes[(day_key, meal_type)]
+                        week_meals += 1
+                        week_price += price
+                        paid = source == "flexible" or rng.random() < 0.97
+                        collected = paid and rng.random() < 0.92
+                        confirmed = collected and rng.random() < 0.85
+                        served_at = datetime.combine(day, datetime.min.time()) + timedelta(
+                            hours=9 if meal_type == "breakfast" else 13, minutes=int(rng.random() * 40))
+                        if paid:
+                            week = masks.setdefault(monday, [0, 0, 0])
+                            bit = slot_bit(day, meal_type)
+                            week[0] |= bit
+                            week[1] |= bit if collected else 0
+                            week[2] |= bit if confirmed else 0
+                        writer.add(Order, {
+                            "student_id": student_id, "day_of_week": day_key, "meal_type": meal_type,
+                            "status": "paid" if paid else "cancelled", "is_collected": collected,
+                            "serving_date": day, "timestamp": paid_at, "paid_at": paid_at,
+                            "meal_name": name, "meal_price": price, "meal_ingredients": recipe,
+                            "student_confirmed": confirmed,
+                            "confirmed_at": served_at + timedelta(minutes=5 + int(rng.random() * 300)) if confirmed else None,
+                            "consumed_at": served_at if collected else None,
+                            "payment_source": source
+                        })
+
+                if flexible_config is not None and week_meals:
+                    start = datetime.combine(week_days[0], datetime.min.time())
+                    writer.add(FlexibleSubscription, {
+                        "student_id": student_id, "days_count": len(week_days), "days_config": flexible_config,
+                        "total_price": week_price, "total_meals": week_meals,
+                        "created_at": start - timedelta(days=2), "start_date": start,
+                        "expires_at": datetime.combine(week_days[-1], datetime.min.time()),
+                        "is_active": False
+                    })
+
+                if rng.random() < 0.15:
+                    day = rng.choice(week_days)
+                    iso_year, iso_week, _ = day.isocalendar()
+                    writer.add(Review, {
+                        "student_id": student_id, "day_of_week": WEEKDAYS[day.weekday()],
+                        "meal_type": rng.choice(MEAL_TYPES), "text": rng.choice(REVIEW_TEXTS),
+                        "timestamp": datetime.combine(day, datetime.min.time()) + timedelta(hours=14),
+                        "week_number": 0, "review_year": iso_year, "review_week_iso": iso_week
+                    })
+
+            # Сегодняшние обеды, ещё не выданные (утро учебного дня)
+            if rng.random() < today_lunch_share:
+                today_key = WEEKDAYS[today.weekday()] if today.weekday() < 5 else "monday"
+                name, price, recipe = recipes[(today_key, "lunch")]
+                writer.add(Order, {
+                    "student_id": student_id, "day_of_week": today_key, "meal_type": "lunch", "status": "paid",
+                    "is_collected": False, "serving_date": today, "timestamp": now, "paid_at": now,
+                    "meal_name": name, "meal_price": price, "meal_ingredients": recipe,
+                    "student_confirmed": False, "confirmed_at": None, "consumed_at": None,
+                    "payment_source": "single"
+                })
+                if slot_bit(today, "lunch"):
+                    masks.setdefault(week_start(today), [0, 0, 0])[0] |= slot_bit(today, "lunch")
+
+            for monday, (paid, collected, confirmed) in masks.items():
+                writer.add(OrderWeek, {"student_id": student_id, "week_start": monday,
+                                       "paid": paid, "collected": collected, "confirmed": confirmed})
+
+        # === СКЛАД: СПИСАНИЯ И ЗАЯВКИ НА ЗАКУПКУ ===
+        last_monday = max(weeks) if weeks else None
+        for monday, week_days in weeks.items():
+            for day in week_days:
+                for _ in range(rng.randint(0, 3)):
+                    ingredient_id, _name = rng.choice(ingredients)
+                    writer.add(WriteOff, {
+                        "ingredient_id": ingredient_id, "quantity": float(rng.randint(1, 50) * 10), "unit": "г",
+                        "reason": rng.choice(WRITE_OFF_REASONS), "cook_id": rng.choice(cook_ids),
+                        "created_at": datetime.combine(day, datetime.min.time()) + timedelta(hours=rng.randint(8, 16))
+                    })
+            for _ in range(rng.randint(3, 8)):
+                _id, product = rng.choice(ingredients)
+                if monday == last_monday:
+                    status = "pending"
+                else:
+                    status = "approved" if rng.random() < 0.85 else "rejected"
+                writer.add(PurchaseRequest, {
+                    "cook_id": rng.choice(cook_ids), "product": product, "quantity": float(rng.randint(1, 20) * 500),
+                    "unit": "г", "status": status,
+                    "timestamp": datetime.combine(rng.choice(week_days), datetime.min.time()) + timedelta(hours=10)
+                })
+
+        # === УВЕДОМЛЕНИЯ ===
+        span_minutes = max(1, days) * 7 // 5 * 24 * 60
+        for user_id in student_ids + staff_ids:
+            for _ in range(notifications_per_student):
+                # random() вместо choice/randint: здесь миллионы итераций
+                kind, title, message = NOTIFICATION_TEMPLATES[int(rng.random() * len(NOTIFICATION_TEMPLATES))]
+                age = int(rng.random() * span_minutes)
+                writer.add(Notification, {
+                    "user_id": user_id, "type": kind, "title": title, "message": message,
+                    # Старые прочитаны почти все, за последние сутки — почти ни одного
+                    "is_read": age > 24 * 60 and rng.random() < 0.95,
+                    "created_at": now - timedelta(minutes=age)
+                })
+
+        writer.flush()
+        for index in indexes:
+            index.create(conn)
+        return writer.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор синтетической школы для профилирования")
+    parser.add_argument("--database", required=True, help="путь к создаваемому файлу SQLite")
+    parser.add_argument("--students", type=int, default=2000, help="число учеников")
+    parser.add_argument("--days", type=int, default=170, help="учебных дней истории (год — около 170)")
+    parser.add_argument("--notifications", type=int, default=600, help="уведомлений на пользователя")
+    parser.add_argument("--today-lunches", type=float, default=0.6, help="доля учеников с неполученным обедом сегодня")
+    parser.add_argument("--batch", type=int, default=10000, help="строк в одном INSERT")
+    parser.add_argument("--seed", type=int, default=2026, help="зерно генератора (для воспроизводимости)")
+    parser.add_argument("--force", action="store_true", help="перезаписать существующий файл")
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.database)
+    if os.path.exists(db_path):
+        if not args.force:
+            parser.error(f"{db_path} уже существует (используйте --force)")
+        os.remove(db_path)
+
+    app = load_app(db_path)
+    started = time.perf_counter()
+    counts = generate(app, random.Random(args.seed), students=args.students, days=args.days,
+                      notifications_per_student=args.notifications, today_lunch_share=args.today_lunches,
+                      batch_size=args.batch)
+    elapsed = time.perf_counter() - started
+
+    for table, count in counts.items():
+        print(f"{table:24} {count:>10}")
+    print(f"Всего строк: {sum(counts.values())} за {elapsed:.1f} с → {db_path}")
+
+
+if __name__ == "__main__":
+    main()
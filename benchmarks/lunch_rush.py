@@ -0,0 +1,266 @@
+# benchmarks/lunch_rush.py
+"""Нагрузочный тест «обеденный пик».
+
+Поднимает приложение на временной базе SQLite в этом же процессе, заполняет
+её синтетической школой из datagen.py (ученики, четверть заказов, уведомления)
+и прогоняет типичную смесь запросов:
+
+    08:00 вход учеников и открытие /student
+    опрос /api/notifications/count
+    оплата /pay
+    выдача /cook/mark_collected пачкой
+    /admin/reports за четверть
+
+Для каждого сценария печатает пропускную способность и задержки p50/p95/p99,
+для каждого маршрута — среднее и максимальное число SQL-запросов.
+
+Запуск из корня репозитория:
+    python benchmarks/lunch_rush.py --students 500 --concurrency 16
+    python benchmarks/lunch_rush.py --json bench.json   # сохранить результат для сравнения
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from datagen import PASSWORD, WEEKDAYS, generate, load_app, school_days
+
+
+# === ПРИЛОЖЕНИЕ НА ВРЕМЕННОЙ БАЗЕ ===
+
+class SqlCounter:
+    """Считает SQL-запросы и их время по маршрутам (на стороне сервера)"""
+
+    def __init__(self, app, engine):
+        from flask import request
+        from sqlalchemy import event
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = defaultdict(lambda: {"requests": 0, "queries": 0, "max_queries": 0, "sql_ms": 0.0})
+
+        @app.before_request
+        def start():
+            self._local.route = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+            self._local.queries = 0
+            self._local.sql = 0.0
+
+        @app.teardown_request
+        def finish(exc):
+            route = getattr(self._local, "route", None)
+            if route is None:
+                return
+            with self._lock:
+                item = self.stats[route]
+                item["requests"] += 1
+                item["queries"] += self._local.queries
+                item["max_queries"] = max(item["max_queries"], self._local.queries)
+                item["sql_ms"] += self._local.sql * 1000
+            self._local.route = None
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("bench_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info["bench_started"].pop()
+            if getattr(self._local, "route", None) is not None:
+                self._local.queries += 1
+                self._local.sql += time.perf_counter() - started
+
+
+# === СИНТЕТИЧЕСКАЯ ШКОЛА ===
+
+def seed(app, students, term_days, rng):
+    """Заполняет базу генератором datagen; возвращает id сегодняшних заказов"""
+    from sqlalchemy import select
+    from database import db
+    from models import Order, Product
+
+    counts = generate(app, rng, students=students, days=term_days, notifications_per_student=20)
+
+    with app.app_context():
+        # Склада должно хватить на весь пик выдачи
+        Product.query.update({"quantity": 10_000_000.0})
+        db.session.commit()
+
+        today_orders = list(db.session.scalars(
+            select(Order.id).where(Order.serving_date == date.today(), Order.status == "paid",
+                                   Order.is_collected == False)
+        ))
+    print("Заполнено: " + ", ".join(f"{table} {count}" for table, count in counts.items()))
+    return today_orders
+
+
+# === HTTP-КЛИЕНТ ===
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """Отдельная сессия браузера: свои cookies, редиректы не выполняются"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect
+        )
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        return status, time.perf_counter() - started
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(name, jobs, concurrency):
+    """jobs — список функций без аргументов, возвращающих (status, seconds)"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda job: job(), jobs))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(seconds * 1000 for _, seconds in results)
+    errors = sum(1 for status, _ in results if status >= 400)
+    return {
+        "scenario": name,
+        "requests": len(results),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(results) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обеденного пика")
+    parser.add_argument("--students", type=int, default=500, help="число учеников в синтетической школе")
+    parser.add_argument("--term-days", type=int, default=45, help="учебных дней заказов в истории")
+    parser.add_argument("--logins", type=int, default=200, help="сколько учеников входят в 08:00")
+    parser.add_argument("--polls", type=int, default=5, help="опросов уведомлений на ученика")
+    parser.add_argument("--collect", type=int, default=300, help="сколько заказов выдаёт повар")
+    parser.add_argument("--reports", type=int, default=5, help="сколько раз открыть отчёт за четверть")
+    parser.add_argument("--concurrency", type=int, default=16, help="одновременных клиентов")
+    parser.add_argument("--seed", type=int, default=2026, help="зерно генератора (для воспроизводимости)")
+    parser.add_argument("--json", help="сохранить результат в JSON-файл")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="lunch_rush_")
+    app = load_app(os.path.join(workdir, "bench.db"))
+
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    from database import db
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    with app.app_context():
+        counter = SqlCounter(app, db.engine)
+
+    seed_started = time.perf_counter()
+    today_orders = seed(app, args.students, args.term_days, rng)
+    print(f"Подготовка базы: {time.perf_counter() - seed_started:.1f} с")
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    students = [Client(base_url) for _ in range(min(args.logins, args.students))]
+    emails = rng.sample(range(args.students), len(students))
+    cook, admin = Client(base_url), Client(base_url)
+    cook.request("POST", "/login", {"email": "cook@bench.local", "password": PASSWORD})
+    admin.request("POST", "/login", {"email": "admin@bench.local", "password": PASSWORD})
+
+    def login_and_open(client, number):
+        def job():
+            status, first = client.request("POST", "/login", {"email": f"student{number}@bench.local", "password": PASSWORD})
+            if status >= 400:
+                return status, first
+            status, second = client.request("GET", "/student")
+            return status, first + second
+        return job
+
+    term_start = school_days(date.today() - timedelta(days=1), args.term_days)[0]
+    results = []
+    results.append(run_scenario(
+        "08:00 вход + /student",
+        [login_and_open(client, number) for client, number in zip(students, emails)],
+        args.concurrency))
+    results.append(run_scenario(
+        "опрос /api/notifications/count",
+        [lambda c=client: c.request("GET", "/api/notifications/count") for client in students for _ in range(args.polls)],
+        args.concurrency))
+    results.append(run_scenario(
+        "оплата /pay",
+        [lambda c=client: c.request("POST", "/pay", {"type": "single", "day": rng.choice(WEEKDAYS), "meal_type": "breakfast"})
+         for client in students],
+        args.concurrency))
+    results.append(run_scenario(
+        "выдача /cook/mark_collected",
+        [lambda order_id=order_id: cook.request("POST", "/cook/mark_collected", {"order_id": order_id})
+         for order_id in today_orders[:args.collect]],
+        min(args.concurrency, 4)))
+    results.append(run_scenario(
+        "/admin/reports за четверть",
+        [lambda: admin.request("GET", f"/admin/reports?start_date={term_start}&end_date={date.today()}")
+         for _ in range(args.reports)],
+        2))
+
+    server.shutdown()
+
+    print()
+    print(f"{'сценарий':36} {'запросов':>8} {'ошибок':>7} {'rps':>8} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8}")
+    for item in results:
+        print(f"{item['scenario']:36} {item['requests']:8} {item['errors']:7} {item['rps']:8} "
+              f"{item['p50_ms']:8} {item['p95_ms']:8} {item['p99_ms']:8}")
+
+    routes = []
+    print()
+    print(f"{'маршрут':44} {'запросов':>8} {'SQL ср.':>8} {'SQL макс':>8} {'SQL мс ср.':>10}")
+    for route, item in sorted(counter.stats.items(), key=lambda kv: -kv[1]["queries"] / max(1, kv[1]["requests"])):
+        avg_queries = item["queries"] / item["requests"]
+        avg_sql_ms = item["sql_ms"] / item["requests"]
+        routes.append({"route": route, "requests": item["requests"], "avg_queries": round(avg_queries, 1),
+                       "max_queries": item["max_queries"], "avg_sql_ms": round(avg_sql_ms, 2)})
+        print(f"{route:44} {item['requests']:8} {avg_queries:8.1f} {item['max_queries']:8} {avg_sql_ms:10.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "scenarios": results, "routes": routes}, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультат сохранён в {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/password_hash.py
+"""Подбор стоимости хэша паролей (PASSWORD_HASH_METHOD) и размера пула.
+
+Для каждого алгоритма измеряет время одной проверки пароля и пропускную
+способность пула потоков на пачке одновременных входов — столько входов
+в секунду выдержит сервер, не отбирая у остальных запросов больше ядер,
+чем PASSWORD_HASH_POOL_SIZE.
+
+Запуск из корня репозитория:
+    python benchmarks/password_hash.py
+    python benchmarks/password_hash.py --methods scrypt:32768:8:1 pbkdf2:sha256:600000 --pool-sizes 1 2 4
+    PASSWORD_HASH_METHOD=scrypt:16384:8:1 python app.py   # применить выбранный алгоритм
+"""
+
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHODS = [
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",  # по умолчанию в werkzeug и в приложении
+    "pbkdf2:sha256:600000",
+    "pbkdf2:sha256:1000000",
+]
+PASSWORD = "Bench-Passw0rd!"
+
+
+def measure_single(pwhash, samples):
+    """Медиана времени одной проверки, мс"""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        check_password_hash(pwhash, PASSWORD)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def measure_burst(pwhash, pool_size, burst):
+    """Сколько проверок в секунду выдерживает пул на пачке из burst входов"""
+    with ThreadPoolExecutor(max_workers=pool_size) as pool:
+        started = time.perf_counter()
+        list(pool.map(lambda _: check_password_hash(pwhash, PASSWORD), range(burst)))
+        elapsed = time.perf_counter() - started
+    return burst / elapsed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость хэша паролей и пропускная способность входа")
+    parser.add_argument("--methods", nargs="+", default=DEFAULT_METHODS, help="алгоритмы в формате werkzeug")
+    parser.add_argument("--pool-sizes", nargs="+", type=int,
+                        default=sorted({1, max(1, (os.cpu_count() or 2) // 2), os.cpu_count() or 2}),
+                        help="размеры пула для проверки")
+    parser.add_argument("--burst", type=int, default=30, help="одновременных входов (класс целиком)")
+    parser.add_argument("--samples", type=int, default=5, help="замеров одной проверки")
+    parser.add_argument("--target-ms", type=float, default=250, help="допустимое время одной проверки")
+    args = parser.parse_args()
+
+    print(f"Ядер: {os.cpu_count()}, пачка входов: {args.burst}")
+    print(f"{'алгоритм':24} {'мс/вход':>8} " + " ".join(f"{'пул ' + str(n) + ', вх/с':>14}" for n in args.pool_sizes)
+          + f" {'класс за, с':>12}")
+
+    suitable = []
+    for method in args.methods:
+        pwhash = generate_password_hash(PASSWORD, method=method)
+        single_ms = measure_single(pwhash, args.samples)
+        bursts = [measure_burst(pwhash, size, args.burst) for size in args.pool_sizes]
+        print(f"{method:24} {single_ms:8.1f} " + " ".join(f"{rate:14.1f}" for rate, _ in bursts)
+              + f" {bursts[-1][1]:12.2f}")
+        if single_ms <= args.target_ms:
+            suitable.append((single_ms, method))
+
+    print()
+    if suitable:
+        # Самый дорогой алгоритм, ещё укладывающийся в допустимое время входа
+        print(f"Рекомендуется: PASSWORD_HASH_METHOD={max(suitable)[1]} (≤ {args.target_ms:g} мс на вход)")
+    else:
+        print(f"Ни один алгоритм не укладывается в {args.target_ms:g} мс — уменьшите стоимость или добавьте ядер")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# bulk_payments.py
+
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, bindparam
+
+from database import db
+from models import User, Meal, MealIngredient, Ingredient, Order
+from notification_queue import dispatcher
+from orders import insert_paid_orders
+from money import money_sum
+
+# Самый длинный период одной массовой оплаты, календарных дней
+MAX_BULK_DAYS = 31
+
+WEEKDAY_NAMES = ("monday", "tuesday", "wednesday", "thursday", "friday")
+MEAL_TYPE_NAMES = {"breakfast": "Завтрак", "lunch": "Обед"}
+
+
+class BulkPaymentError(ValueError):
+    """Массовую оплату нельзя провести с такими параметрами"""
+
+
+def select_students(student_ids=None, class_name=None):
+    """Активные ученики класса или из списка id: [(id, ФИО, баланс)] одним запросом"""
+    condition = [User.role == "student", User.is_active == True]
+    if class_name is not None:
+        condition.append(User.class_name == class_name)
+    elif student_ids is not None:
+        condition.append(User.id.in_(student_ids))
+    else:
+        raise BulkPaymentError("Выберите класс или учеников")
+    return db.session.execute(
+        select(User.id, User.full_name, User.balance).where(*condition).order_by(User.full_name)
+    ).all()
+
+
+def change_balances(deltas):
+    """Меняет балансы на разные суммы одним executemany (относительно, без гонки с оплатами)"""
+    users = User.__table__
+    db.session.execute(
+        update(users).where(users.c.id == bindparam("student_id"))
+        .values(balance=users.c.balance + bindparam("delta")),
+        [{"student_id": student_id, "delta": delta} for student_id, delta in deltas.items()]
+    )
+
+
+def bulk_top_up(students, amount):
+    """Пополняет баланс всех учеников на amount. Коммит — за вызывающим.
+
+    Уведомления пишутся той же транзакцией одной пачкой.
+    """
+    if not amount or amount <= 0:
+        raise BulkPaymentError("Неверная сумма для пополнения")
+
+    change_balances({student_id: amount for student_id, _, _ in students})
+    dispatcher.submit_many(({
+        'user_id': student_id,
+        'title': "💰 Баланс пополнен",
+        'message': f"Администратор пополнил ваш баланс на {amount:.2f} ₽. "
+                   f"Было: {balance:.2f} ₽, стало: {balance + amount:.2f} ₽",
+        'type': "success"
+    } for student_id, _, balance in students), in_transaction=True)
+    return amount * len(students)
+
+
+def serving_days(date_from, date_to):
+    """Будние дни периода"""
+    if date_to < date_from:
+        raise BulkPaymentError("Дата окончания раньше даты начала")
+    if (date_to - date_from).days >= MAX_BULK_DAYS:
+        raise BulkPaymentError(f"Период массовой оплаты — не больше {MAX_BULK_DAYS} дней")
+    days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    return [day for day in days if day.weekday() < 5]
+
+
+def load_menu(meal_types):
+    """Меню и рецепты на нужные приёмы пищи: {(день недели, приём): (блюдо, JSON ингредиентов)}"""
+    meals = {}
+    for meal in Meal.query.filter(Meal.meal_type.in_(meal_types)).order_by(Meal.id):
+        # Как в разовой оплате: берётся первое блюдо дня
+        meals.setdefault((meal.day_of_week, meal.meal_type), meal)
+
+    ingredients = {}
+    rows = db.session.execute(
+        select(MealIngredient.meal_id, Ingredient.name, MealIngredient.quantity, MealIngredient.unit)
+        .join(Ingredient, Ingredient.id == MealIngredient.ingredient_id)
+        .where(MealIngredient.meal_id.in_([meal.id for meal in meals.values()]))
+        .order_by(MealIngredient.id)
+    )
+    for meal_id, name, quantity, unit in rows:
+        ingredients.setdefault(meal_id, []).append({"name": name, "qty": quantity, "unit": unit})
+
+    return {key: (meal, json.dumps(ingredients.get(meal.id, []), ensure_ascii=False))
+            for key, meal in meals.items()}
+
+
+def bulk_assign_meals(students, days, meal_types, charge=True):
+    """Оплачивает ученикам приёмы пищи на будние дни периода. Коммит — за вызывающим.
+
+    Меню и уже оплаченные заказы загружаются один раз на всю пачку, заказы
+    вставляются одним INSERT, балансы меняются одним executemany. Уже
+    оплаченные приёмы пропускаются. При charge=True ученик, которому не
+    хватает на все свои приёмы, пропускается целиком; при charge=False
+    (льготное питание) баланс не списывается, а заказы сохраняются с
+    источником "subsidy" и нулевой ценой — при отмене деньги за них не
+    возвращаются, в выручку они не входят.
+
+    Возвращает (число заказов, списанная сумма, ученики без средств [(ФИО, нужно, есть)]).
+    """
+    if not days:
+        raise BulkPaymentError("В периоде нет учебных дней")
+    meal_types = [meal_type for meal_type in meal_types if meal_type in MEAL_TYPE_NAMES]
+    if not meal_types:
+        raise BulkPaymentError("Выберите приёмы пищи")
+
+    menu = load_menu(meal_types)
+    slots = [(day, meal_type) for day in days for meal_type in meal_types
+             if (WEEKDAY_NAMES[day.weekday()], meal_type) in menu]
+    if not slots:
+        raise BulkPaymentError("На выбранные дни нет меню")
+
+    student_ids = [student_id for student_id, _, _ in students]
+    paid = set(db.session.execute(
+        select(Order.student_id, Order.serving_date, Order.meal_type).where(
+            Order.student_id.in_(student_ids),
+            Order.serving_date >= days[0],
+            Order.serving_date <= days[-1],
+            Order.meal_type.in_(meal_types),
+            Order.status == "paid"
+        )
+    ).tuples())
+
+    now = datetime.utcnow()
+    orders, short = [], []
+    for student_id, full_name, balance in students:
+        missing = [(day, meal_type) for day, meal_type in slots if (student_id, day, meal_type) not in paid]
+        if not missing:
+            continue
+        cost = money_sum(menu[(WEEKDAY_NAMES[day.weekday()], meal_type)][0].price for day, meal_type in missing)
+        if charge and balance < cost:
+            short.append((full_name, cost, balance))
+            continue
+
+        for day, meal_type in missing:
+            meal, ingredients = menu[(WEEKDAY_NAMES[day.weekday()], meal_type)]
+            orders.append({
+                "student_id": student_id,
+                "day_of_week": meal.day_of_week,
+                "meal_type": meal_type,
+                "serving_date": day,
+                "paid_at": now,
+                "meal_name": meal.name,
+                "meal_price": meal.price if charge else 0.0,
+                "meal_ingredients": ingredients,
+                "payment_source": "single" if charge else "subsidy"
+            })
+
+    # Приёмы, оплаченные параллельно после загрузки, пропускает уникальный индекс:
+    # списание и уведомления — только по действительно созданным заказам
+    inserted = insert_paid_orders(orders)
+    created = defaultdict(list)
+    for row in inserted:
+        created[row.student_id].append(row)
+
+    if charge and created:
+        change_balances({student_id: -money_sum(row.meal_price for row in rows)
+                         for student_id, rows in created.items()})
+
+    notifications = []
+    for student_id, rows in created.items():
+        dates = [row.serving_date for row in rows]
+        notifications.append({
+            'user_id': student_id,
+            'title': "✅ Питание оплачено администратором",
+            'message': f"Оплачено приёмов пищи: {len(rows)} с {min(dates).strftime('%d.%m.%Y')} "
+                       f"по {max(dates).strftime('%d.%m.%Y')}. "
+                       + (f"Списано с баланса: {money_sum(row.meal_price for row in rows):.2f} ₽" if charge
+                          else "За счёт программы льготного питания"),
+            'type': "success"
+        })
+    dispatcher.submit_many(notifications, in_transaction=True)
+
+    return len(inserted), money_sum(row.meal_price for row in inserted), short
@@ -0,0 +1,137 @@
+# cancellations.py
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, bindparam
+
+from bulk_payments import change_balances
+from database import db
+from money import money_sum
+from models import User, Order, FlexibleSubscription, DeletionLog
+from notification_queue import dispatcher
+from reports import invalidate_daily_reports_range
+import order_weeks
+
+# Самый длинный период одной массовой отмены, календарных дней
+MAX_CANCEL_DAYS = 31
+
+# user_id итоговой записи журнала: запись не относится к одному пользователю,
+# а id пользователей начинаются с 1 — в архиве учеников она ни к кому не привяжется
+NO_USER_ID = 0
+
+
+class CancellationError(ValueError):
+    """Массовую отмену нельзя провести с такими параметрами"""
+
+
+def cancel_days(admin, date_from, date_to, reason, class_name=None):
+    """Отменяет все оплаченные и не выданные заказы на даты периода. Коммит — за вызывающим.
+
+    Всё делается несколькими запросами на весь период, а не на заказ:
+    заказы отменяются одним UPDATE ... RETURNING, суммы возврата считаются
+    по строкам, которые он действительно изменил (заказ, выданный в это
+    время, не отменяется и не возвращается), балансы и гибкие абонементы
+    меняются executemany. Возвращённая за заказы абонемента сумма
+    вычитается из его total_price — при последующей отмене абонемента она
+    не вернётся второй раз. В журнал пишется одна итоговая запись, каждый
+    ученик получает одно уведомление.
+
+    Возвращает (число заказов, id учеников с возвратом, сумма возврата).
+    """
+    if date_to < date_from:
+        raise CancellationError("Дата окончания раньше даты начала")
+    if (date_to - date_from).days >= MAX_CANCEL_DAYS:
+        raise CancellationError(f"Период отмены — не больше {MAX_CANCEL_DAYS} дней")
+
+    condition = [
+        Order.status == "paid",
+        Order.is_collected == False,
+        Order.serving_date >= date_from,
+        Order.serving_date <= date_to
+    ]
+    if class_name is not None:
+        condition.append(Order.student_id.in_(select(User.id).where(User.class_name == class_name)))
+
+    cancelled = db.session.execute(
+        update(Order).where(*condition).values(status="cancelled")
+        .returning(Order.student_id, Order.serving_date, Order.meal_type, Order.payment_source, Order.meal_price)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not cancelled:
+        return 0, [], 0.0
+
+    refunds = defaultdict(float)
+    orders_count = defaultdict(int)
+    flexible = defaultdict(lambda: [0, 0.0])
+    for student_id, serving_date, _, source, amount in cancelled:
+        refunds[student_id] += amount or 0.0
+        orders_count[student_id] += 1
+        if source == "flexible":
+            flexible[(student_id, serving_date)][0] += 1
+            flexible[(student_id, serving_date)][1] += amount or 0.0
+
+    if flexible:
+        _reduce_subscriptions([(student_id, serving_date, count, amount)
+                               for (student_id, serving_date), (count, amount) in flexible.items()],
+                              date_from, date_to)
+
+    order_weeks.clear((student_id, serving_date, meal_type) for student_id, serving_date, meal_type, _, _ in cancelled)
+    change_balances(refunds)
+    invalidate_daily_reports_range(date_from, date_to)
+
+    total = money_sum(refunds.values())
+    period = date_from.strftime('%d.%m.%Y') if date_from == date_to \
+        else f"{date_from.strftime('%d.%m.%Y')}–{date_to.strftime('%d.%m.%Y')}"
+    scope = f"класс {class_name}" if class_name else "вся школа"
+    db.session.add(DeletionLog(
+        user_id=NO_USER_ID,
+        user_email="—",
+        user_full_name=f"Массовая отмена питания ({scope})",
+        deleted_by_admin_id=admin.id,
+        deleted_by_admin_email=admin.email,
+        refund_amount=total,
+        reason=f"Массовая отмена питания {period} ({scope}): {reason}. Отменено заказов: "
+               f"{sum(orders_count.values())}, учеников: {len(refunds)}. Возвращено {total:.2f} ₽."
+    ))
+
+    dispatcher.submit_many(({
+        'user_id': student_id,
+        'title': "💰 Питание отменено",
+        'message': f"Питание на {period} отменено: {reason}. Отменено приёмов: {orders_count[student_id]}. "
+                   f"Возвращено {amount:.2f} ₽ на ваш баланс.",
+        'type': "info"
+    } for student_id, amount in refunds.items()), in_transaction=True)
+
+    return sum(orders_count.values()), list(refunds), total
+
+
+def _reduce_subscriptions(flexible, date_from, date_to):
+    """Уменьшает сумму и число приёмов активных абонементов на отменённые заказы"""
+    subscriptions = defaultdict(list)
+    for subscription in FlexibleSubscription.query.filter(
+        FlexibleSubscription.student_id.in_({student_id for student_id, _, _, _ in flexible}),
+        FlexibleSubscription.is_active == True,
+        FlexibleSubscription.start_date < datetime.combine(date_to + timedelta(days=1), datetime.min.time()),
+        FlexibleSubscription.expires_at >= datetime.combine(date_from, datetime.min.time())
+    ):
+        subscriptions[subscription.student_id].append(subscription)
+
+    changes = defaultdict(lambda: [0.0, 0])
+    for student_id, serving_date, count, amount in flexible:
+        for subscription in subscriptions[student_id]:
+            if subscription.start_date.date() <= serving_date <= subscription.expires_at.date():
+                changes[subscription.id][0] += amount
+                changes[subscription.id][1] += count
+                break
+
+    if changes:
+        table = FlexibleSubscription.__table__
+        db.session.execute(
+            update(table).where(table.c.id == bindparam("subscription_id")).values(
+                total_price=table.c.total_price - bindparam("amount"),
+                total_meals=table.c.total_meals - bindparam("meals")
+            ),
+            [{"subscription_id": subscription_id, "amount": amount, "meals": meals}
+             for subscription_id, (amount, meals) in changes.items()]
+        )
@@ -1,3 +1,38 @@
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, String
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import GenericFunction
+
+db = SQLAlchemy()
+
+
+class casefold(GenericFunction):
+    """Строка без учёта регистра для поиска: casefold(User.full_name).contains(text.casefold()).
+
+    lower() и ILIKE в SQLite меняют регистр только у латиницы («Иванов» не
+    найдётся по «иван»), поэтому в SQLite вызывается функция Python
+    str.casefold, в остальных базах — обычный lower().
+    """
+    type = String()
+    inherit_cache = True
+
+
+@compiles(casefold)
+def _casefold_default(element, compiler, **kw):
+    return f"lower({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(casefold, "sqlite")
+def _casefold_sqlite(element, compiler, **kw):
+    return f"casefold({compiler.process(element.clauses, **kw)})"
+
 
-db = SQLAlchemy()
\ No newline at end of file
+@event.listens_for(Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function(
+            "casefold", 1, lambda value: value.casefold() if isinstance(value, str) else value, deterministic=True
+        )
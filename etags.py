@@ -0,0 +1,118 @@
+# etags.py
+
+import os
+import threading
+from datetime import datetime
+from functools import wraps
+
+from flask import make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import db
+from menu_cache import menu_version
+
+# Меняется при каждом запуске: счётчики ниже живут только в памяти процесса,
+# и ETag прошлого запуска не должен совпасть со свежим
+BOOT_NONCE = os.urandom(4).hex()
+
+_lock = threading.Lock()
+_versions = {}  # ("user"|"role"|"sub", ключ) -> номер версии
+_roles = {}     # user_id -> роль, запоминается при первом полном ответе
+
+
+def _version(kind, key):
+    return _versions.get((kind, key), 0)
+
+
+def bump_notifications(user_ids=(), roles=()):
+    """Уведомления пользователей (или целых ролей) изменились — вызывать после коммита"""
+    with _lock:
+        for user_id in user_ids:
+            _versions[("user", int(user_id))] = _version("user", int(user_id)) + 1
+        for role in roles:
+            _versions[("role", role)] = _version("role", role) + 1
+
+
+def bump_subscription(user_id):
+    """Абонемент ученика изменился — вызывать после коммита"""
+    with _lock:
+        _versions[("sub", int(user_id))] = _version("sub", int(user_id)) + 1
+
+
+def bump_notifications_after_commit(user_ids=(), roles=()):
+    """То же, что bump_notifications, но откладывает сброс до коммита текущей сессии"""
+    pending = db.session.info.setdefault("etag_bumps", {"user_ids": set(), "roles": set()})
+    pending["user_ids"].update(user_ids)
+    pending["roles"].update(roles)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_bumps(db_session):
+    pending = db_session.info.pop("etag_bumps", None)
+    if pending:
+        bump_notifications(pending["user_ids"], pending["roles"])
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_bumps(db_session):
+    db_session.info.pop("etag_bumps", None)
+
+
+# === ФУНКЦИИ ETAG ===
+# Получают id пользователя из подписанной cookie сессии и роль, известную
+# по предыдущим ответам; None — ETag пока не построить, отдаём полный ответ.
+
+def notifications_etag(user_id, role):
+    return f"n-{BOOT_NONCE}-{_version('user', user_id)}-{_version('role', role)}"
+
+
+def subscription_etag(user_id, role):
+    if role != "student":
+        return None
+    # Абонемент истекает по дате, поэтому дата входит в ключ
+    return f"s-{BOOT_NONCE}-{_version('sub', user_id)}-{datetime.utcnow().date().isoformat()}"
+
+
+def menu_etag(user_id, role):
+    if role != "admin":
+        return None
+    return f"m-{BOOT_NONCE}-{menu_version()}"
+
+
+def conditional(etag_for):
+    """Условный GET: при совпадении If-None-Match отвечает 304 до обращения к базе.
+
+    Ставится над login_required: пользователь берётся из сессии без загрузки
+    из базы. Версии хранятся в памяти процесса, поэтому рассчитано на один
+    процесс приложения (как при запуске через app.run).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = None
+            user_id = session.get("_user_id")
+            if user_id is not None:
+                user_id = int(user_id)
+                role = _roles.get(user_id)
+                if role is not None:
+                    etag = etag_for(user_id, role)
+                    if etag and request.if_none_match.contains(etag):
+                        response = make_response("", 304)
+                        response.set_etag(etag)
+                        response.headers["Cache-Control"] = "private, no-cache"
+                        return response
+
+            response = make_response(view(*args, **kwargs))
+
+            if current_user.is_authenticated:
+                _roles[current_user.id] = current_user.role
+            # ETag считаем до вызова обработчика: если данные поменялись во время
+            # запроса, клиент просто получит их заново при следующем опросе
+            if etag and response.status_code == 200:
+                response.set_etag(etag)
+                response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,210 @@
+# exports.py
+
+import csv
+import io
+from collections import defaultdict
+from datetime import timedelta
+from urllib.parse import quote
+
+from flask import Response, stream_with_context
+
+from database import db
+from models import Order, User, WriteOff, Ingredient, PurchaseRequest
+from money import money_sum
+from reports import get_daily_stats
+
+# Сколько строк читать из базы за раз и сколько отдавать клиенту одним куском
+CHUNK_SIZE = 1000
+
+MEAL_NAMES_RU = {"breakfast": "Завтрак", "lunch": "Обед"}
+STATUS_NAMES_RU = {"paid": "Оплачен", "cancelled": "Отменён"}
+SOURCE_NAMES_RU = {"single": "Разовая", "flexible": "Гибкий абонемент", "subsidy": "Льготное питание"}
+
+
+def csv_response(filename, header, rows):
+    """Потоковый CSV-ответ: строки пишутся кусками по мере чтения из базы.
+
+    BOM в начале — чтобы Excel сразу открыл файл в UTF-8.
+    """
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        def take():
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return chunk
+
+        # Заголовок уходит сразу — загрузка начинается до первого запроса к базе
+        buffer.write('\ufeff')
+        writer.writerow(header)
+        yield take()
+
+        for i, row in enumerate(rows, start=1):
+            writer.writerow(row)
+            if i % CHUNK_SIZE == 0:
+                yield take()
+
+        yield take()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/csv; charset=utf-8",
+        headers={
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+            "Cache-Control": "no-store"
+        }
+    )
+
+
+def _money(value):
+    return f"{value or 0:.2f}"
+
+
+def _qty(value):
+    return f"{value or 0:.1f}"
+
+
+# === РАЗДЕЛЫ ОТЧЁТА ===
+
+def revenue_rows(start_date, end_date):
+    """Выручка и посещаемость по дням периода"""
+    for serving_date, day in get_daily_stats(start_date, end_date).items():
+        yield [
+            serving_date.strftime("%d.%m.%Y"),
+            day["paid"]["breakfast"],
+            day["paid"]["lunch"],
+            _money(day["revenue"]["breakfast"]),
+            _money(day["revenue"]["lunch"]),
+            _money(money_sum((day["revenue"]["breakfast"], day["revenue"]["lunch"]))),
+            day["attended"]["breakfast"],
+            day["attended"]["lunch"]
+        ]
+
+
+REVENUE_HEADER = ["Дата", "Оплачено завтраков", "Оплачено обедов", "Выручка: завтраки, ₽",
+                  "Выручка: обеды, ₽", "Выручка: всего, ₽", "Выдано завтраков", "Выдано обедов"]
+
+
+def plan_vs_fact_rows(start_date, end_date):
+    """План и факт расхода ингредиентов за период"""
+    prices = dict(db.session.query(Ingredient.name, Ingredient.price_per_unit).all())
+    totals = defaultdict(lambda: {"unit": "г", "plan": 0.0, "fact": 0.0})
+    for day in get_daily_stats(start_date, end_date).values():
+        for name, item in day["usage"].items():
+            totals[name]["unit"] = item["unit"]
+            totals[name]["plan"] += item["plan"]
+            totals[name]["fact"] += item["fact"]
+
+    for name in sorted(totals):
+        item = totals[name]
+        price = prices.get(name) or 0.0
+        yield [
+            name,
+            item["unit"],
+            _qty(item["plan"]),
+            _qty(item["fact"]),
+            _qty(item["fact"] - item["plan"]),
+            _money(item["plan"] * price),
+            _money(item["fact"] * price),
+            _money((item["fact"] - item["plan"]) * price)
+        ]
+
+
+PLAN_VS_FACT_HEADER = ["Продукт", "Ед.", "План", "Факт", "Отклонение",
+                       "План, ₽", "Факт, ₽", "Отклонение, ₽"]
+
+
+def write_off_rows(start_date, end_date):
+    """Ручные списания за период"""
+    query = db.session.query(
+        WriteOff.created_at, Ingredient.name, WriteOff.quantity, WriteOff.unit,
+        WriteOff.reason, User.full_name, Ingredient.price_per_unit
+    ).join(Ingredient, Ingredient.id == WriteOff.ingredient_id) \
+        .outerjoin(User, User.id == WriteOff.cook_id) \
+        .filter(WriteOff.created_at >= start_date,
+                WriteOff.created_at < end_date + timedelta(days=1)) \
+        .order_by(WriteOff.created_at.desc()) \
+        .yield_per(CHUNK_SIZE)
+
+    for created_at, name, quantity, unit, reason, cook_name, price in query:
+        yield [
+            created_at.strftime("%d.%m.%Y %H:%M"),
+            name,
+            _qty(quantity),
+            unit,
+            reason,
+            cook_name or "—",
+            _money((quantity or 0) * (price or 0))
+        ]
+
+
+WRITE_OFF_HEADER = ["Дата", "Продукт", "Количество", "Ед.", "Причина", "Повар", "Стоимость, ₽"]
+
+
+def purchase_rows(start_date, end_date):
+    """Заявки на закупку за период"""
+    prices = dict(db.session.query(Ingredient.name, Ingredient.price_per_unit).all())
+    query = db.session.query(
+        PurchaseRequest.timestamp, PurchaseRequest.product, PurchaseRequest.quantity,
+        PurchaseRequest.unit, PurchaseRequest.status, User.full_name
+    ).outerjoin(User, User.id == PurchaseRequest.cook_id) \
+        .filter(PurchaseRequest.timestamp >= start_date,
+                PurchaseRequest.timestamp < end_date + timedelta(days=1)) \
+        .order_by(PurchaseRequest.timestamp.desc()) \
+        .yield_per(CHUNK_SIZE)
+
+    for timestamp, product, quantity, unit, status, cook_name in query:
+        price = prices.get((product or "").split(" (")[0]) or 0.0
+        yield [
+            timestamp.strftime("%d.%m.%Y %H:%M"),
+            product,
+            _qty(quantity),
+            unit,
+            status,
+            cook_name or "—",
+            _money((quantity or 0) * price)
+        ]
+
+
+PURCHASE_HEADER = ["Дата", "Продукт", "Количество", "Ед.", "Статус", "Повар", "Стоимость, ₽"]
+
+
+REPORT_SECTIONS = {
+    "revenue": ("Выручка_по_дням", REVENUE_HEADER, revenue_rows),
+    "plan_vs_fact": ("План_vs_факт", PLAN_VS_FACT_HEADER, plan_vs_fact_rows),
+    "write_offs": ("Списания", WRITE_OFF_HEADER, write_off_rows),
+    "purchases": ("Закупки", PURCHASE_HEADER, purchase_rows),
+}
+
+
+# === ЖУРНАЛ ОПЛАТ ===
+
+def payment_rows():
+    """Все оплаты и отмены (разовые и по абонементу), новые сверху"""
+    query = db.session.query(
+        Order.id, Order.paid_at, User.full_name, User.class_name, Order.serving_date,
+        Order.meal_type, Order.meal_name, Order.meal_price, Order.payment_source, Order.status
+    ).outerjoin(User, User.id == Order.student_id) \
+        .filter(Order.status.in_(["paid", "cancelled"])) \
+        .order_by(Order.paid_at.desc(), Order.id.desc()) \
+        .yield_per(CHUNK_SIZE)
+
+    for (order_id, paid_at, full_name, class_name, serving_date, meal_type,
+         meal_name, meal_price, source, status) in query:
+        yield [
+            order_id,
+            paid_at.strftime("%d.%m.%Y %H:%M") if paid_at else "—",
+            full_name or "—",
+            class_name or "—",
+            serving_date.strftime("%d.%m.%Y") if serving_date else "—",
+            MEAL_NAMES_RU.get(meal_type, meal_type),
+            meal_name or "—",
+            _money(meal_price),
+            SOURCE_NAMES_RU.get(source, source),
+            STATUS_NAMES_RU.get(status, status)
+        ]
+
+
+PAYMENT_HEADER = ["№ заказа", "Дата оплаты", "Ученик", "Класс", "Дата питания", "Приём",
+                  "Блюдо", "Стоимость, ₽", "Источник", "Статус"]
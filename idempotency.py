@@ -0,0 +1,186 @@
+# idempotency.py
+
+import hashlib
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, flash, jsonify, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import db
+from models import IdempotencyKey
+
+KEY_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+FORM_FIELD = "idempotency_key"
+HEADER = "Idempotency-Key"
+
+# Тело ответа длиннее не сохраняем — повтор вернёт только статус и Location
+MAX_STORED_BODY = 64 * 1024
+
+
+class Idempotency:
+    """Повтор POST-запроса с тем же ключом не выполняет обработчик второй раз.
+
+    Ключ приходит в заголовке Idempotency-Key (fetch) или в скрытом поле
+    формы idempotency_key, которое шаблон заполняет через idempotency_key().
+    Первый запрос занимает ключ в таблице idempotency_keys, ответ (статус,
+    Location, тело, сообщения flash) сохраняется после обработчика. Повтор
+    — двойное нажатие или переотправка на медленной связи — получает
+    сохранённый ответ; если первый ещё выполняется, повтор ждёт его
+    не дольше IDEMPOTENCY_WAIT_SECONDS. Ключи живут IDEMPOTENCY_TTL_HOURS.
+    """
+
+    def __init__(self):
+        self.app = None
+
+    def init_app(self, app):
+        app.config.setdefault('IDEMPOTENCY_TTL_HOURS', 24)
+        app.config.setdefault('IDEMPOTENCY_WAIT_SECONDS', 10)
+        self.app = app
+        app.add_template_global(new_idempotency_key, 'idempotency_key')
+        app.extensions['idempotency'] = self
+
+
+def new_idempotency_key():
+    """Свежий ключ для скрытого поля формы (новый при каждой отрисовке страницы)"""
+    return uuid.uuid4().hex
+
+
+def _request_hash():
+    """Отпечаток запроса без самого ключа: тот же ключ с другими данными — ошибка клиента"""
+    digest = hashlib.sha256(request.path.encode())
+    for name in sorted(request.form):
+        if name != FORM_FIELD:
+            for value in request.form.getlist(name):
+                digest.update(f"\0{name}={value}".encode())
+    if request.is_json:
+        digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _claim(endpoint, key, request_hash):
+    """Занимает ключ; возвращает True, если этот запрос — первый"""
+    ttl = timedelta(hours=current_app.config['IDEMPOTENCY_TTL_HOURS'])
+    table = IdempotencyKey.__table__
+    # Просроченные ключи удаляются заодно (индекс по created_at)
+    db.session.execute(delete(table).where(table.c.created_at < datetime.utcnow() - ttl))
+
+    dialect = postgresql if db.session.get_bind().dialect.name == "postgresql" else sqlite
+    result = db.session.execute(dialect.insert(table).values(
+        user_id=current_user.id, endpoint=endpoint, key=key, request_hash=request_hash,
+        created_at=datetime.utcnow()
+    ).on_conflict_do_nothing())
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _stored(endpoint, key):
+    return db.session.execute(
+        select(IdempotencyKey).where(
+            IdempotencyKey.user_id == current_user.id,
+            IdempotencyKey.endpoint == endpoint,
+            IdempotencyKey.key == key
+        ).execution_options(populate_existing=True)
+    ).scalar_one_or_none()
+
+
+def _replay(record):
+    for category, message in record.flashes or []:
+        flash(message, category)
+    response = make_response(record.body or "", record.status_code)
+    if record.content_type:
+        response.content_type = record.content_type
+    if record.location:
+        response.headers["Location"] = record.location
+    response.headers["Idempotent-Replay"] = "true"
+    return response
+
+
+def _busy():
+    if request.is_json or request.accept_mimetypes.best == "application/json":
+        response = jsonify({"error": "Запрос уже выполняется, повторите позже"})
+    else:
+        response = make_response("Запрос уже выполняется, обновите страницу позже", 409)
+    response.status_code = 409
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+def idempotent(view):
+    """Декоратор POST-обработчика (ставится после login_required)"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER) or request.form.get(FORM_FIELD)
+        if not key:
+            return view(*args, **kwargs)
+        if not KEY_RE.match(key):
+            return make_response("Некорректный ключ идемпотентности", 400)
+
+        endpoint = request.endpoint
+        request_hash = _request_hash()
+
+        if not _claim(endpoint, key, request_hash):
+            # Повтор: ждём завершения первого запроса и отдаём его ответ
+            deadline = time.monotonic() + current_app.config['IDEMPOTENCY_WAIT_SECONDS']
+            while True:
+                record = _stored(endpoint, key)
+                if record is None:
+                    # Первый запрос завершился ошибкой и освободил ключ — выполняем заново
+                    if _claim(endpoint, key, request_hash):
+                        break
+                elif record.request_hash != request_hash:
+                    return make_response("Ключ идемпотентности уже использован с другими данными", 422)
+                elif record.status_code is not None:
+                    return _replay(record)
+                if time.monotonic() >= deadline:
+                    return _busy()
+                time.sleep(0.1)
+
+        flashes_before = len(session.get("_flashes", []))
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            _release(endpoint, key)
+            raise
+
+        if response.status_code >= 500:
+            # Ошибку сервера не запоминаем: повтор выполнит запрос заново
+            _release(endpoint, key)
+            return response
+
+        body = None
+        if not response.is_streamed and not response.location:
+            data = response.get_data(as_text=True)
+            body = data if len(data) <= MAX_STORED_BODY else None
+        table = IdempotencyKey.__table__
+        db.session.execute(update(table).where(
+            table.c.user_id == current_user.id, table.c.endpoint == endpoint, table.c.key == key
+        ).values(
+            status_code=response.status_code,
+            location=response.location,
+            content_type=response.content_type,
+            body=body,
+            flashes=[list(item) for item in session.get("_flashes", [])[flashes_before:]]
+        ))
+        db.session.commit()
+        return response
+
+    return wrapper
+
+
+def _release(endpoint, key):
+    table = IdempotencyKey.__table__
+    db.session.execute(delete(table).where(
+        table.c.user_id == current_user.id, table.c.endpoint == endpoint, table.c.key == key
+    ))
+    db.session.commit()
+
+
+idempotency = Idempotency()
@@ -0,0 +1,183 @@
+# instrumentation.py
+
+import heapq
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+
+class RequestInstrumentation:
+    """Счётчики SQL и времени по маршрутам.
+
+    На каждый запрос в g копятся: число SQL-запросов, их суммарное время,
+    число загруженных ORM-объектов и общее время обработки. После ответа
+    итоги складываются в агрегаты по endpoint. В режиме отладки итоги
+    запроса отдаются в заголовке X-Request-Stats; запросы дольше
+    SLOW_REQUEST_MS пишутся в лог вместе с самыми долгими SQL.
+
+    Накладные расходы — несколько сложений на запрос и на SQL, поэтому
+    инструментирование можно не выключать и в продакшене.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._slow = deque()
+
+    def init_app(self, app, db):
+        app.config.setdefault('INSTRUMENTATION_ENABLED', True)
+        app.config.setdefault('SLOW_REQUEST_MS', 500)
+        app.config.setdefault('SLOW_REQUEST_LOG_SIZE', 50)
+        app.config.setdefault('SLOW_REQUEST_STATEMENTS', 5)
+        self.app = app
+        app.extensions['instrumentation'] = self
+
+        if not app.config['INSTRUMENTATION_ENABLED']:
+            return
+
+        self._slow = deque(maxlen=app.config['SLOW_REQUEST_LOG_SIZE'])
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(db.engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(db.Model, "load", self._on_load, propagate=True)
+
+    # === ОБРАБОТЧИКИ СОБЫТИЙ ===
+
+    @staticmethod
+    def _start_request():
+        g.instr = {
+            "started": time.perf_counter(),
+            "queries": 0,
+            "sql": 0.0,
+            "rows": 0,
+            "statements": []  # куча (время, SQL) самых долгих запросов
+        }
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Время начала — на контексте выполнения, а не в стеке на соединении:
+        # у запроса с ошибкой after_cursor_execute не вызывается, и стек бы рос
+        if context is not None:
+            context._instr_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_instr_started", None)
+        if started is None:
+            return
+        if not has_request_context():
+            return  # фоновые потоки (очередь уведомлений) не относятся к запросу
+        stats = g.get("instr")
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - started
+        stats["queries"] += 1
+        stats["sql"] += elapsed
+        keep = self.app.config['SLOW_REQUEST_STATEMENTS']
+        if len(stats["statements"]) < keep:
+            heapq.heappush(stats["statements"], (elapsed, statement))
+        elif elapsed > stats["statements"][0][0]:
+            heapq.heapreplace(stats["statements"], (elapsed, statement))
+
+    @staticmethod
+    def _on_load(target, context):
+        if has_request_context():
+            stats = g.get("instr")
+            if stats is not None:
+                stats["rows"] += 1
+
+    def _finish_request(self, response):
+        stats = g.pop("instr", None)
+        if stats is None:
+            return response
+
+        wall = time.perf_counter() - stats["started"]
+        endpoint = request.endpoint or "<404>"
+
+        with self._lock:
+            item = self._endpoints.get(endpoint)
+            if item is None:
+                item = self._endpoints[endpoint] = {
+                    "requests": 0, "queries": 0, "max_queries": 0,
+                    "sql_seconds": 0.0, "rows": 0, "wall_seconds": 0.0, "max_wall_seconds": 0.0
+                }
+            item["requests"] += 1
+            item["queries"] += stats["queries"]
+            item["max_queries"] = max(item["max_queries"], stats["queries"])
+            item["sql_seconds"] += stats["sql"]
+            item["rows"] += stats["rows"]
+            item["wall_seconds"] += wall
+            item["max_wall_seconds"] = max(item["max_wall_seconds"], wall)
+
+        if self.app.debug:
+            response.headers["X-Request-Stats"] = (
+                f"queries={stats['queries']}; sql_ms={stats['sql'] * 1000:.1f}; "
+                f"rows={stats['rows']}; wall_ms={wall * 1000:.1f}"
+            )
+
+        if wall * 1000 >= self.app.config['SLOW_REQUEST_MS']:
+            self._log_slow(endpoint, wall, stats)
+
+        return response
+
+    def _log_slow(self, endpoint, wall, stats):
+        statements = [
+            {"ms": round(elapsed * 1000, 2), "sql": " ".join(statement.split())[:500]}
+            for elapsed, statement in sorted(stats["statements"], reverse=True)
+        ]
+        entry = {
+            "at": datetime.now().strftime("%d.%m.%Y %H:%M:%S"),
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "endpoint": endpoint,
+            "wall_ms": round(wall * 1000, 1),
+            "queries": stats["queries"],
+            "sql_ms": round(stats["sql"] * 1000, 1),
+            "rows": stats["rows"],
+            "statements": statements
+        }
+        self._slow.append(entry)
+
+        lines = [f"Медленный запрос {entry['method']} {entry['path']}: {entry['wall_ms']} мс, "
+                 f"SQL: {entry['queries']} шт. / {entry['sql_ms']} мс, объектов: {entry['rows']}"]
+        lines += [f"    {item['ms']} мс: {item['sql']}" for item in statements]
+        self.app.logger.warning("\n".join(lines))
+
+    # === ДЛЯ АДМИНИСТРАТОРА ===
+
+    def snapshot(self):
+        """Агрегаты по маршрутам и последние медленные запросы"""
+        with self._lock:
+            endpoints = {name: dict(item) for name, item in self._endpoints.items()}
+            slow = list(self._slow)
+
+        result = []
+        for name, item in endpoints.items():
+            n = item["requests"]
+            result.append({
+                "endpoint": name,
+                "requests": n,
+                "avg_queries": round(item["queries"] / n, 2),
+                "max_queries": item["max_queries"],
+                "avg_sql_ms": round(item["sql_seconds"] * 1000 / n, 2),
+                "avg_rows": round(item["rows"] / n, 1),
+                "avg_wall_ms": round(item["wall_seconds"] * 1000 / n, 2),
+                "max_wall_ms": round(item["max_wall_seconds"] * 1000, 2)
+            })
+        result.sort(key=lambda x: x["avg_queries"] * x["requests"], reverse=True)
+        return {"endpoints": result, "slow_requests": slow[::-1]}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._slow.clear()
+
+
+instrumentation = RequestInstrumentation()
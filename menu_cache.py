@@ -0,0 +1,107 @@
+# menu_cache.py
+
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from database import db
+from models import Meal, MealIngredient, Ingredient
+
+# Сколько отрендеренных фрагментов держать в памяти
+FRAGMENT_CACHE_SIZE = 512
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday"]
+
+_lock = threading.Lock()
+_menu_version = 1
+_menu = None  # (версия, меню)
+_fragments = OrderedDict()
+
+
+def menu_version():
+    """Версия меню: растёт при каждом сохранении меню или цен администратором"""
+    return _menu_version
+
+
+def bump_menu_version():
+    """Сбрасывает закэшированное меню и фрагменты шаблонов (вызывать после коммита)"""
+    global _menu_version, _menu
+    with _lock:
+        _menu_version += 1
+        _menu = None
+        _fragments.clear()
+
+
+def get_weekly_menu():
+    """Меню на неделю с составом блюд: {day: {meal_type: {...} или None}}.
+
+    Читается из базы двумя запросами один раз на версию меню.
+    Результат общий для всех запросов — не изменяйте его.
+    """
+    global _menu
+    cached = _menu
+    if cached is not None and cached[0] == _menu_version:
+        return cached[1]
+
+    version = _menu_version
+    menu = {day: {"breakfast": None, "lunch": None} for day in WEEKDAYS}
+    meals_by_id = {}
+    for meal in Meal.query.all():
+        if meal.day_of_week in menu and meal.meal_type in menu[meal.day_of_week]:
+            item = {"name": meal.name, "price": meal.price, "ingredients": []}
+            menu[meal.day_of_week][meal.meal_type] = item
+            meals_by_id[meal.id] = item
+
+    rows = db.session.query(MealIngredient.meal_id, Ingredient.name, MealIngredient.quantity, MealIngredient.unit) \
+        .join(Ingredient, Ingredient.id == MealIngredient.ingredient_id) \
+        .order_by(MealIngredient.id).all()
+    for meal_id, name, quantity, unit in rows:
+        item = meals_by_id.get(meal_id)
+        if item is not None:
+            item["ingredients"].append({"name": name, "quantity": quantity, "unit": unit})
+
+    with _lock:
+        if version == _menu_version:
+            _menu = (version, menu)
+    return menu
+
+
+class FragmentCacheExtension(Extension):
+    """Тег {% cache key1, key2, ... %}...{% endcache %} для неизменных частей страниц.
+
+    Отрендеренный HTML хранится в памяти процесса по ключу из аргументов тега.
+    В ключ нужно включать всё, от чего зависит фрагмент, — обычно menu_version().
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render_cached", [nodes.Tuple(args, "load")]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, key, caller):
+        with _lock:
+            html = _fragments.get(key)
+            if html is not None:
+                _fragments.move_to_end(key)
+                return html
+
+        html = caller()
+        with _lock:
+            _fragments[key] = html
+            while len(_fragments) > FRAGMENT_CACHE_SIZE:
+                _fragments.popitem(last=False)
+        return html
+
+
+def init_app(app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.add_template_global(menu_version)
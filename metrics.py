@@ -0,0 +1,274 @@
+# metrics.py
+
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Границы корзин гистограмм по умолчанию (секунды), как в клиентах Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+FANOUT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class _Shard:
+    """Значения метрик одного потока"""
+
+    __slots__ = ('values', '__weakref__')
+
+    def __init__(self):
+        self.values = {}
+
+
+class MetricsRegistry:
+    """Счётчики и гистограммы в текстовом формате Prometheus.
+
+    У каждого потока своя копия значений (шард): запись в неё идёт без
+    блокировок, потому что пишет в шард только поток-владелец. Блокировка
+    берётся один раз при появлении потока, при его завершении (значения
+    переносятся в общий итог) и при выдаче метрик. Выдача складывает копии
+    шардов и может на долю наблюдения отставать от пишущих потоков.
+    """
+
+    def __init__(self):
+        self.app = None
+        # RLock: перенос итогов умершего потока может случиться внутри collect()
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._metrics = []
+        self._live = {}     # id(values) -> values живых потоков
+        self._retired = {}  # значения завершившихся потоков
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(self, name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(self, name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def init_app(self, app, db):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_TOKEN', None)
+        self.app = app
+        app.extensions['metrics'] = self
+
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+        with app.app_context():
+            event.listen(db.engine, "handle_error", self._on_db_error)
+        event.listen(Session, "before_commit", self._before_commit)
+        event.listen(Session, "after_commit", self._after_commit)
+
+    # === ШАРДЫ ===
+
+    def _values(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._live[id(shard.values)] = shard.values
+            # Поток завершился — его локальные данные удалены, итог переносим в общий
+            weakref.finalize(shard, self._retire, shard.values)
+        return shard.values
+
+    def _retire(self, values):
+        with self._lock:
+            self._live.pop(id(values), None)
+            _merge(self._retired, values)
+
+    def collect(self):
+        """Сумма значений всех потоков: {(имя, значения меток): число или список}"""
+        with self._lock:
+            total = {}
+            _merge(total, self._retired)
+            for values in list(self._live.values()):
+                _merge(total, values.copy())
+        return total
+
+    def reset(self):
+        with self._lock:
+            self._retired.clear()
+            for values in self._live.values():
+                values.clear()
+
+    # === ОБРАБОТЧИКИ СОБЫТИЙ ===
+
+    @staticmethod
+    def _start_request():
+        g.metrics_started = time.perf_counter()
+
+    @staticmethod
+    def _finish_request(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            # Шаблон маршрута, а не путь: /api/menu/<day>/<meal_type> — одна серия
+            route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                         route=route, method=request.method)
+        return response
+
+    @staticmethod
+    def _before_commit(db_session):
+        db_session.info["metrics_commit_started"] = time.perf_counter()
+
+    @staticmethod
+    def _after_commit(db_session):
+        started = db_session.info.pop("metrics_commit_started", None)
+        if started is not None:
+            DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+    @staticmethod
+    def _on_db_error(context):
+        if "database is locked" in str(context.original_exception):
+            DB_LOCK_ERRORS.inc()
+
+    # === ВЫДАЧА ===
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        values = self.collect()
+        by_metric = {}
+        for (name, labels), value in values.items():
+            by_metric.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            series = sorted(by_metric.get(metric.name, []))
+            if not series and not metric.labelnames:
+                series = [((), metric.empty())]
+            for labels, value in series:
+                lines.extend(metric.expose(labels, value))
+        return "\n".join(lines) + "\n"
+
+
+class Counter:
+    """Монотонный счётчик"""
+
+    type = "counter"
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, amount=1, **labels):
+        values = self.registry._values()
+        key = (self.name, tuple(str(labels.get(label, "")) for label in self.labelnames))
+        values[key] = values.get(key, 0) + amount
+
+    @staticmethod
+    def empty():
+        return 0
+
+    def expose(self, labels, value):
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"]
+
+
+class Histogram:
+    """Гистограмма: число наблюдений по корзинам, их сумма и количество"""
+
+    type = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames, buckets):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        values = self.registry._values()
+        key = (self.name, tuple(str(labels.get(label, "")) for label in self.labelnames))
+        item = values.get(key)
+        if item is None:
+            item = values[key] = self.empty()
+        # Корзины хранятся без накопления; последняя ячейка перед суммой — +Inf
+        item[bisect_left(self.buckets, value)] += 1
+        item[-1] += value
+
+    def empty(self):
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def expose(self, labels, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), value):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), labels + (le,))} {cumulative}")
+        suffix = _labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{suffix} {_number(value[-1])}")
+        lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+def _merge(total, values):
+    for key, value in values.items():
+        if isinstance(value, list):
+            current = total.get(key)
+            if current is None:
+                total[key] = list(value)
+            else:
+                for i, item in enumerate(value):
+                    current[i] += item
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+metrics = MetricsRegistry()
+
+# === МЕТРИКИ ===
+
+ORDERS_PAID = metrics.counter(
+    "school_orders_paid_total", "Оплаченные заказы по источнику оплаты", ("source",))
+# Выдачи в минуту: rate(school_meals_collected_total[5m]) * 60
+MEALS_COLLECTED = metrics.counter(
+    "school_meals_collected_total", "Выданные в столовой приёмы пищи")
+NOTIFICATION_FANOUT = metrics.histogram(
+    "school_notification_fanout_size", "Число получателей одной рассылки уведомлений",
+    ("kind",), buckets=FANOUT_BUCKETS)
+CREATE_NOTIFICATION_SECONDS = metrics.histogram(
+    "school_create_notification_seconds", "Время вызова create_notification (постановка в очередь)",
+    buckets=FAST_BUCKETS)
+DB_COMMIT_SECONDS = metrics.histogram(
+    "school_db_commit_seconds", "Время фиксации транзакции, включая ожидание блокировки записи SQLite")
+DB_LOCK_ERRORS = metrics.counter(
+    "school_db_lock_errors_total", "Запросы, не дождавшиеся блокировки базы (database is locked)")
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "school_http_request_duration_seconds", "Время обработки запроса по маршруту",
+    ("route", "method"))
+PASSWORD_HASH_SECONDS = metrics.histogram(
+    "school_password_hash_seconds", "Время проверки или создания хэша пароля", ("operation",))
+LOGINS_REJECTED = metrics.counter(
+    "school_logins_rejected_total", "Входы, отклонённые до хэширования пароля", ("reason",))
@@ -0,0 +1,165 @@
+# migrations.py
+
+from sqlalchemy import inspect, select, update, delete, func, type_coerce, Float, Integer
+
+from database import db
+from models import Order, User, DeletionLog, DailyReport, Ingredient, Meal, FlexibleSubscription, OrderWeek
+import order_weeks
+
+
+def _create_indexes(model, *names):
+    """Шаг: создать перечисленные индексы модели, которых ещё нет в базе.
+
+    Индексы называются явно: набор индексов модели растёт вместе с кодом, и
+    «все текущие индексы» старого шага задели бы столбцы, которые добавляют
+    только следующие шаги.
+    """
+    def step(conn):
+        indexes = {index.name: index for index in model.__table__.indexes}
+        for name in names:
+            indexes[name].create(conn, checkfirst=True)
+    return step
+
+
+def _chain(*steps):
+    """Шаг из нескольких шагов, выполняемых подряд в одной транзакции"""
+    def step(conn):
+        for part in steps:
+            part(conn)
+    return step
+
+
+def _add_columns(model, *names):
+    """Шаг: добавить в существующую таблицу новые столбцы модели"""
+    def step(conn):
+        table = model.__table__
+        existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+        for name in names:
+            if name not in existing:
+                column = table.c[name]
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                                     f"{column.type.compile(conn.dialect)}")
+    return step
+
+
+def _unique_paid_orders(conn):
+    """Шаг: отменить повторные оплаты одного приёма с возвратом и включить уникальный индекс"""
+    orders = Order.__table__
+    # Суммы читаются и пишутся как есть, без перевода в копейки: на старой
+    # базе шаг выполняется до перехода на копейки (шаг 6), на остальных — после
+    ranked = select(
+        orders.c.id, orders.c.student_id, orders.c.serving_date,
+        type_coerce(orders.c.meal_price, Float).label("meal_price"),
+        func.row_number().over(
+            partition_by=(orders.c.student_id, orders.c.serving_date, orders.c.meal_type),
+            # Остаётся выданный заказ, иначе — самый ранний
+            order_by=(orders.c.is_collected.desc(), orders.c.id)
+        ).label("position")
+    ).where(orders.c.status == "paid").subquery()
+    duplicates = conn.execute(
+        select(ranked.c.id, ranked.c.student_id, ranked.c.serving_date, ranked.c.meal_price)
+        .where(ranked.c.position > 1)
+    ).all()
+
+    if duplicates:
+        refunds = {}
+        for _, student_id, _, price in duplicates:
+            refunds[student_id] = refunds.get(student_id, 0.0) + (price or 0.0)
+        users = User.__table__
+        for student_id, amount in refunds.items():
+            conn.execute(update(users).where(users.c.id == student_id)
+                         .values(balance=type_coerce(users.c.balance, Float) + amount))
+        conn.execute(update(orders).where(orders.c.id.in_([row.id for row in duplicates])).values(status="cancelled"))
+        conn.execute(delete(DailyReport.__table__).where(
+            DailyReport.__table__.c.serving_date.in_({row.serving_date for row in duplicates})
+        ))
+        print(f"Отменено повторных оплат: {len(duplicates)}, возвращено ученикам: {len(refunds)}")
+
+    _create_indexes(Order, "ux_order_paid_slot")(conn)
+
+
+# Денежные столбцы, которые раньше были Float в рублях
+MONEY_COLUMNS = [
+    (User, "balance"),
+    (Ingredient, "price_per_unit"),
+    (Meal, "price"),
+    (FlexibleSubscription, "total_price"),
+    (Order, "meal_price"),
+    (DailyReport, "breakfast_revenue"),
+    (DailyReport, "lunch_revenue"),
+    (DeletionLog, "refund_amount"),
+]
+
+
+def _money_to_minor_units(conn):
+    """Шаг: перевести суммы из рублей (float) в целые копейки.
+
+    Столбец, который в базе уже целочисленный (create_all новой базы или
+    повторный запуск на PostgreSQL), не трогается. PostgreSQL меняет тип
+    столбца; SQLite тип столбца без пересоздания таблицы не меняет — там
+    столбец остаётся REAL, но хранит целые копейки, которые он представляет
+    точно, и SUM по нему тоже точен.
+    """
+    inspector = inspect(conn)
+    declared = {}
+    for model, name in MONEY_COLUMNS:
+        table = model.__table__
+        if table.name not in declared:
+            declared[table.name] = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+        if isinstance(declared[table.name].get(name), Integer):
+            continue
+        factor = 10 ** table.c[name].type.places
+        # "order" — зарезервированное слово, имена экранируются
+        quoted_table = conn.dialect.identifier_preparer.format_table(table)
+        quoted_name = conn.dialect.identifier_preparer.quote(name)
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql(f"ALTER TABLE {quoted_table} ALTER COLUMN {quoted_name} TYPE BIGINT "
+                                 f"USING ROUND({quoted_name} * {factor})")
+        else:
+            conn.exec_driver_sql(f"UPDATE {quoted_table} SET {quoted_name} = "
+                                 f"CAST(ROUND({quoted_name} * {factor}) AS INTEGER)")
+
+
+def _fill_order_weeks(conn):
+    """Шаг: заполнить маски недель по уже существующим заказам"""
+    # Таблицу создаёт create_all; непустая — уже заполнена и дальше ведётся вместе с заказами
+    if conn.execute(select(OrderWeek.student_id).limit(1)).first() is None:
+        weeks = order_weeks.rebuild(conn)
+        if weeks:
+            print(f"Заполнено недель заказов: {weeks}")
+
+
+# Шаги по порядку. Номер последнего применённого хранится в PRAGMA user_version.
+# create_all не меняет существующие таблицы, поэтому всё, что добавляется
+# в уже созданные таблицы, оформляется шагом. Шаги идемпотентны: на свежей
+# базе после create_all они ничего не меняют.
+MIGRATIONS = [
+    (1, "индекс заказов по дате и статусу", _create_indexes(Order, "ix_order_serving_date_status")),
+    (2, "индексы архива учеников и журнала удалений", _chain(
+        _create_indexes(User, "ix_user_role_active_deleted_at"),
+        _create_indexes(DeletionLog, "ix_deletion_logs_user_id_deleted_at")
+    )),
+    (3, "столбец batch_id журнала удалений", _add_columns(DeletionLog, "batch_id")),
+    (4, "индекс журнала удалений по batch_id", _create_indexes(DeletionLog, "ix_deletion_logs_batch_id")),
+    (5, "уникальность оплаченного приёма пищи", _unique_paid_orders),
+    (6, "суммы в копейках вместо рублей с плавающей точкой", _money_to_minor_units),
+    (7, "маски заказов по неделям", _fill_order_weeks),
+]
+
+
+def migrate():
+    """Применяет недостающие шаги к базе приложения (вызывать после create_all)"""
+    with db.engine.connect() as conn:
+        sqlite = conn.dialect.name == "sqlite"
+        # Без user_version (не SQLite) шаги просто повторяются — они идемпотентны
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar() if sqlite else 0
+
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        # Каждый шаг — отдельная транзакция вместе с записью его номера
+        with db.engine.begin() as conn:
+            step(conn)
+            if sqlite:
+                conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+        print(f"Миграция {number}: {description}")
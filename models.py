@@ -1,16 +1,20 @@
 # models.py
 
 from database import db
+from money import Money, INGREDIENT_PRICE_PLACES
 from flask_login import UserMixin
 from datetime import datetime
 
 class User(UserMixin, db.Model):
+    # Архив учеников листается по дате удаления
+    __table_args__ = (db.Index('ix_user_role_active_deleted_at', 'role', 'is_active', 'deleted_at'),)
+
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(255))
     email = db.Column(db.String(255), unique=True)
     password = db.Column(db.String(255))
     role = db.Column(db.String(20))
-    balance = db.Column(db.Float, default=0.0)
+    balance = db.Column(Money, default=0.0)  # рубли; в базе — копейки
     has_subscription = db.Column(db.Boolean, default=False)
     class_name = db.Column(db.String(20))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
@@ -24,7 +28,7 @@ class User(UserMixin, db.Model):
 class Ingredient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
-    price_per_unit = db.Column(db.Float, default=0.0)
+    price_per_unit = db.Column(Money(INGREDIENT_PRICE_PLACES), default=0.0)
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -37,7 +41,7 @@ class Meal(db.Model):
     day_of_week = db.Column(db.String(20))
     meal_type = db.Column(db.String(20))
     name = db.Column(db.String(255))
-    price = db.Column(db.Float)
+    price = db.Column(Money)
 
 class MealIngredient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -54,7 +58,7 @@ class FlexibleSubscription(db.Model):
                            nullable=False)
     days_count = db.Column(db.Integer, nullable=False)
     days_config = db.Column(db.JSON, nullable=False)
-    total_price = db.Column(db.Float, nullable=False)
+    total_price = db.Column(Money, nullable=False)
     total_meals = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=False)
@@ -64,6 +68,14 @@ class FlexibleSubscription(db.Model):
     start_date = db.Column(db.DateTime, default=datetime.utcnow)  # Дата начала действия абонемента
 
 class Order(db.Model):
+    __table_args__ = (
+        # Отчёты и план закупок выбирают заказы по диапазону дат питания
+        db.Index('ix_order_serving_date_status', 'serving_date', 'status'),
+        # Приём пищи на дату оплачивается один раз: двойную оплату отсекает база
+        db.Index('ux_order_paid_slot', 'student_id', 'serving_date', 'meal_type', unique=True,
+                 sqlite_where=db.text("status = 'paid'"), postgresql_where=db.text("status = 'paid'")),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     day_of_week = db.Column(db.String(20))
@@ -76,7 +88,7 @@ class Order(db.Model):
     paid_at = db.Column(db.DateTime, nullable=True)
     # фиксация рецепта на момент оплаты
     meal_name = db.Column(db.String(100))  # название блюда
-    meal_price = db.Column(db.Float)  # цена на момент оплаты
+    meal_price = db.Column(Money)  # цена на момент оплаты
 
     meal_ingredients = db.Column(db.Text)  # serialized JSON
     student = db.relationship('User', backref='orders')
@@ -85,7 +97,7 @@ class Order(db.Model):
     # Связь с гибким абонементом
     #flexible_subscription_id = db.Column(db.Integer, db.ForeignKey('flexible_subscription.id'), nullable=True)
     # ИСТОЧНИК ОПЛАТЫ
-    payment_source = db.Column(db.String(20), default='single')  # 'single' или 'flexible'
+    payment_source = db.Column(db.String(20), default='single')  # 'single', 'flexible' или 'subsidy' (льготное, без оплаты)
 
     @property
     def consumed(self):
@@ -116,6 +128,21 @@ class Order(db.Model):
             if self.confirmed_at is None:
                 self.confirmed_at = datetime.utcnow()
 
+class DailyReport(db.Model):
+    """Итоги закрытого учебного дня (кэш для отчётов)"""
+    __tablename__ = 'daily_reports'
+
+    serving_date = db.Column(db.Date, primary_key=True)
+    breakfast_paid = db.Column(db.Integer, default=0)
+    lunch_paid = db.Column(db.Integer, default=0)
+    breakfast_revenue = db.Column(Money, default=0.0)
+    lunch_revenue = db.Column(Money, default=0.0)
+    breakfast_attended = db.Column(db.Integer, default=0)
+    lunch_attended = db.Column(db.Integer, default=0)
+    # {"Молоко": {"unit": "мл", "plan": 400.0, "fact": 200.0}, ...}
+    ingredient_usage = db.Column(db.JSON, default=dict)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Allergy(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -192,6 +219,8 @@ class Notification(db.Model):
 class DeletionLog(db.Model):
     """Лог удаления пользователей"""
     __tablename__ = 'deletion_logs'
+    # Последняя запись журнала по каждому ученику
+    __table_args__ = (db.Index('ix_deletion_logs_user_id_deleted_at', 'user_id', 'deleted_at'),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False)  # ID удалённого пользователя
@@ -199,9 +228,47 @@ class DeletionLog(db.Model):
     user_full_name = db.Column(db.String(200), nullable=False)
     deleted_by_admin_id = db.Column(db.Integer, nullable=False)  # ID админа
     deleted_by_admin_email = db.Column(db.String(120), nullable=False)
-    refund_amount = db.Column(db.Float, default=0.0)  # Сумма возврата
+    refund_amount = db.Column(Money, default=0.0)  # Сумма возврата
     reason = db.Column(db.Text)  # Причина удаления (опционально)
     deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    batch_id = db.Column(db.String(32), index=True)  # Общий ключ записей одного массового архивирования
 
     def __repr__(self):
-        return f'<DeletionLog {self.user_full_name}>'
\ No newline at end of file
+        return f'<DeletionLog {self.user_full_name}>'
+
+class IdempotencyKey(db.Model):
+    """Результат POST-запроса с ключом идемпотентности: повтор отдаётся без выполнения"""
+    __tablename__ = 'idempotency_keys'
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    endpoint = db.Column(db.String(100), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)  # Отпечаток данных запроса
+    status_code = db.Column(db.Integer)  # None — первый запрос ещё выполняется
+    location = db.Column(db.String(500))
+    content_type = db.Column(db.String(100))
+    body = db.Column(db.Text)
+    flashes = db.Column(db.JSON)  # Сообщения flash первого ответа
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.endpoint} {self.key}>'
+
+
+class OrderWeek(db.Model):
+    """Статусы оплаченных заказов ученика за ISO-неделю битовыми масками.
+
+    Бит приёма — 2 × день недели + (0 — завтрак, 1 — обед), 10 бит на пн–пт.
+    Маски меняются вместе с заказами (order_weeks.py): кабинет ученика,
+    статистика администратора и проверка повторной оплаты читают одну
+    строку на неделю вместо заказов.
+    """
+    __tablename__ = 'order_weeks'
+    # Статистика администратора выбирает все строки одной недели
+    __table_args__ = (db.Index('ix_order_weeks_week_start', 'week_start'),)
+
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    week_start = db.Column(db.Date, primary_key=True)  # понедельник недели
+    paid = db.Column(db.Integer, nullable=False, default=0)
+    collected = db.Column(db.Integer, nullable=False, default=0)  # выдано поваром
+    confirmed = db.Column(db.Integer, nullable=False, default=0)  # получение подтвердил ученик
@@ -0,0 +1,63 @@
+# money.py
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from sqlalchemy.types import TypeDecorator, BigInteger
+
+# Суммы в рублях хранятся в копейках; цены ингредиентов за грамм/мл
+# бывают в доли копейки (0.035 ₽/г) — для них берётся 4 знака
+KOPECKS = 2
+INGREDIENT_PRICE_PLACES = 4
+
+
+def to_minor(value, places=KOPECKS):
+    """Рубли → целое число долей рубля с округлением до ближайшей (половина — вверх)"""
+    try:
+        return int(Decimal(str(value)).scaleb(places).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError, OverflowError):
+        raise ValueError(f"Некорректная сумма: {value!r}")
+
+
+def from_minor(value, places=KOPECKS):
+    """Целое число долей рубля → рубли"""
+    return int(value) / 10 ** places
+
+
+def parse_money(text, places=KOPECKS):
+    """Сумма из формы («150», «99,90») в рублях, округлённая до копейки.
+
+    Как float(), бросает ValueError на нечисловой строке, а также на
+    nan/inf — их float() пропускает. Подходит для request.form.get(type=...).
+    """
+    text = str(text).strip().replace(" ", "").replace(",", ".")
+    return from_minor(to_minor(float(text), places), places)
+
+
+def money_sum(values, places=KOPECKS):
+    """Точная сумма денежных значений: складываются целые копейки, а не float"""
+    return from_minor(sum(to_minor(value or 0, places) for value in values), places)
+
+
+class Money(TypeDecorator):
+    """Денежный столбец: в базе — целое число копеек (или долей при places=4).
+
+    В Python значение остаётся числом рублей, поэтому арифметика маршрутов
+    не меняется; при записи сумма округляется до копейки, и ошибки float в
+    базе не копятся. SUM и сравнения выполняются в базе по целым числам,
+    параметры (User.balance + :delta, User.balance < :cost) переводятся
+    в копейки автоматически.
+    """
+    impl = BigInteger
+    cache_ok = True
+
+    def __init__(self, places=KOPECKS):
+        super().__init__()
+        self.places = places
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_minor(value, self.places)
+
+    def process_result_value(self, value, dialect):
+        # SQLite-база, переведённая миграцией, хранит копейки в столбце REAL —
+        # такие значения приходят как 5000.0 и остаются точными
+        return None if value is None else from_minor(round(value), self.places)
@@ -0,0 +1,232 @@
+# notification_queue.py
+
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, Integer, insert, literal, select
+
+from database import db
+from etags import bump_notifications, bump_notifications_after_commit
+from metrics import NOTIFICATION_FANOUT
+from models import Notification, User
+
+
+class NotificationDispatcher:
+    """Фоновая очередь записи уведомлений вне обработчика запроса.
+
+    Обработчики кладут уведомления в ограниченный буфер, а отдельный поток
+    раз в NOTIFICATIONS_FLUSH_INTERVAL_MS пишет накопленное одной пачкой.
+    В тестах (app.testing) и при NOTIFICATIONS_ASYNC = False запись синхронная.
+
+    Рассылка на целую роль не разворачивается в список id на стороне Python:
+    она записывается одним INSERT ... SELECT по таблице пользователей.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def init_app(self, app):
+        app.config.setdefault('NOTIFICATIONS_ASYNC', True)
+        app.config.setdefault('NOTIFICATIONS_QUEUE_SIZE', 10000)
+        app.config.setdefault('NOTIFICATIONS_FLUSH_INTERVAL_MS', 200)
+        app.config.setdefault('NOTIFICATIONS_BATCH_SIZE', 500)
+        self.app = app
+        self._queue = queue.Queue(maxsize=app.config['NOTIFICATIONS_QUEUE_SIZE'])
+        app.extensions['notification_dispatcher'] = self
+        atexit.register(self.shutdown)
+
+    @property
+    def is_async(self):
+        return (self.app is not None
+                and self.app.config['NOTIFICATIONS_ASYNC']
+                and not self.app.testing
+                and not self._stopping.is_set())
+
+    def submit(self, row):
+        """Ставит уведомление в очередь (row — словарь полей Notification)"""
+        self._enqueue(self._normalize(row))
+
+    def submit_many(self, rows, in_transaction=False):
+        """Ставит в очередь пачку уведомлений разным пользователям одним элементом.
+
+        Пачка записывается одним INSERT; при in_transaction=True — сразу
+        в текущей сессии, вместе с остальными изменениями запроса.
+        """
+        rows = [self._normalize(row) for row in rows]
+        if not rows:
+            return
+        NOTIFICATION_FANOUT.observe(len(rows), kind="direct")
+        if in_transaction:
+            db.session.execute(insert(Notification), rows)
+            bump_notifications_after_commit(user_ids={row['user_id'] for row in rows})
+            return
+        self._enqueue(rows)
+
+    def broadcast(self, roles, title, message, type="info", order_id=None, request_id=None,
+                  in_transaction=False):
+        """Ставит в очередь рассылку всем активным пользователям указанных ролей.
+
+        При in_transaction=True рассылка выполняется сразу в текущей сессии
+        и фиксируется вместе с остальными изменениями запроса.
+        """
+        item = Broadcast(
+            roles=tuple(roles),
+            title=title,
+            message=message,
+            type=type or "info",
+            order_id=order_id,
+            request_id=request_id,
+            created_at=datetime.utcnow()
+        )
+        if in_transaction:
+            item.execute()
+            return
+        self._enqueue(item)
+
+    def flush(self):
+        """Дожидается записи всего, что уже стоит в очереди"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def shutdown(self, timeout=5.0):
+        """Останавливает поток, предварительно дописав очередь"""
+        self._stopping.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+
+    # === ВНУТРЕННЕЕ ===
+
+    @staticmethod
+    def _normalize(row):
+        return {
+            'user_id': row['user_id'],
+            'title': row['title'],
+            'message': row['message'],
+            'type': row.get('type') or "info",
+            'order_id': row.get('order_id'),
+            'request_id': row.get('request_id'),
+            'is_read': False,
+            'created_at': row.get('created_at') or datetime.utcnow(),
+        }
+
+    def _enqueue(self, item):
+        if not self.is_async:
+            self._write([item])
+            return
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Буфер переполнен — пишем сразу, чтобы не потерять уведомление
+            self._write([item])
+
+    def _ensure_started(self):
+        # Поток стартует лениво: в родительском процессе reloader'а он не нужен
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        interval = self.app.config['NOTIFICATIONS_FLUSH_INTERVAL_MS'] / 1000.0
+        batch_size = self.app.config['NOTIFICATIONS_BATCH_SIZE']
+
+        while True:
+            try:
+                batch = [self._queue.get(timeout=interval)]
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+
+            # Добираем пачку до истечения интервала или лимита размера
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                with self.app.app_context():
+                    self._write(batch)
+            except Exception as e:
+                print(f"Ошибка при записи уведомлений: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _write(items):
+        rows = [item for item in items if isinstance(item, dict)]
+        rows += [row for item in items if isinstance(item, list) for row in item]
+        broadcasts = [item for item in items if isinstance(item, Broadcast)]
+        try:
+            if rows:
+                db.session.execute(insert(Notification), rows)
+            for item in broadcasts:
+                item.execute()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        # Опрашивающие клиенты увидят новые уведомления (ETag сменится)
+        bump_notifications(
+            user_ids={row['user_id'] for row in rows},
+            roles={role for item in broadcasts for role in item.roles}
+        )
+
+
+class Broadcast:
+    """Рассылка одного уведомления всем активным пользователям ролей"""
+
+    __slots__ = ('roles', 'title', 'message', 'type', 'order_id', 'request_id', 'created_at')
+
+    def __init__(self, roles, title, message, type, order_id, request_id, created_at):
+        self.roles = roles
+        self.title = title
+        self.message = message
+        self.type = type
+        self.order_id = order_id
+        self.request_id = request_id
+        self.created_at = created_at
+
+    def statement(self):
+        """INSERT ... SELECT: получатели выбираются на стороне базы"""
+        audience = select(
+            User.id,
+            literal(self.title),
+            literal(self.message),
+            literal(self.type),
+            literal(self.order_id, Integer),
+            literal(self.request_id, Integer),
+            literal(False, Boolean),
+            literal(self.created_at, DateTime)
+        ).where(User.role.in_(self.roles), User.is_active == True)
+
+        return insert(Notification).from_select(
+            ['user_id', 'title', 'message', 'type', 'order_id', 'request_id', 'is_read', 'created_at'],
+            audience
+        )
+
+    def execute(self):
+        """Выполняет рассылку в текущей сессии и учитывает число получателей"""
+        result = db.session.execute(self.statement())
+        NOTIFICATION_FANOUT.observe(result.rowcount, kind="broadcast")
+
+
+dispatcher = NotificationDispatcher()
@@ -0,0 +1,128 @@
+# order_weeks.py
+
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import select, insert, update, delete, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import db
+from models import Order, OrderWeek
+
+MEAL_TYPES = ("breakfast", "lunch")
+WEEKDAY_NAMES = ("monday", "tuesday", "wednesday", "thursday", "friday")
+FIELDS = ("paid", "collected", "confirmed")
+FULL_WEEK = (1 << 10) - 1
+
+
+def week_start(day):
+    """Понедельник недели, в которую попадает day"""
+    return day - timedelta(days=day.weekday())
+
+
+def slot_bit(serving_date, meal_type):
+    """Бит приёма пищи в маске недели; для выходных — 0 (в маске их нет)"""
+    weekday = serving_date.weekday()
+    if weekday > 4 or meal_type not in MEAL_TYPES:
+        return 0
+    return 1 << (weekday * 2 + MEAL_TYPES.index(meal_type))
+
+
+def day_bit(day_key, meal_type):
+    """То же по названию дня недели ("monday") — для меню и форм"""
+    return 1 << (WEEKDAY_NAMES.index(day_key) * 2 + MEAL_TYPES.index(meal_type))
+
+
+def count_slots(mask):
+    """Число приёмов в маске"""
+    return bin(mask).count("1")
+
+
+def _group(slots):
+    """[(ученик, дата, приём)] → {(ученик, понедельник): биты}"""
+    bits = defaultdict(int)
+    for student_id, serving_date, meal_type in slots:
+        bit = slot_bit(serving_date, meal_type)
+        if bit:
+            bits[(student_id, week_start(serving_date))] |= bit
+    return bits
+
+
+def mark(slots, field):
+    """Ставит биты приёмов в маске field ("paid", "collected", "confirmed"). Коммит — за вызывающим.
+
+    Одна команда INSERT ... ON CONFLICT DO UPDATE на всю пачку: строка
+    недели создаётся при первой оплате, дальше биты добавляются через OR.
+    """
+    bits = _group(slots)
+    if not bits:
+        return
+
+    table = OrderWeek.__table__
+    dialect = postgresql if db.session.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.student_id, table.c.week_start],
+        set_={field: table.c[field].op("|")(statement.excluded[field])}
+    )
+    db.session.execute(statement, [
+        {"student_id": student_id, "week_start": monday, **dict.fromkeys(FIELDS, 0), field: mask}
+        for (student_id, monday), mask in bits.items()
+    ])
+
+
+def clear(slots):
+    """Снимает биты отменённых приёмов во всех масках одним executemany. Коммит — за вызывающим."""
+    bits = _group(slots)
+    if not bits:
+        return
+
+    table = OrderWeek.__table__
+    db.session.execute(
+        update(table).where(table.c.student_id == bindparam("student"),
+                            table.c.week_start == bindparam("monday"))
+        .values({field: table.c[field].op("&")(bindparam("keep")) for field in FIELDS}),
+        [{"student": student_id, "monday": monday, "keep": FULL_WEEK ^ mask}
+         for (student_id, monday), mask in bits.items()]
+    )
+
+
+def load(student_id, date_from=None, date_to=None):
+    """Маски ученика по неделям: {понедельник: (оплачено, выдано, подтверждено)}"""
+    condition = [OrderWeek.student_id == student_id]
+    if date_from is not None:
+        condition.append(OrderWeek.week_start >= week_start(date_from))
+    if date_to is not None:
+        condition.append(OrderWeek.week_start <= week_start(date_to))
+    rows = db.session.execute(
+        select(OrderWeek.week_start, OrderWeek.paid, OrderWeek.collected, OrderWeek.confirmed).where(*condition)
+    )
+    return {monday: (paid, collected, confirmed) for monday, paid, collected, confirmed in rows}
+
+
+def rebuild(conn):
+    """Пересчитывает все маски по заказам (заполнение таблицы при миграции)"""
+    masks = defaultdict(lambda: [0, 0, 0])
+    rows = conn.execute(
+        select(Order.student_id, Order.serving_date, Order.meal_type, Order.is_collected, Order.student_confirmed)
+        .where(Order.status == "paid", Order.serving_date.is_not(None))
+    )
+    for student_id, serving_date, meal_type, collected, confirmed in rows:
+        bit = slot_bit(serving_date, meal_type)
+        if not bit:
+            continue
+        week = masks[(student_id, week_start(serving_date))]
+        week[0] |= bit
+        if collected:
+            week[1] |= bit
+        if confirmed:
+            week[2] |= bit
+
+    table = OrderWeek.__table__
+    conn.execute(delete(table))
+    if masks:
+        conn.execute(insert(table), [
+            {"student_id": student_id, "week_start": monday, "paid": paid, "collected": collected, "confirmed": confirmed}
+            for (student_id, monday), (paid, collected, confirmed) in masks.items()
+        ])
+    return len(masks)
@@ -0,0 +1,35 @@
+# orders.py
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import db
+from models import Order
+import order_weeks
+
+
+def insert_paid_orders(rows):
+    """Вставляет оплаченные заказы одной командой, пропуская уже оплаченные приёмы.
+
+    Повторную оплату того же приёма на ту же дату отсекает частичный
+    уникальный индекс ux_order_paid_slot: INSERT ... ON CONFLICT DO NOTHING
+    на всю пачку, без предварительных проверок и без гонки между
+    одновременными запросами. Биты вставленных приёмов сразу ставятся
+    в маски недель (order_weeks). Коммит — за вызывающим.
+
+    Возвращает вставленные строки: [(id, student_id, serving_date, meal_type, meal_price)].
+    """
+    if not rows:
+        return []
+
+    table = Order.__table__
+    dialect = postgresql if db.session.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(table).on_conflict_do_nothing(
+        index_elements=[table.c.student_id, table.c.serving_date, table.c.meal_type],
+        # Условие частичного индекса — текстом, как в модели (параметры здесь недопустимы)
+        index_where=text("status = 'paid'")
+    ).returning(table.c.id, table.c.student_id, table.c.serving_date, table.c.meal_type, table.c.meal_price)
+
+    inserted = db.session.execute(statement, [{"status": "paid", **row} for row in rows]).all()
+    order_weeks.mark(((row.student_id, row.serving_date, row.meal_type) for row in inserted), "paid")
+    return inserted
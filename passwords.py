@@ -0,0 +1,177 @@
+# passwords.py
+
+import os
+import secrets
+import string
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import PASSWORD_HASH_SECONDS, LOGINS_REJECTED
+
+SPECIAL_CHARACTERS = "!@#$%^&*"
+TEMPORARY_PASSWORD_ALPHABET = string.ascii_letters + string.digits + SPECIAL_CHARACTERS
+
+
+def generate_temporary_password(length=12):
+    """Случайный временный пароль: есть цифра, заглавная, строчная буква и спецсимвол"""
+    required = [
+        secrets.choice(string.digits),
+        secrets.choice(string.ascii_uppercase),
+        secrets.choice(string.ascii_lowercase),
+        secrets.choice(SPECIAL_CHARACTERS)
+    ]
+    chars = required + [secrets.choice(TEMPORARY_PASSWORD_ALPHABET) for _ in range(length - len(required))]
+    secrets.SystemRandom().shuffle(chars)
+    return "".join(chars)
+
+
+def hash_passwords(passwords, method="scrypt", workers=4):
+    """Хэши паролей в исходном порядке, посчитанные параллельно.
+
+    scrypt и pbkdf2 считаются внутри OpenSSL с отпущенным GIL, поэтому
+    пул потоков загружает все ядра. Пул процессов здесь хуже: fork процесса
+    с фоновым потоком уведомлений небезопасен, а spawn заново выполняет app.py.
+    """
+    passwords = list(passwords)
+    if len(passwords) < 2 or workers <= 1:
+        return [generate_password_hash(password, method=method) for password in passwords]
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash") as pool:
+        return list(pool.map(lambda password: generate_password_hash(password, method=method), passwords))
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь на хэширование заполнена — вход нужно повторить позже"""
+
+
+class PasswordHasher:
+    """Проверка и создание хэшей паролей в ограниченном пуле потоков.
+
+    Хэш пароля намеренно дорог. Если считать его в потоке запроса, то
+    вход целого класса разом занимает все ядра, и дешёвые запросы (опрос
+    уведомлений) ждут. Здесь одновременно считается не больше
+    PASSWORD_HASH_POOL_SIZE хэшей, в очереди ждут ещё не больше
+    PASSWORD_HASH_QUEUE_SIZE, остальным сразу отвечаем «занято».
+    """
+
+    def __init__(self):
+        self.app = None
+        self._pool = None
+        self._slots = None
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+        # По умолчанию — половина ядер: остальные остаются обычным запросам
+        app.config.setdefault('PASSWORD_HASH_POOL_SIZE', max(1, (os.cpu_count() or 2) // 2))
+        app.config.setdefault('PASSWORD_HASH_QUEUE_SIZE', 32)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        self.app = app
+        size = app.config['PASSWORD_HASH_POOL_SIZE']
+        self._pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(size + app.config['PASSWORD_HASH_QUEUE_SIZE'])
+        app.extensions['password_hasher'] = self
+
+    def check(self, pwhash, password):
+        return self._run("check", check_password_hash, pwhash, password)
+
+    def generate(self, password):
+        return self._run("generate", generate_password_hash, password,
+                         method=self.app.config['PASSWORD_HASH_METHOD'])
+
+    def _run(self, operation, func, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            LOGINS_REJECTED.inc(reason="busy")
+            raise PasswordHasherBusy()
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                PASSWORD_HASH_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+        try:
+            future = self._pool.submit(timed)
+        except Exception:
+            self._slots.release()
+            raise
+        # Место освобождается, когда хэш посчитан, даже если запрос перестал ждать
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.app.config['PASSWORD_HASH_TIMEOUT'])
+        except TimeoutError:
+            LOGINS_REJECTED.inc(reason="busy")
+            raise PasswordHasherBusy()
+
+
+class LoginThrottle:
+    """Ограничение неудачных входов по IP и по учётной записи.
+
+    Проверяется до загрузки пользователя и до хэширования, поэтому перебор
+    паролей не тратит процессор. Считаются только неудачные попытки:
+    класс, входящий с одного школьного IP с верными паролями, не упирается
+    в лимит. Счётчики живут в памяти процесса.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._failures = OrderedDict()  # ключ -> deque времён неудачных попыток
+
+    def init_app(self, app):
+        app.config.setdefault('LOGIN_THROTTLE_WINDOW', 300)
+        app.config.setdefault('LOGIN_MAX_FAILURES_PER_IP', 30)
+        app.config.setdefault('LOGIN_MAX_FAILURES_PER_ACCOUNT', 10)
+        app.config.setdefault('LOGIN_THROTTLE_MAX_KEYS', 10000)
+        self.app = app
+        app.extensions['login_throttle'] = self
+
+    def _keys(self, ip, email):
+        return (("ip", ip, self.app.config['LOGIN_MAX_FAILURES_PER_IP']),
+                ("account", email.lower(), self.app.config['LOGIN_MAX_FAILURES_PER_ACCOUNT']))
+
+    def retry_after(self, ip, email):
+        """Через сколько секунд можно повторить вход (0 — можно сейчас)"""
+        window = self.app.config['LOGIN_THROTTLE_WINDOW']
+        now = time.monotonic()
+        wait = 0
+        with self._lock:
+            for kind, value, limit in self._keys(ip, email):
+                attempts = self._failures.get((kind, value))
+                if not attempts:
+                    continue
+                while attempts and attempts[0] <= now - window:
+                    attempts.popleft()
+                if len(attempts) >= limit:
+                    # Вход откроется, когда самая старая из последних limit попыток выйдет из окна
+                    wait = max(wait, int(attempts[-limit] + window - now) + 1)
+        if wait:
+            LOGINS_REJECTED.inc(reason="throttled")
+        return wait
+
+    def failure(self, ip, email):
+        now = time.monotonic()
+        with self._lock:
+            for kind, value, limit in self._keys(ip, email):
+                key = (kind, value)
+                attempts = self._failures.get(key)
+                if attempts is None:
+                    attempts = self._failures[key] = deque(maxlen=limit)
+                else:
+                    self._failures.move_to_end(key)
+                attempts.append(now)
+            while len(self._failures) > self.app.config['LOGIN_THROTTLE_MAX_KEYS']:
+                self._failures.popitem(last=False)
+
+    def success(self, ip, email):
+        """Удачный вход сбрасывает счётчик учётной записи (но не IP)"""
+        with self._lock:
+            self._failures.pop(("account", email.lower()), None)
+
+
+hasher = PasswordHasher()
+login_throttle = LoginThrottle()
@@ -0,0 +1,188 @@
+# purchase_plan.py
+
+import json
+import math
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from database import db
+from models import Order, Product, Ingredient, PurchaseRequest
+
+# Единицы измерения → (базовая единица, множитель): рецепт в граммах и остаток
+# в килограммах сравниваются только после перевода в одну единицу
+UNITS = {
+    "г": ("г", 1), "кг": ("г", 1000),
+    "мл": ("мл", 1), "л": ("мл", 1000),
+    "шт": ("шт", 1),
+}
+
+
+def _base(unit):
+    """Базовая единица и множитель; неизвестная единица — сама себе база"""
+    unit = (unit or "").strip().lower().rstrip(".")
+    return UNITS.get(unit, (unit, 1))
+
+
+def convert(quantity, from_unit, to_unit):
+    """Переводит количество между единицами одной величины; None — если величины разные (г и шт)"""
+    from_base, from_factor = _base(from_unit)
+    to_base, to_factor = _base(to_unit)
+    if from_base != to_base:
+        return None
+    return quantity * from_factor / to_factor
+
+
+def serving_days(start_date, count):
+    """Возвращает count ближайших учебных дней (пн-пт), начиная со start_date"""
+    days = []
+    current = start_date
+    while len(days) < count:
+        if current.weekday() < 5:
+            days.append(current)
+        current += timedelta(days=1)
+    return days
+
+
+def _demand_matrix(days):
+    """Потребность по ингредиентам: {name: (базовая единица, [кол-во на каждый день])}.
+
+    Заказы группируются в базе по (дата, зафиксированный рецепт), поэтому
+    каждый JSON рецепта разбирается один раз, а не для каждого заказа.
+    Количества переводятся в базовую единицу (г, мл, шт), чтобы рецепты
+    в граммах и килограммах складывались правильно.
+    """
+    day_index = {day: i for i, day in enumerate(days)}
+    grouped = db.session.query(
+        Order.serving_date,
+        Order.meal_ingredients,
+        db.func.count(Order.id)
+    ).filter(
+        Order.status == "paid",
+        Order.is_collected == False,
+        Order.serving_date >= days[0],
+        Order.serving_date <= days[-1]
+    ).group_by(Order.serving_date, Order.meal_ingredients).all()
+
+    recipes = {}
+    demand = {}
+    for serving_date, recipe_json, orders_count in grouped:
+        col = day_index.get(serving_date)
+        if col is None:
+            continue  # выходные
+
+        if recipe_json not in recipes:
+            try:
+                recipes[recipe_json] = []
+                for item in json.loads(recipe_json or "[]"):
+                    unit, factor = _base(item.get("unit") or "г")
+                    recipes[recipe_json].append((item["name"], unit, float(item["qty"]) * factor))
+            except (ValueError, KeyError, TypeError):
+                recipes[recipe_json] = []
+
+        for name, unit, qty in recipes[recipe_json]:
+            if name not in demand:
+                demand[name] = (unit, [0.0] * len(days))
+            elif demand[name][0] != unit:
+                print(f"План закупки: {name} в рецептах и в {unit}, и в {demand[name][0]} — пропущено")
+                continue
+            demand[name][1][col] += qty * orders_count
+
+    return demand
+
+
+def _stock_by_name():
+    """Остатки: {name: [(кол-во, единица)]} — партии одного продукта в разных единицах не складываются"""
+    rows = db.session.query(Ingredient.name, Product.quantity, Product.unit) \
+        .join(Product, Product.ingredient_id == Ingredient.id).all()
+    stock = {}
+    for name, quantity, unit in rows:
+        stock.setdefault(name, []).append((float(quantity or 0), unit))
+    return stock
+
+
+def _incoming_by_name():
+    """Ожидающие заявки: {name: [(кол-во, единица)]}"""
+    # Одобренные заявки уже зачислены на склад при одобрении (см. admin()),
+    # поэтому в пути считаются только ожидающие
+    rows = db.session.query(PurchaseRequest.product, PurchaseRequest.unit, db.func.sum(PurchaseRequest.quantity)) \
+        .filter(PurchaseRequest.status == "pending") \
+        .group_by(PurchaseRequest.product, PurchaseRequest.unit).all()
+    incoming = {}
+    for product, unit, quantity in rows:
+        name = (product or "").split(" (")[0]
+        incoming.setdefault(name, []).append((float(quantity or 0), unit))
+    return incoming
+
+
+def _total_in(amounts, unit):
+    """Сумма количеств в единице unit; несовместимые единицы не учитываются"""
+    total = 0.0
+    for quantity, amount_unit in amounts:
+        converted = convert(quantity, amount_unit or unit, unit)
+        if converted is not None:
+            total += converted
+    return total
+
+
+def build_purchase_plan(days_ahead=5, start_date=None):
+    """Планирует закупку на days_ahead учебных дней вперёд.
+
+    Для каждого ингредиента потребность по дням накапливается, сравнивается
+    с остатком на складе и ожидающими заявками; чистая потребность —
+    max(0, накопленный спрос за горизонт - остаток - в пути).
+    Возвращает словарь с корзиной в формате /cook/submit_bulk_request
+    и деталями расчёта по каждому ингредиенту.
+    """
+    start_date = start_date or datetime.today().date()
+    days = serving_days(start_date, max(1, days_ahead))
+
+    demand = _demand_matrix(days)
+    stock = _stock_by_name()
+    incoming = _incoming_by_name()
+
+    items = []
+    for name, (base_unit, per_day) in demand.items():
+        # Расчёт ведётся в единице склада (кг), если спрос в неё переводится,
+        # иначе — в единице рецепта
+        batches = stock.get(name, [])
+        unit = next((stock_unit for _, stock_unit in batches
+                     if stock_unit and convert(1, base_unit, stock_unit) is not None), base_unit)
+        per_day = [convert(quantity, base_unit, unit) for quantity in per_day]
+        on_hand = _total_in(batches, unit)
+        in_transit = _total_in(incoming.get(name, []), unit)
+        available = on_hand + in_transit
+        cumulative = list(accumulate(per_day))
+        total = round(cumulative[-1], 3)
+        net = round(max(0.0, total - available), 3)
+
+        # Первый день, когда накопленный спрос превысит доступное количество
+        shortage_date = next((days[i] for i, need in enumerate(cumulative) if need > available), None)
+
+        items.append({
+            "name": name,
+            "unit": unit,
+            "demand": total,
+            "stock": on_hand,
+            "incoming": in_transit,
+            "net": net,
+            "shortage_date": shortage_date
+        })
+
+    # Сначала то, что закончится раньше всего
+    items.sort(key=lambda x: (x["shortage_date"] or datetime.max.date(), -x["net"], x["name"]))
+    for item in items:
+        if item["shortage_date"]:
+            item["shortage_date"] = item["shortage_date"].strftime("%d.%m.%Y")
+
+    cart = [
+        {"product": item["name"], "quantity": math.ceil(item["net"]), "unit": item["unit"]}
+        for item in items if item["net"] > 0
+    ]
+
+    return {
+        "start_date": days[0].strftime("%d.%m.%Y"),
+        "end_date": days[-1].strftime("%d.%m.%Y"),
+        "days": len(days),
+        "items": items,
+        "cart": cart
+    }
@@ -0,0 +1,274 @@
+# reports.py
+
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from models import Order, Meal, DailyReport
+from money import to_minor, from_minor
+
+MEAL_TYPES = ("breakfast", "lunch")
+
+
+def _empty_day():
+    return {
+        "paid": {"breakfast": 0, "lunch": 0},
+        "revenue": {"breakfast": 0.0, "lunch": 0.0},
+        "attended": {"breakfast": 0, "lunch": 0},
+        "usage": {}
+    }
+
+
+def _weekdays(start_date, end_date):
+    current = start_date
+    while current <= end_date:
+        if current.weekday() < 5:
+            yield current
+        current += timedelta(days=1)
+
+
+def compute_daily_stats(start_date, end_date):
+    """Считает итоги по дням напрямую из заказов.
+
+    Выручка, число оплат и посещений агрегируются в базе; расход
+    ингредиентов — по сгруппированным (дата, рецепт), так что JSON
+    каждого зафиксированного рецепта разбирается один раз.
+    """
+    stats = {day: _empty_day() for day in _weekdays(start_date, end_date)}
+    if not stats:
+        return stats
+
+    attended = and_(Order.is_collected == True, Order.student_confirmed == True)
+    period = (
+        Order.status == "paid",
+        Order.paid_at.isnot(None),
+        Order.serving_date >= start_date,
+        Order.serving_date <= end_date
+    )
+
+    # Цена фиксируется при оплате; для старых заказов без неё берём цену из меню
+    price = db.func.coalesce(Order.meal_price, Meal.price, 0.0)
+    totals = db.session.query(
+        Order.serving_date,
+        Order.meal_type,
+        db.func.count(Order.id),
+        db.func.sum(price),
+        db.func.sum(case((attended, 1), else_=0))
+    ).outerjoin(Meal, and_(Meal.day_of_week == Order.day_of_week, Meal.meal_type == Order.meal_type)) \
+        .filter(*period) \
+        .group_by(Order.serving_date, Order.meal_type).all()
+
+    for serving_date, meal_type, paid, revenue, attended_count in totals:
+        day = stats.get(serving_date)
+        if day is None or meal_type not in MEAL_TYPES:
+            continue
+        day["paid"][meal_type] += paid
+        day["revenue"][meal_type] += float(revenue or 0)
+        day["attended"][meal_type] += int(attended_count or 0)
+
+    recipes = db.session.query(
+        Order.serving_date,
+        Order.meal_ingredients,
+        db.func.count(Order.id),
+        db.func.sum(case((attended, 1), else_=0))
+    ).filter(*period).group_by(Order.serving_date, Order.meal_ingredients).all()
+
+    parsed = {}
+    for serving_date, recipe_json, paid, attended_count in recipes:
+        day = stats.get(serving_date)
+        if day is None:
+            continue
+        if recipe_json not in parsed:
+            try:
+                parsed[recipe_json] = [
+                    (item["name"], item["unit"], float(item["qty"]))
+                    for item in json.loads(recipe_json)
+                ]
+            except (ValueError, KeyError, TypeError):
+                parsed[recipe_json] = []
+
+        for name, unit, qty in parsed[recipe_json]:
+            usage = day["usage"].setdefault(name, {"unit": unit, "plan": 0.0, "fact": 0.0})
+            usage["unit"] = unit
+            usage["plan"] += qty * paid
+            usage["fact"] += qty * int(attended_count or 0)
+
+    return stats
+
+
+def _from_rollup(row):
+    return {
+        "paid": {"breakfast": row.breakfast_paid or 0, "lunch": row.lunch_paid or 0},
+        "revenue": {"breakfast": row.breakfast_revenue or 0.0, "lunch": row.lunch_revenue or 0.0},
+        "attended": {"breakfast": row.breakfast_attended or 0, "lunch": row.lunch_attended or 0},
+        "usage": row.ingredient_usage or {}
+    }
+
+
+def _to_rollup(serving_date, day):
+    return DailyReport(
+        serving_date=serving_date,
+        breakfast_paid=day["paid"]["breakfast"],
+        lunch_paid=day["paid"]["lunch"],
+        breakfast_revenue=day["revenue"]["breakfast"],
+        lunch_revenue=day["revenue"]["lunch"],
+        breakfast_attended=day["attended"]["breakfast"],
+        lunch_attended=day["attended"]["lunch"],
+        ingredient_usage=day["usage"]
+    )
+
+
+def get_daily_stats(start_date, end_date):
+    """Итоги по учебным дням периода: {date: {...}}.
+
+    Закрытые дни (до сегодняшнего) читаются из daily_reports и досчитываются
+    один раз, если итогов ещё нет; сегодняшний и будущие дни считаются вживую.
+    """
+    today = datetime.today().date()
+    stats = {}
+
+    closed_end = min(end_date, today - timedelta(days=1))
+    if start_date <= closed_end:
+        for row in DailyReport.query.filter(
+                DailyReport.serving_date >= start_date,
+                DailyReport.serving_date <= closed_end).all():
+            stats[row.serving_date] = _from_rollup(row)
+
+        missing = [day for day in _weekdays(start_date, closed_end) if day not in stats]
+        if missing:
+            computed = compute_daily_stats(missing[0], missing[-1])
+            for day in missing:
+                stats[day] = computed[day]
+                db.session.add(_to_rollup(day, computed[day]))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Параллельный запрос уже сохранил эти дни — итоги те же
+                db.session.rollback()
+
+    live_start = max(start_date, today)
+    if live_start <= end_date:
+        stats.update(compute_daily_stats(live_start, end_date))
+
+    return dict(sorted(stats.items()))
+
+
+def invalidate_daily_reports(*dates):
+    """Сбрасывает итоги закрытых дней после поздних изменений заказов.
+
+    Удаление попадает в текущую транзакцию и фиксируется её коммитом.
+    """
+    dates = {d for d in dates if d is not None}
+    if dates:
+        DailyReport.query.filter(DailyReport.serving_date.in_(dates)) \
+            .delete(synchronize_session=False)
+
+
+def invalidate_daily_reports_range(start_date, end_date):
+    """То же, что invalidate_daily_reports, но для диапазона дат"""
+    DailyReport.query.filter(
+        DailyReport.serving_date >= start_date,
+        DailyReport.serving_date <= end_date
+    ).delete(synchronize_session=False)
+
+
+# === ПЕРИОДЫ ПРОИЗВОЛЬНОЙ ДЛИНЫ ===
+
+GRANULARITIES = ("day", "week", "month")
+GRANULARITY_NAMES = {"auto": "Авто", "day": "По дням", "week": "По неделям", "month": "По месяцам"}
+
+# Больше точек на графике всё равно не различить — соседние интервалы объединяются
+CHART_MAX_POINTS = 60
+
+WEEKDAY_SHORT = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+MONTH_NAMES = ["Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+               "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"]
+
+
+def pick_granularity(start_date, end_date, requested=None):
+    """Шаг группировки: выбранный вручную или подходящий под длину периода"""
+    if requested in GRANULARITIES:
+        return requested
+    days = (end_date - start_date).days + 1
+    if days <= 31:
+        return "day"
+    if days <= 182:
+        return "week"
+    return "month"
+
+
+def bucket_start(day, granularity):
+    """Первый день интервала (дня, ISO-недели или месяца), в который попадает day"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _bucket_label(key, granularity, first, last):
+    if granularity == "week":
+        week = key.isocalendar()[1]
+        return f"{week:02d} нед. ({first.strftime('%d.%m')}–{last.strftime('%d.%m.%Y')})"
+    if granularity == "month":
+        return f"{MONTH_NAMES[key.month - 1]} {key.year}"
+    return f"{key.strftime('%d.%m.%Y')} {WEEKDAY_SHORT[key.weekday()]}"
+
+
+def bucket_daily_stats(daily_stats, granularity):
+    """Сворачивает итоги get_daily_stats в интервалы по датам, неделям или месяцам.
+
+    Возвращает упорядоченный словарь {первый день интервала: {...}}
+    с подписью, выручкой и посещаемостью по приёмам пищи.
+    """
+    buckets = {}
+    for day, stats in daily_stats.items():
+        key = bucket_start(day, granularity)
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = {
+                "first": day,
+                "last": day,
+                # Выручка копится в копейках и переводится в рубли в конце
+                "revenue": {"breakfast": 0, "lunch": 0, "total": 0},
+                "attendance": {"breakfast": 0, "lunch": 0, "total": 0}
+            }
+        bucket["first"] = min(bucket["first"], day)
+        bucket["last"] = max(bucket["last"], day)
+        for meal_type in MEAL_TYPES:
+            revenue = to_minor(stats["revenue"][meal_type])
+            bucket["revenue"][meal_type] += revenue
+            bucket["revenue"]["total"] += revenue
+            attended = stats["attended"][meal_type]
+            bucket["attendance"][meal_type] += attended
+            bucket["attendance"]["total"] += attended
+
+    for key, bucket in buckets.items():
+        bucket["label"] = _bucket_label(key, granularity, bucket["first"], bucket["last"])
+        bucket["revenue"] = {name: from_minor(value) for name, value in bucket["revenue"].items()}
+
+    return dict(sorted(buckets.items()))
+
+
+def downsample(labels, series, max_points=CHART_MAX_POINTS):
+    """Ограничивает длину рядов графика, суммируя соседние точки.
+
+    series — словарь {имя: список значений той же длины, что labels}.
+    Значения аддитивные (выручка, порции), поэтому группа точек заменяется
+    суммой, а подпись — диапазоном «первая – последняя».
+    """
+    if len(labels) <= max_points:
+        return list(labels), {name: list(values) for name, values in series.items()}
+
+    step = -(-len(labels) // max_points)  # деление с округлением вверх
+    out_labels = []
+    out_series = {name: [] for name in series}
+    for i in range(0, len(labels), step):
+        group = labels[i:i + step]
+        out_labels.append(group[0] if len(group) == 1 else f"{group[0]} – {group[-1]}")
+        for name, values in series.items():
+            out_series[name].append(sum(values[i:i + step]))
+    return out_labels, out_series
@@ -1,17 +1,40 @@
 # routes.py
-from flask import Blueprint, render_template, request, redirect, jsonify, flash, current_app, abort, url_for
+from flask import Blueprint, render_template, request, redirect, jsonify, flash, current_app, abort, url_for, Response
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from database import db
+from database import db, casefold
 from models import User, Meal, Order, Allergy, Review, PurchaseRequest, Ingredient, MealIngredient, Product, WriteOff, \
-    Notification, DeletionLog, FlexibleSubscription
+    Notification, DeletionLog, FlexibleSubscription, OrderWeek
+from notification_queue import dispatcher
+from menu_cache import get_weekly_menu, bump_menu_version
+from instrumentation import instrumentation
+from metrics import metrics, ORDERS_PAID, MEALS_COLLECTED, CREATE_NOTIFICATION_SECONDS
+from etags import (conditional, notifications_etag, subscription_etag, menu_etag,
+                   bump_notifications, bump_subscription, bump_notifications_after_commit)
+from avatars import process_avatar, save_avatar, remove_avatar_if_unused, AvatarError
+from purchase_plan import build_purchase_plan
+from passwords import generate_temporary_password, hasher, login_throttle, PasswordHasherBusy
+from archive import archive_students, recent_batches, undo_archive, ArchiveUndoError
+from bulk_payments import (select_students, bulk_top_up, bulk_assign_meals, serving_days, load_menu,
+                           BulkPaymentError, MAX_BULK_DAYS)
+from orders import insert_paid_orders
+import order_weeks
+from money import parse_money, money_sum, INGREDIENT_PRICE_PLACES
+from idempotency import idempotent
+from cancellations import cancel_days, CancellationError, MAX_CANCEL_DAYS
+from student_import import (read_table, parse_students, create_students, StudentImportError,
+                            CREDENTIALS_HEADER, MAX_IMPORT_ROWS)
+from exports import csv_response, REPORT_SECTIONS, PAYMENT_HEADER, payment_rows
+from reports import (get_daily_stats, invalidate_daily_reports, invalidate_daily_reports_range,
+                     pick_granularity, bucket_daily_stats, downsample, GRANULARITY_NAMES)
 from datetime import datetime, timedelta
 import json
 from collections import defaultdict
+import hmac
 import os
-from werkzeug.utils import secure_filename
 import re
 from functools import wraps
+from sqlalchemy import insert, select, func, and_, or_
+from sqlalchemy.orm import aliased
 import threading
 import time
 
@@ -26,8 +49,11 @@ DAY_NAMES_RU = {
 }
 
 
+# Учеников на одной странице архива
+ARCHIVE_PAGE_SIZE = 50
+
 # Глобальная константа
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -41,6 +67,7 @@ def delete_notification(notification_id, user_id):
     if notification:
         db.session.delete(notification)
         db.session.commit()
+        bump_notifications([user_id])
         return True
     return False
 
@@ -50,27 +77,40 @@ def delete_all_notifications(user_id):
     for notification in notifications:
         db.session.delete(notification)
     db.session.commit()
+    bump_notifications([user_id])
     return True
 
 def create_notification(user_id, title, message, type="info", order_id=None, request_id=None):
-    """Создаёт уведомление для пользователя"""
-    notification = Notification(
-        user_id=user_id,
-        title=title,
-        message=message,
-        type=type,
-        order_id=order_id,
-        request_id=request_id
-    )
-    db.session.add(notification)
-    db.session.commit()
-    return notification
+    """Ставит уведомление для пользователя в фоновую очередь записи"""
+    started = time.perf_counter()
+    dispatcher.submit({
+        'user_id': user_id,
+        'title': title,
+        'message': message,
+        'type': type,
+        'order_id': order_id,
+        'request_id': request_id
+    })
+    CREATE_NOTIFICATION_SECONDS.observe(time.perf_counter() - started)
 
 
 def create_bulk_notifications(user_ids, title, message, type="info"):
     """Создаёт уведомления для нескольких пользователей"""
-    for user_id in user_ids:
-        create_notification(user_id, title, message, type)
+    dispatcher.submit_many({
+        'user_id': user_id,
+        'title': title,
+        'message': message,
+        'type': type
+    } for user_id in user_ids)
+
+
+def broadcast_notification(roles, title, message, type="info", order_id=None, request_id=None,
+                           in_transaction=False):
+    """Рассылает уведомление всем активным пользователям ролей одним INSERT ... SELECT"""
+    dispatcher.broadcast(roles, title, message, type, order_id=order_id, request_id=request_id,
+                         in_transaction=in_transaction)
+    if in_transaction:
+        bump_notifications_after_commit(roles=roles)
 
 
 def mark_notification_read(notification_id, user_id):
@@ -79,14 +119,17 @@ def mark_notification_read(notification_id, user_id):
     if notification and not notification.is_read:
         notification.is_read = True
         db.session.commit()
+        bump_notifications([user_id])
         return True
     return False
 
 
 def mark_all_notifications_read(user_id):
     """Отмечает все уведомления пользователя как прочитанные"""
-    Notification.query.filter_by(user_id=user_id, is_read=False).update({'is_read': True})
+    updated = Notification.query.filter_by(user_id=user_id, is_read=False).update({'is_read': True})
     db.session.commit()
+    if updated:
+        bump_notifications([user_id])
 
 
 def get_unread_count(user_id):
@@ -103,14 +146,14 @@ def get_notifications(user_id, limit=20, offset=0):
 
 def calculate_full_subscription_price():
     """Рассчитывает полную стоимость абонемента на основе текущих цен в меню."""
-    total = 0.0
+    prices = []
     days = ["monday", "tuesday", "wednesday", "thursday", "friday"]
     for day in days:
         for meal_type in ["breakfast", "lunch"]:
             meal = Meal.query.filter_by(day_of_week=day, meal_type=meal_type).first()
             if meal and meal.price:
-                total += meal.price
-    return total
+                prices.append(meal.price)
+    return money_sum(prices)
 
 
 def get_date_for_day(day_of_week, target_week_offset=0):
@@ -194,6 +237,7 @@ def validate_password(password):
 # === МАРШРУТЫ УВЕДОМЛЕНИЙ ===
 
 @routes.route("/api/notifications/count")
+@conditional(notifications_etag)
 @login_required
 def get_notifications_count():
     """API: количество непрочитанных уведомлений"""
@@ -202,6 +246,7 @@ def get_notifications_count():
 
 
 @routes.route("/api/notifications")
+@conditional(notifications_etag)
 @login_required
 def get_notifications_api():
     """API: список уведомлений"""
@@ -314,10 +359,16 @@ def register():
             flash(error_msg, "error")
             return render_template("register.html")
 
+        try:
+            password_hash = hasher.generate(password)
+        except PasswordHasherBusy:
+            flash("⏳ Сервер перегружен, повторите регистрацию через несколько секунд.", "error")
+            return render_template("register.html"), 503, {"Retry-After": "5"}
+
         user = User(
             full_name=full_name,
             email=email,
-            password=generate_password_hash(password),
+            password=password_hash,
             role=role,
             class_name=class_name if role == "student" else None
         )
@@ -343,9 +394,24 @@ def login():
         if not email or not password:
             return render_template("login.html")
 
+        # Перебор паролей отсекаем до обращения к базе и хэширования
+        ip = request.remote_addr or ""
+        wait = login_throttle.retry_after(ip, email)
+        if wait:
+            flash(f"⏳ Слишком много неудачных попыток входа. Повторите через {wait} с.", "error")
+            return render_template("login.html"), 429, {"Retry-After": str(wait)}
+
         user = User.query.filter_by(email=email).first()
 
-        if user and check_password_hash(user.password, password):
+        try:
+            password_ok = user is not None and hasher.check(user.password, password)
+        except PasswordHasherBusy:
+            flash("⏳ Сейчас входит слишком много пользователей. Повторите через несколько секунд.", "error")
+            return render_template("login.html"), 503, {"Retry-After": "5"}
+
+        if password_ok:
+            login_throttle.success(ip, email)
+
             # === ДОПОЛНИТЕЛЬНАЯ ПРОВЕРКА: заблокированные аккаунты ===
             if not user.is_active:
                 flash("❌ Ваш аккаунт заблокирован. Обратитесь к администратору.", "error")
@@ -370,6 +436,7 @@ def login():
             else:
                 return redirect("/")
 
+        login_throttle.failure(ip, email)
         flash("❌ Неверный email или пароль", "error")
         return render_template("login.html")
 
@@ -457,25 +524,9 @@ def student():
     day_index_map = {0: "monday", 1: "tuesday", 2: "wednesday", 3: "thursday", 4: "friday", 5: "saturday", 6: "sunday"}
     current_day = day_index_map.get(today, None)
 
-    # === ЗАГРУЗКА МЕНЮ С ИНГРЕДИЕНТАМИ ===
-    meals = {day: {"breakfast": None, "lunch": None} for day in days}
-    for m in Meal.query.all():
-        if m.day_of_week in meals and m.meal_type in meals[m.day_of_week]:
-            # Загружаем ингредиенты для блюда
-            ingredients = []
-            for mi in MealIngredient.query.filter_by(meal_id=m.id).all():
-                ing = db.session.get(Ingredient, mi.ingredient_id)
-                if ing:
-                    ingredients.append({
-                        'name': ing.name,
-                        'quantity': mi.quantity,
-                        'unit': mi.unit
-                    })
-            meals[m.day_of_week][m.meal_type] = {
-                "name": m.name,
-                "price": m.price,
-                "ingredients": ingredients  # ← КЛЮЧЕВОЕ ДОБАВЛЕНИЕ
-            }
+    # === МЕНЮ С ИНГРЕДИЕНТАМИ (кэшируется до следующего изменения меню) ===
+    weekly_menu = get_weekly_menu()
+    meals = {day: weekly_menu.get(day) or {"breakfast": None, "lunch": None} for day in days}
 
     # === СОБИРАЕМ ОТЗЫВЫ С ПРИВЯЗКОЙ К НЕДЕЛЕ ===
     user_reviews_current = {}  # Только для текущей недели (неделя 0) для начального отображения
@@ -497,7 +548,10 @@ def student():
             key = f"{r.day_of_week}_{r.meal_type}_{r.week_number}"
         user_reviews_all[key] = r.text
 
-    orders = Order.query.filter_by(student_id=current_user.id).all()
+    # === Маски заказов по неделям: строка на неделю вместо всех заказов ученика ===
+    weeks = order_weeks.load(current_user.id)
+    this_monday = order_weeks.week_start(datetime.today().date())
+    paid_mask, collected_mask, confirmed_mask = weeks.get(this_monday, (0, 0, 0))
 
     # === Расчёт стоимости абонемента (только будни) ===
     today_weekday = datetime.today().weekday()
@@ -506,56 +560,61 @@ def student():
         full_subscription_price = 0.0
         for day in remaining_days:
             for mt in ["breakfast", "lunch"]:
-                meal = Meal.query.filter_by(day_of_week=day, meal_type=mt).first()
-                if meal and meal.price:
-                    full_subscription_price += meal.price
+                meal = weekly_menu[day][mt]
+                if meal and meal["price"]:
+                    full_subscription_price += meal["price"]
     else:
         full_subscription_price = 0.0
 
+    # Уже оплаченные приёмы оставшихся дней текущей недели
     paid_sum = 0.0
-    for order in orders:
-        if order.status == "paid" and order.paid_at is not None:
-            if today_weekday <= 4:
-                try:
-                    day_index = ["monday", "tuesday", "wednesday", "thursday", "friday"].index(order.day_of_week)
-                    if day_index >= today_weekday:
-                        meal = Meal.query.filter_by(day_of_week=order.day_of_week, meal_type=order.meal_type).first()
-                        if meal and meal.price:
-                            paid_sum += meal.price
-                except ValueError:
-                    pass
+    if today_weekday <= 4:
+        for day in remaining_days:
+            for mt in ["breakfast", "lunch"]:
+                meal = weekly_menu[day][mt]
+                if paid_mask & order_weeks.day_bit(day, mt) and meal and meal["price"]:
+                    paid_sum += meal["price"]
 
     remaining_subscription_price = max(0.0, full_subscription_price - paid_sum)
 
-    # === Расчёт статусов оплаты с привязкой к неделям ===
-    order_status = {}
-    paid_keys_simple = []
-
-    all_orders = Order.query.filter_by(student_id=current_user.id).all()
-
-    for o in all_orders:
-        if o.serving_date:
-            serving_week = o.serving_date.isocalendar()[1]
-            current_week = datetime.now().date().isocalendar()[1]
-            week_offset = serving_week - current_week
-
-            # Показываем статусы для текущей и ближайших 3 недель
-            if -52 <= week_offset <= 52:
-                key = f"{o.day_of_week}_{o.meal_type}_{week_offset}"
-                order_status[key] = {
-                    'paid': o.status == 'paid',
-                    'consumed': o.is_collected,
-                    'student_confirmed': o.student_confirmed,  # ученик подтвердил
-                    'date': o.serving_date.strftime('%d.%m.%Y'),
-                    'order_id': o.id  # для кнопки подтверждения
+    # === Статусы оплаты по неделям: {смещение недели: [оплачено, выдано, подтверждено]} ===
+    week_masks = {}
+    for monday, masks in weeks.items():
+        week_offset = (monday - this_monday).days // 7
+        if -52 <= week_offset <= 52:
+            week_masks[week_offset] = list(masks)
+
+    # Текущая неделя для шаблона. id заказа нужен только кнопке «Подтвердить получение» —
+    # заказы читаются, лишь если есть выданные и не подтверждённые приёмы
+    unconfirmed = {}
+    if collected_mask & ~confirmed_mask:
+        unconfirmed = {(o.serving_date, o.meal_type): o.id for o in Order.query.filter(
+            Order.student_id == current_user.id,
+            Order.status == "paid",
+            Order.is_collected == True,
+            Order.student_confirmed == False,
+            Order.serving_date >= this_monday,
+            Order.serving_date <= this_monday + timedelta(days=4)
+        )}
+    week_slots = {}
+    for i, day in enumerate(order_weeks.WEEKDAY_NAMES):
+        for mt in order_weeks.MEAL_TYPES:
+            bit = order_weeks.day_bit(day, mt)
+            if paid_mask & bit:
+                week_slots[f"{day}_{mt}"] = {
+                    'paid': True,
+                    'consumed': bool(collected_mask & bit),
+                    'student_confirmed': bool(confirmed_mask & bit),
+                    'order_id': unconfirmed.get((this_monday + timedelta(days=i), mt), 0)
                 }
 
-            # Для простой проверки оплаты (без привязки к неделе)
-            if o.status == 'paid' and o.paid_at is not None:
-                paid_keys_simple.append(f"{o.day_of_week}_{o.meal_type}")
+    # Приёмы, уже оплаченные на неделю разовой оплаты (в выходные — следующую)
+    pay_week_paid = weeks.get(order_weeks.week_start(get_date_for_day("monday")), (0, 0, 0))[0]
+    paid_keys_simple = [f"{day}_{mt}" for day in order_weeks.WEEKDAY_NAMES for mt in order_weeks.MEAL_TYPES
+                        if pay_week_paid & order_weeks.day_bit(day, mt)]
 
-    paid_count = len([o for o in orders if o.status == "paid" and o.paid_at is not None])
-    consumed_count = len([o for o in orders if o.is_collected])
+    paid_count = sum(order_weeks.count_slots(paid) for paid, _, _ in weeks.values())
+    consumed_count = sum(order_weeks.count_slots(collected) for _, collected, _ in weeks.values())
     total_possible = 10
 
     return render_template(
@@ -564,7 +623,8 @@ def student():
         day_names=day_names,
         meals=meals,
         current_allergy=current_allergy,
-        order_status=order_status,
+        order_weeks=week_masks,
+        week_slots=week_slots,
         paid_count=paid_count,
         consumed_count=consumed_count,
         total_possible=total_possible,
@@ -696,6 +756,7 @@ def submit_review():
 
 @routes.route("/pay", methods=["POST"])
 @login_required
+@idempotent
 def pay():
     if current_user.role != "student":
         return redirect("/student")
@@ -704,10 +765,20 @@ def pay():
     days = ["monday", "tuesday", "wednesday", "thursday", "friday"]
     meal_types = ["breakfast", "lunch"]
 
-    # Получаем все заказы ученика
-    all_orders = Order.query.filter_by(student_id=current_user.id).all()
-    paid_orders = [o for o in all_orders if o.status == "paid" and o.paid_at is not None]
-    paid_keys = {(o.day_of_week, o.meal_type) for o in paid_orders}
+    # Даты текущей учебной недели (в выходные — следующей)
+    week_dates = {day: get_date_for_day(day) for day in days}
+
+    # Оплаченные приёмы этой недели — по датам питания, одним запросом
+    paid_keys = {
+        (days[serving_date.weekday()], meal_type)
+        for serving_date, meal_type in db.session.execute(
+            select(Order.serving_date, Order.meal_type).where(
+                Order.student_id == current_user.id,
+                Order.serving_date.in_(week_dates.values()),
+                Order.status == "paid"
+            )
+        )
+    }
 
     # === Проверка: всё уже оплачено? ===
     all_possible = {(d, mt) for d in days for mt in meal_types}
@@ -728,10 +799,11 @@ def pay():
             flash(f"{'Завтрак' if meal_type == 'breakfast' else 'Обед'} на {DAY_NAMES_RU[day]} уже оплачен.", "error")
             return redirect("/student")
 
-        meal = Meal.query.filter_by(day_of_week=day, meal_type=meal_type).first()
-        if not meal:
+        menu = load_menu([meal_type])
+        if (day, meal_type) not in menu:
             flash("Меню не найдено.", "error")
             return redirect("/student")
+        meal, ingredients = menu[(day, meal_type)]
 
         total_price = meal.price
 
@@ -739,36 +811,30 @@ def pay():
             flash(f"Недостаточно средств! Требуется {total_price} ₽, доступно: {current_user.balance} ₽", "error")
             return redirect("/student")
 
-        # === Собираем ингредиенты на момент оплаты ===
-        ingredients_list = []
-        for mi in MealIngredient.query.filter_by(meal_id=meal.id).all():
-            ing = db.session.get(Ingredient, mi.ingredient_id)
-            if ing:
-                ingredients_list.append({
-                    "name": ing.name,
-                    "qty": mi.quantity,
-                    "unit": mi.unit
-                })
-
-        # Создаём заказ с фиксацией данных
-        serving_date = get_date_for_day(day)
-        order = Order(
-            student_id=current_user.id,
-            day_of_week=day,
-            meal_type=meal_type,
-            serving_date=serving_date,
-            status="paid",
-            paid_at=datetime.utcnow(),
-            meal_name=meal.name,
-            meal_price=meal.price,
-            meal_ingredients=json.dumps(ingredients_list, ensure_ascii=False),
-            payment_source='single'  # ← РАЗОВАЯ ОПЛАТА
-        )
-        db.session.add(order)
+        # Создаём заказ с фиксацией данных; повторную оплату отсекает уникальный индекс
+        serving_date = week_dates[day]
+        inserted = insert_paid_orders([{
+            "student_id": current_user.id,
+            "day_of_week": day,
+            "meal_type": meal_type,
+            "serving_date": serving_date,
+            "paid_at": datetime.utcnow(),
+            "meal_name": meal.name,
+            "meal_price": meal.price,
+            "meal_ingredients": ingredients,
+            "payment_source": "single"  # ← РАЗОВАЯ ОПЛАТА
+        }])
+        if not inserted:
+            # Тот же приём успел оплатить параллельный запрос (двойное нажатие)
+            db.session.rollback()
+            flash(f"{'Завтрак' if meal_type == 'breakfast' else 'Обед'} на {DAY_NAMES_RU[day]} уже оплачен.", "error")
+            return redirect("/student")
 
         current_user.balance -= total_price
+        invalidate_daily_reports(serving_date)
 
         db.session.commit()
+        ORDERS_PAID.inc(source="single")
 
         # === УВЕДОМЛЕНИЕ УЧЕНИКУ ===
         create_notification(
@@ -776,7 +842,7 @@ def pay():
             title="✅ Оплата прошла успешно",
             message=f"{'Завтрак' if meal_type == 'breakfast' else 'Обед'} на {DAY_NAMES_RU[day]} оплачен. Сумма: {total_price} ₽",
             type="success",
-            order_id=order.id
+            order_id=inserted[0].id
         )
 
         flash(f"{'Завтрак' if meal_type == 'breakfast' else 'Обед'} на {DAY_NAMES_RU[day]} оплачен!", "success")
@@ -809,53 +875,42 @@ def pay():
             flash("Все оставшиеся приёмы уже оплачены!", "error")
             return redirect("/student")
 
+        # Меню и рецепты — одним набором запросов на всю неделю
+        menu = load_menu(meal_types)
+        meals_to_create = [(day, mt) for day, mt in unpaid_keys if (day, mt) in menu]  # без меню — пропускаем
+
         # Рассчитываем стоимость
-        total_price = 0.0
-        meals_to_create = []
-        for day, mt in unpaid_keys:
-            meal = Meal.query.filter_by(day_of_week=day, meal_type=mt).first()
-            price = meal.price if meal and meal.price else 0.0
-            total_price += price
-            meals_to_create.append((day, mt))
+        total_price = money_sum(menu[key][0].price for key in meals_to_create)
 
         if current_user.balance < total_price:
             flash(f"Недостаточно средств! Требуется {total_price:.2f} ₽, доступно: {current_user.balance} ₽", "error")
             return redirect("/student")
 
-        # Создаём заказы с фиксацией рецепта
-        for day, mt in meals_to_create:
-            meal = Meal.query.filter_by(day_of_week=day, meal_type=mt).first()
-            if not meal:
-                continue  # пропускаем, если меню отсутствует
-
-            # Собираем ингредиенты
-            ingredients_list = []
-            for mi in MealIngredient.query.filter_by(meal_id=meal.id).all():
-                ing = db.session.get(Ingredient, mi.ingredient_id)
-                if ing:
-                    ingredients_list.append({
-                        "name": ing.name,
-                        "qty": mi.quantity,
-                        "unit": mi.unit
-                    })
-
-            serving_date = get_date_for_day(day)
-            db.session.add(Order(
-                student_id=current_user.id,
-                day_of_week=day,
-                meal_type=mt,
-                serving_date=serving_date,
-                status="paid",
-                paid_at=datetime.utcnow(),
-                meal_name=meal.name,
-                meal_price=meal.price,
-                meal_ingredients=json.dumps(ingredients_list, ensure_ascii=False)
-            ))
+        # Создаём заказы с фиксацией рецепта одной командой; уже оплаченные приёмы пропускаются базой
+        paid_at = datetime.utcnow()
+        inserted = insert_paid_orders([{
+            "student_id": current_user.id,
+            "day_of_week": day,
+            "meal_type": mt,
+            "serving_date": week_dates[day],
+            "paid_at": paid_at,
+            "meal_name": menu[(day, mt)][0].name,
+            "meal_price": menu[(day, mt)][0].price,
+            "meal_ingredients": menu[(day, mt)][1],
+            "payment_source": "single"
+        } for day, mt in meals_to_create])
+        orders_count = len(inserted)
+        # Списываем только за действительно созданные заказы
+        total_price = money_sum(row.meal_price for row in inserted)
 
         current_user.balance -= total_price
         current_user.has_subscription = True  # ← помечаем, что абонемент куплен
+        if inserted:
+            invalidate_daily_reports_range(min(row.serving_date for row in inserted),
+                                           max(row.serving_date for row in inserted))
 
         db.session.commit()
+        ORDERS_PAID.inc(orders_count, source="single")
 
         # === УВЕДОМЛЕНИЕ УЧЕНИКУ ===
         create_notification(
@@ -883,7 +938,7 @@ def topup():
         return redirect("/student")
 
     try:
-        amount = float(request.form.get("amount", 0))
+        amount = parse_money(request.form.get("amount", 0))
         if amount > 0 and amount <= 10000:  # ограничение на разумную сумму
             current_user.balance += amount
             db.session.commit()
@@ -1074,11 +1129,8 @@ def request_product():
     db.session.commit()
 
     # === УВЕДОМЛЕНИЯ АДМИНИСТРАТОРАМ ===
-    admin_users = User.query.filter_by(role="admin").all()
-    admin_ids = [admin.id for admin in admin_users]
-
-    create_bulk_notifications(
-        admin_ids,
+    broadcast_notification(
+        ["admin"],
         title="📦 Новая заявка на закупку",
         message=f"Повар {current_user.full_name} отправил заявку на закупку: {ingredient.name} — {quantity} {unit}",
         type="info"
@@ -1168,7 +1220,9 @@ def mark_collected():
     # Отмечаем заказ как выданный
     order.is_collected = True
     order.consumed_at = datetime.utcnow()
+    order_weeks.mark([(order.student_id, order.serving_date, order.meal_type)], "collected")
     db.session.commit()
+    MEALS_COLLECTED.inc()
 
     # Уведомление ученику - ПРОСИМ ПОДТВЕРДИТЬ
     create_notification(
@@ -1185,6 +1239,7 @@ def mark_collected():
 
 @routes.route("/cook/submit_bulk_request", methods=["POST"])
 @login_required
+@idempotent
 def submit_bulk_request():
     if current_user.role != "cook":
         return jsonify({"error": "Доступ запрещён"}), 403
@@ -1194,11 +1249,9 @@ def submit_bulk_request():
         if not isinstance(requests_data, list):
             return jsonify({"error": "Неверный формат данных"}), 400
 
-        # Получаем администраторов
-        admin_users = User.query.filter_by(role="admin").all()
-        admin_ids = [admin.id for admin in admin_users]
-
         # Обработка заявок
+        now = datetime.utcnow()
+        rows = []
         for item in requests_data:
             product_name = item.get("product", "").strip()
             quantity_str = item.get("quantity", "0")
@@ -1217,31 +1270,35 @@ def submit_bulk_request():
 
             full_product_name = f"{product_name} ({unit})" if unit else product_name
 
-            # Создаём заявку
-            request_obj = PurchaseRequest(
-                cook_id=current_user.id,
-                product=full_product_name,
-                quantity=quantity,
-                unit=unit,
-                status="pending"
-            )
-            db.session.add(request_obj)
-            db.session.flush()  # Получаем ID
+            rows.append({
+                "cook_id": current_user.id,
+                "product": full_product_name,
+                "quantity": quantity,
+                "unit": unit,
+                "status": "pending",
+                "timestamp": now
+            })
 
-            # Отправляем уведомления администраторам
-            for admin_id in admin_ids:
-                create_notification(
-                    user_id=admin_id,
-                    title="📦 Новая заявка на закупку",
-                    message=f"Повар {current_user.full_name} отправил заявку на закупку: {full_product_name} — {quantity} {unit}",
-                    type="info",
-                    request_id=request_obj.id
-                )
+        if not rows:
+            return jsonify({"error": "В заявке нет корректных позиций"}), 400
+
+        # Все позиции корзины — одним INSERT
+        db.session.execute(insert(PurchaseRequest), rows)
+
+        # Одно сводное уведомление администраторам в той же транзакции
+        items_text = "; ".join(f"{row['product']} — {row['quantity']} {row['unit']}" for row in rows)
+        broadcast_notification(
+            ["admin"],
+            title=f"📦 Новая заявка на закупку ({len(rows)} поз.)",
+            message=f"Повар {current_user.full_name} отправил заявку на закупку: {items_text}",
+            type="info",
+            in_transaction=True
+        )
 
         db.session.commit()
         return jsonify({
             "success": True,
-            "message": f"Заявка отправлена! Создано заявок: {len(requests_data)}"
+            "message": f"Заявка отправлена! Создано заявок: {len(rows)}"
         }), 200
 
     except Exception as e:
@@ -1250,6 +1307,20 @@ def submit_bulk_request():
         return jsonify({"error": "Ошибка при сохранении заявки"}), 500
 
 
+@routes.route("/cook/purchase_plan")
+@login_required
+def purchase_plan():
+    """API: план закупки по оплаченным заказам на ближайшие учебные дни"""
+    if current_user.role != "cook":
+        return jsonify({"error": "Доступ запрещён"}), 403
+
+    days = request.args.get("days", 5, type=int)
+    days = max(1, min(days, 200))  # не больше учебного года
+
+    plan = build_purchase_plan(days)
+    return jsonify({"success": True, **plan})
+
+
 @routes.route("/admin", methods=["GET", "POST"])
 @login_required
 def admin():
@@ -1307,41 +1378,21 @@ def admin():
     total_students = len(active_students)
     max_possible = total_students * 10  # 5 дней × 2 приёма = 10
 
-    # 2️⃣ Оплаченные заказы ЗА ТЕКУЩУЮ НЕДЕЛЮ (только будние дни)
-    paid_orders_week = Order.query.filter(
-        Order.status == "paid",
-        Order.serving_date >= monday,
-        Order.serving_date <= friday
-    ).all()
-    total_paid = len(paid_orders_week)
+    # 2️⃣ Маски заказов ЗА ТЕКУЩУЮ НЕДЕЛЮ — строка на ученика вместо заказов
+    week_masks = {student_id: (paid, confirmed) for student_id, paid, confirmed in db.session.execute(
+        select(OrderWeek.student_id, OrderWeek.paid, OrderWeek.confirmed).where(OrderWeek.week_start == monday)
+    )}
+    total_paid = sum(order_weeks.count_slots(paid) for paid, _ in week_masks.values())
 
-    # 3️⃣ Полученные заказы ЗА ТЕКУЩУЮ НЕДЕЛЮ
-    collected_orders_week = Order.query.filter(
-        Order.status == "paid",
-        Order.student_confirmed == True,
-        Order.serving_date >= monday,
-        Order.serving_date <= friday
-    ).all()
-    total_consumed = len(collected_orders_week)
+    # 3️⃣ Полученные (подтверждённые учеником) заказы ЗА ТЕКУЩУЮ НЕДЕЛЮ
+    total_consumed = sum(order_weeks.count_slots(confirmed) for _, confirmed in week_masks.values())
 
     # 4️⃣ Статистика по ученикам — только активные
     student_stats = []
     for student in active_students:
-        # Считаем оплаченные и полученные ТОЛЬКО за текущую неделю
-        paid_week = Order.query.filter(
-            Order.student_id == student.id,
-            Order.status == "paid",
-            Order.serving_date >= monday,
-            Order.serving_date <= friday
-        ).count()
-
-        consumed_week = Order.query.filter(
-            Order.student_id == student.id,
-            Order.status == "paid",
-            Order.student_confirmed == True,
-            Order.serving_date >= monday,
-            Order.serving_date <= friday
-        ).count()
+        paid_mask, confirmed_mask = week_masks.get(student.id, (0, 0))
+        paid_week = order_weeks.count_slots(paid_mask)
+        consumed_week = order_weeks.count_slots(confirmed_mask)
 
         # Максимум за неделю: 10 приёмов
         attendance_pct = round((consumed_week / 10) * 100) if 10 > 0 else 0
@@ -1391,7 +1442,7 @@ def admin_menu():
                 price_str = request.form.get(f"{day}_{meal_type}_price", "").strip()
 
                 try:
-                    price = float(price_str) if price_str else 0.0
+                    price = parse_money(price_str) if price_str else 0.0
                 except ValueError:
                     price = 0.0
 
@@ -1448,13 +1499,11 @@ def admin_menu():
                     idx += 1
 
         db.session.commit()
+        bump_menu_version()
 
         # === УВЕДОМЛЕНИЕ ВСЕМ ПОЛЬЗОВАТЕЛЯМ ОБ ИЗМЕНЕНИИ МЕНЮ ===
-        all_users = User.query.filter(User.role.in_(["student", "cook"])).all()
-        user_ids = [user.id for user in all_users]
-
-        create_bulk_notifications(
-            user_ids,
+        broadcast_notification(
+            ["student", "cook"],
             title="🍽️ Меню обновлено",
             message="Администратор обновил меню на неделю. Проверьте актуальное меню в своём кабинете.",
             type="info"
@@ -1510,19 +1559,17 @@ def admin_prices():
         for ing in ingredients:
             price_str = request.form.get(f"price_{ing.id}", "0")
             try:
-                price = float(price_str) if price_str else 0.0
+                price = parse_money(price_str, INGREDIENT_PRICE_PLACES) if price_str else 0.0
             except ValueError:
                 price = 0.0
             ing.price_per_unit = max(0.0, price)
 
         db.session.commit()
+        bump_menu_version()
 
         # === УВЕДОМЛЕНИЕ ПОВАРАМ ОБ ИЗМЕНЕНИИ ЦЕН ===
-        cook_users = User.query.filter_by(role="cook").all()
-        cook_ids = [cook.id for cook in cook_users]
-
-        create_bulk_notifications(
-            cook_ids,
+        broadcast_notification(
+            ["cook"],
             title="💰 Цены на продукты обновлены",
             message="Администратор обновил цены на продукты. Проверьте актуальные цены при формировании заявок.",
             type="info"
@@ -1563,13 +1610,10 @@ def write_off():
             db.session.commit()
 
             # === УВЕДОМЛЕНИЕ АДМИНИСТРАТОРАМ О СПИСАНИИ ===
-            admin_users = User.query.filter_by(role="admin").all()
-            admin_ids = [admin.id for admin in admin_users]
-
             cost = qty * ingredient.price_per_unit
 
-            create_bulk_notifications(
-                admin_ids,
+            broadcast_notification(
+                ["admin"],
                 title="🗑️ Продукт списан",
                 message=f"Повар {current_user.full_name} списал {qty} {product.unit} продукта «{ingredient.name}». Причина: {reason}. Стоимость: {cost:.2f} ₽",
                 type="warning"
@@ -1616,11 +1660,8 @@ def request_purchase():
     db.session.commit()
 
     # === УВЕДОМЛЕНИЕ АДМИНИСТРАТОРАМ ===
-    admin_users = User.query.filter_by(role="admin").all()
-    admin_ids = [admin.id for admin in admin_users]
-
-    create_bulk_notifications(
-        admin_ids,
+    broadcast_notification(
+        ["admin"],
         title="📦 Новая заявка на закупку",
         message=f"Повар {current_user.full_name} отправил заявку на закупку: {product_name} — {quantity} {unit}",
         type="info"
@@ -1630,16 +1671,8 @@ def request_purchase():
     return redirect("/cook")
 
 
-@routes.route("/admin/reports", methods=["GET", "POST"])
-@login_required
-def admin_reports():
-    if current_user.role != "admin":
-        return redirect("/")
-
-    from datetime import datetime, timedelta
-    from collections import defaultdict
-
-    # === Определение периода отчёта ===
+def get_report_period():
+    """Период отчёта из формы или URL; по умолчанию — текущая неделя (пн-пт)"""
     today = datetime.today().date()
     default_start = today - timedelta(days=today.weekday())  # понедельник текущей недели
     default_end = default_start + timedelta(days=4)  # пятница
@@ -1654,104 +1687,58 @@ def admin_reports():
             end_date = datetime.strptime(end_str, "%Y-%m-%d").date()
             if start_date > end_date:
                 raise ValueError("Начало позже конца")
-        else:
-            start_date = default_start
-            end_date = default_end
-    except:
-        # При ошибке — используем текущую неделю
-        start_date = default_start
-        end_date = default_end
+            return start_date, end_date
+    except ValueError:
+        pass
 
-    # === Финансовый отчёт ===
-    revenue_by_day = {}
-    total_revenue = 0.0
+    # При ошибке — используем текущую неделю
+    return default_start, default_end
 
-    paid_orders = Order.query.filter(
-        Order.status == "paid",
-        Order.paid_at.isnot(None),
-        Order.serving_date >= start_date,
-        Order.serving_date <= end_date
-    ).all()
 
-    # Группируем по дням (только будни)
-    weekdays = ["monday", "tuesday", "wednesday", "thursday", "friday"]
-    day_names_map = {
-        "monday": "Пн", "tuesday": "Вт", "wednesday": "Ср",
-        "thursday": "Чт", "friday": "Пт"
-    }
+@routes.route("/admin/reports", methods=["GET", "POST"])
+@login_required
+def admin_reports():
+    if current_user.role != "admin":
+        return redirect("/")
 
-    # Инициализируем все дни в периоде
-    current = start_date
-    while current <= end_date:
-        if current.weekday() < 5:  # только пн-пт
-            day_key = weekdays[current.weekday()]
-            revenue_by_day[day_key] = {"breakfast": 0.0, "lunch": 0.0, "total": 0.0}
-        current += timedelta(days=1)
-
-    for order in paid_orders:
-        if order.serving_date.weekday() >= 5:
-            continue  # пропускаем выходные
-
-        day_key = weekdays[order.serving_date.weekday()]
-        meal = Meal.query.filter_by(day_of_week=day_key, meal_type=order.meal_type).first()
-        price = meal.price if meal else 0.0
-
-        if day_key in revenue_by_day:
-            revenue_by_day[day_key][order.meal_type] += price
-            revenue_by_day[day_key]["total"] += price
-            total_revenue += price
-
-    # === Посещаемость ===
-    attendance_by_day = {k: {"breakfast": 0, "lunch": 0, "total": 0} for k in revenue_by_day.keys()}
-
-    collected_orders = [o for o in paid_orders if o.is_collected and o.student_confirmed]
-    for order in collected_orders:
-        if order.serving_date.weekday() >= 5:
-            continue
+    from datetime import datetime, timedelta
+    from collections import defaultdict
+
+    # === Определение периода отчёта ===
+    start_date, end_date = get_report_period()
+
+    # === Итоги по дням: закрытые дни из кэша, сегодня и далее — вживую ===
+    daily_stats = get_daily_stats(start_date, end_date)
 
-        day_key = weekdays[order.serving_date.weekday()]
-        if day_key in attendance_by_day:
-            attendance_by_day[day_key][order.meal_type] += 1
-            attendance_by_day[day_key]["total"] += 1
+    # === Группировка по датам, ISO-неделям или месяцам ===
+    granularity = pick_granularity(start_date, end_date, request.values.get("granularity"))
+    buckets = bucket_daily_stats(daily_stats, granularity)
+
+    # === Финансовый отчёт и посещаемость ===
+    revenue_by_day = {key: bucket["revenue"] for key, bucket in buckets.items()}
+    attendance_by_day = {key: bucket["attendance"] for key, bucket in buckets.items()}
+    day_names_map = {key: bucket["label"] for key, bucket in buckets.items()}
+    total_revenue = money_sum(item["total"] for item in revenue_by_day.values())
 
     # === ПЛАН vs ФАКТ (на основе заказов в периоде) ===
-    ingredient_prices = {ing.id: ing.price_per_unit for ing in Ingredient.query.all()}
+    all_ingredients = Ingredient.query.all()
+    ingredient_prices = {ing.id: ing.price_per_unit for ing in all_ingredients}
+    prices_by_name = {ing.name: ing.price_per_unit for ing in all_ingredients}
 
-    # План = сумма всех оплаченных заказов в периоде
+    # План = все оплаченные заказы в периоде, факт = выданные и подтверждённые
     plan_usage = defaultdict(lambda: {"quantity": 0.0, "unit": "г", "cost": 0.0})
-    for order in paid_orders:
-        try:
-            ingredients = json.loads(order.meal_ingredients)
-            for ing in ingredients:
-                name = ing["name"]
-                qty = float(ing["qty"])
-                unit = ing["unit"]
-                ingredient_obj = Ingredient.query.filter_by(name=name).first()
-                price_per = ingredient_obj.price_per_unit if ingredient_obj else 0.0
-                cost = qty * price_per
-                plan_usage[name]["quantity"] += qty
-                plan_usage[name]["unit"] = unit
-                plan_usage[name]["cost"] += cost
-        except:
-            continue
-
-    # Факт = сумма выданных заказов в периоде
     usage = defaultdict(lambda: {"quantity": 0.0, "unit": "г", "cost": 0.0})
-    for order in collected_orders:
-        try:
-            ingredients = json.loads(order.meal_ingredients)
-            for ing in ingredients:
-                name = ing["name"]
-                qty = float(ing["qty"])
-                unit = ing["unit"]
-                ingredient_obj = Ingredient.query.filter_by(name=name).first()
-                price_per = ingredient_obj.price_per_unit if ingredient_obj else 0.0
-                cost = qty * price_per
-                usage[name]["quantity"] += qty
-                usage[name]["unit"] = unit
-                usage[name]["cost"] += cost
-        except:
-            continue
+    for day_stats in daily_stats.values():
+        for name, item in day_stats["usage"].items():
+            price_per = prices_by_name.get(name, 0.0)
+            if item["plan"]:
+                plan_usage[name]["quantity"] += item["plan"]
+                plan_usage[name]["unit"] = item["unit"]
+                plan_usage[name]["cost"] += item["plan"] * price_per
+            if item["fact"]:
+                usage[name]["quantity"] += item["fact"]
+                usage[name]["unit"] = item["unit"]
+                usage[name]["cost"] += item["fact"] * price_per
 
     # Объединяем план и факт
     plan_vs_fact = []
@@ -1852,11 +1839,18 @@ def admin_reports():
     deficit_details.sort(key=lambda x: x["cost"], reverse=True)
 
     # === Подготовка данных для графиков ===
-    chart_days_keys = list(revenue_by_day.keys())  # ["monday", "tuesday", ...]
-    chart_days = [day_names_map[day] for day in chart_days_keys]  # ["Пн", "Вт", ...]
-    chart_revenue = [revenue_by_day[day]["total"] for day in chart_days_keys]
-    chart_breakfasts = [attendance_by_day[day]["breakfast"] for day in chart_days_keys]
-    chart_lunches = [attendance_by_day[day]["lunch"] for day in chart_days_keys]
+    # Ряды графиков ограничены CHART_MAX_POINTS точками при любой длине периода
+    chart_days, chart_series = downsample(
+        [day_names_map[key] for key in buckets],
+        {
+            "revenue": [revenue_by_day[key]["total"] for key in buckets],
+            "breakfasts": [attendance_by_day[key]["breakfast"] for key in buckets],
+            "lunches": [attendance_by_day[key]["lunch"] for key in buckets]
+        }
+    )
+    chart_revenue = chart_series["revenue"]
+    chart_breakfasts = chart_series["breakfasts"]
+    chart_lunches = chart_series["lunches"]
 
     top_10_plan_vs_fact = plan_vs_fact[:10]
 
@@ -1864,7 +1858,9 @@ def admin_reports():
         "admin_reports.html",
         start_date=start_date.strftime("%Y-%m-%d"),
         end_date=end_date.strftime("%Y-%m-%d"),
-        days=list(revenue_by_day.keys()),
+        granularity=request.values.get("granularity") or "auto",
+        granularity_names=GRANULARITY_NAMES,
+        days=list(buckets.keys()),
         day_names=day_names_map,
         revenue_by_day=revenue_by_day,
         attendance_by_day=attendance_by_day,
@@ -1886,6 +1882,46 @@ def admin_reports():
     )
 
 
+@routes.route("/admin/reports/export/<section>.csv")
+@login_required
+def admin_reports_export(section):
+    """Потоковая выгрузка раздела отчёта в CSV"""
+    if current_user.role != "admin":
+        return redirect("/")
+
+    if section not in REPORT_SECTIONS:
+        abort(404)
+
+    start_date, end_date = get_report_period()
+    title, header, rows = REPORT_SECTIONS[section]
+    filename = f"{title}_{start_date.strftime('%Y-%m-%d')}_{end_date.strftime('%Y-%m-%d')}.csv"
+    return csv_response(filename, header, rows(start_date, end_date))
+
+
+@routes.route("/admin/metrics/requests")
+@login_required
+def admin_request_metrics():
+    """API: число SQL-запросов, время и загруженные объекты по маршрутам"""
+    if current_user.role != "admin":
+        return jsonify({"success": False, "error": "Доступ запрещён"}), 403
+
+    return jsonify({"success": True, **instrumentation.snapshot()})
+
+
+@routes.route("/admin/metrics")
+def admin_metrics():
+    """Метрики в формате Prometheus: для администратора или по METRICS_TOKEN"""
+    token = current_app.config.get("METRICS_TOKEN")
+    # compare_digest принимает str только из ASCII — сравниваем байты. Заголовок
+    # WSGI приходит строкой latin-1, поэтому latin-1 возвращает исходные байты
+    by_token = bool(token) and hmac.compare_digest(
+        request.headers.get("Authorization", "").encode("latin-1", "replace"), f"Bearer {token}".encode("utf-8"))
+    if not by_token and not (current_user.is_authenticated and current_user.role == "admin"):
+        abort(403)
+
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @routes.route('/upload_avatar', methods=['POST'])
 @login_required
 def upload_avatar():
@@ -1899,27 +1935,29 @@ def upload_avatar():
         flash('⚠️ Файл не выбран', 'warning')
         return redirect('/student')
 
-    if file and allowed_file(file.filename):
-        # Удаляем старую аватарку (если не стандартная)
-        if current_user.avatar_filename != 'default_avatar.png':
-            old_path = os.path.join(current_app.config['AVATARS_FOLDER'], current_user.avatar_filename)
-            if os.path.exists(old_path):
-                os.remove(old_path)
+    if not allowed_file(file.filename):
+        flash('❌ Недопустимый формат файла. Разрешены: png, jpg, jpeg, gif, webp', 'error')
+        return redirect(request.referrer or '/student')
 
-        # Сохраняем новую с уникальным именем
-        filename = secure_filename(f"{current_user.id}_{file.filename}")
-        filepath = os.path.join(current_app.config['AVATARS_FOLDER'], filename)
-        file.save(filepath)
+    # Проверяем содержимое, уменьшаем до миниатюр и перекодируем в WebP
+    try:
+        filename, files = process_avatar(file.stream)
+    except AvatarError as e:
+        flash(f'❌ {e}', 'error')
+        return redirect(request.referrer or '/student')
 
-        # Обновляем в базе
-        current_user.avatar_filename = filename
-        db.session.commit()
+    save_avatar(filename, files)
 
-        flash('✅ Аватарка успешно обновлена!', 'success')
-        return redirect('/student')
+    old_filename = current_user.avatar_filename
+    current_user.avatar_filename = filename
+    db.session.commit()
 
-    flash('❌ Недопустимый формат файла. Разрешены: png, jpg, jpeg, gif', 'error')
-    return redirect('/student')
+    # Старый файл удаляем только после коммита и только если он больше ничей
+    if old_filename != filename:
+        remove_avatar_if_unused(old_filename)
+
+    flash('✅ Аватарка успешно обновлена!', 'success')
+    return redirect(request.referrer or '/student')
 
 
 # === УПРАВЛЕНИЕ УЧЕНИКАМИ ===
@@ -1953,7 +1991,11 @@ def admin_students():
     # Считаем архивированных учеников
     archived_count = User.query.filter_by(role="student", is_active=False).count()
 
-    return render_template("admin_students.html", students=students_with_data, archived_count=archived_count)
+    # Классы для массового архивирования (выпуск)
+    classes = sorted({student.class_name for student in students if student.class_name})
+
+    return render_template("admin_students.html", students=students_with_data, archived_count=archived_count,
+                           classes=classes)
 
 
 @routes.route("/admin/student/<int:student_id>/edit", methods=["GET", "POST"])
@@ -1997,7 +2039,7 @@ def admin_edit_student(student_id):
             student.class_name = class_name
 
             # Баланс
-            student.balance = float(balance) if balance else 0.0
+            student.balance = parse_money(balance) if balance else 0.0
 
             # Абонемент
             student.has_subscription = has_subscription
@@ -2044,48 +2086,12 @@ def admin_delete_student(student_id):
         return redirect("/admin/students")
 
     student_name = student.full_name
-    refund_amount = student.balance
 
     try:
-        # 1. Возврат денег на отдельный счёт (если баланс > 0)
-        if refund_amount > 0:
-            # Создаём запись о возврате средств
-            refund_log = DeletionLog(
-                user_id=student.id,
-                user_email=student.email,
-                user_full_name=student.full_name,
-                deleted_by_admin_id=current_user.id,
-                deleted_by_admin_email=current_user.email,
-                refund_amount=refund_amount,
-                reason="Архивирование ученика с возвратом средств"
-            )
-            db.session.add(refund_log)
-
-            # Можно также создать транзакцию в отдельной таблице, если она есть
-            # Например: Transaction(student_id=student.id, amount=refund_amount, type="refund", ...)
-
-        # 2. Архивируем ученика вместо полного удаления
-        student.is_active = False
-        student.deleted_at = datetime.utcnow()
-        student.deleted_by = current_user.id
-
-        # 3. Записываем в лог удаление
-        deletion_log = DeletionLog(
-            user_id=student.id,
-            user_email=student.email,
-            user_full_name=student.full_name,
-            deleted_by_admin_id=current_user.id,
-            deleted_by_admin_email=current_user.email,
-            refund_amount=refund_amount,
-            reason=request.form.get("reason", "Ученик удалён администратором")
+        # Возврат и удаление пишутся в журнал, архивирование можно отменить из архива
+        _, _, refund_amount = archive_students(
+            current_user, request.form.get("reason", "Ученик удалён администратором"), student_ids=[student.id]
         )
-        db.session.add(deletion_log)
-
-        # 4. Удаляем связанные данные (опционально - можно оставить для истории)
-        # Allergy.query.filter_by(student_id=student_id).delete()
-        # Order.query.filter_by(student_id=student_id).delete()
-        # Review.query.filter_by(student_id=student_id).delete()
-
         db.session.commit()
 
         # Формируем сообщение о возврате
@@ -2110,21 +2116,135 @@ def admin_archived_students():
     if current_user.role != "admin":
         return redirect("/")
 
-    # Показываем только неактивных (архивированных) учеников
-    students = User.query.filter_by(role="student", is_active=False).order_by(User.deleted_at.desc()).all()
+    search = request.args.get("q", "").strip()
+    archived = [User.role == "student", User.is_active == False]
+    if search:
+        # Регистр сравнивается через casefold: lower()/ILIKE в SQLite не понимают кириллицу
+        needle = search.casefold()
+        archived.append(or_(*(casefold(column).contains(needle, autoescape=True)
+                              for column in (User.full_name, User.email, User.class_name))))
+
+    # Постраничный вывод по ключу (deleted_at, id): страница не дорожает с ростом архива.
+    # Ученики без даты удаления (старые записи) идут в конце: NULLS LAST явно, потому что
+    # PostgreSQL при DESC по умолчанию ставит NULL первыми, а условие курсора рассчитано на конец
+    page = select(User).where(*archived)
+    before_id = request.args.get("before_id", type=int)
+    if before_id is not None:
+        before_at = request.args.get("before_at", "")
+        try:
+            before_at = datetime.fromisoformat(before_at) if before_at else None
+        except ValueError:
+            before_at = None
+        if before_at is None:
+            page = page.where(User.deleted_at.is_(None), User.id < before_id)
+        else:
+            page = page.where(or_(
+                User.deleted_at < before_at,
+                and_(User.deleted_at == before_at, User.id < before_id),
+                User.deleted_at.is_(None)
+            ))
+    page = page.order_by(User.deleted_at.desc().nulls_last(), User.id.desc()).limit(ARCHIVE_PAGE_SIZE + 1).subquery()
+    student_alias = aliased(User, page)
+
+    # Последняя запись журнала для учеников страницы — оконной функцией в том же запросе
+    latest_log = select(
+        DeletionLog.user_id,
+        DeletionLog.deleted_by_admin_email,
+        DeletionLog.deleted_at,
+        DeletionLog.refund_amount,
+        func.row_number().over(
+            partition_by=DeletionLog.user_id,
+            order_by=(DeletionLog.deleted_at.desc(), DeletionLog.id.desc())
+        ).label("position")
+    ).where(DeletionLog.user_id.in_(select(page.c.id))).subquery()
+
+    rows = db.session.execute(
+        select(student_alias, latest_log.c.deleted_by_admin_email, latest_log.c.deleted_at,
+               latest_log.c.refund_amount)
+        .outerjoin(latest_log, and_(latest_log.c.user_id == page.c.id, latest_log.c.position == 1))
+        .order_by(page.c.deleted_at.desc().nulls_last(), page.c.id.desc())
+    ).all()
+
+    next_page = None
+    if len(rows) > ARCHIVE_PAGE_SIZE:
+        rows = rows[:ARCHIVE_PAGE_SIZE]
+        last = rows[-1][0]
+        next_page = {"before_id": last.id,
+                     "before_at": last.deleted_at.isoformat() if last.deleted_at else ""}
+        if search:
+            next_page["q"] = search
+
+    students_with_data = [{
+        'student': student,
+        'deleted_by': deleted_by or "—",
+        'deleted_at': deleted_at or student.deleted_at,
+        'refund_amount': refund_amount or 0
+    } for student, deleted_by, deleted_at, refund_amount in rows]
+
+    total = db.session.scalar(select(func.count()).select_from(User).where(*archived))
+
+    undo_minutes = current_app.config['ARCHIVE_UNDO_MINUTES']
+    return render_template("admin_archived_students.html", students=students_with_data, total=total,
+                           search=search, next_page=next_page, first_page=before_id is None,
+                           batches=recent_batches(undo_minutes), undo_minutes=undo_minutes)
+
+
+@routes.route("/admin/students/archive", methods=["POST"])
+@login_required
+def admin_archive_students():
+    """Массовое архивирование: весь класс или выбранные ученики"""
+    if current_user.role != "admin":
+        return redirect("/")
+
+    # Выбранный класс важнее отметок: архивируется весь класс
+    class_name = request.form.get("class_name", "").strip() or None
+    student_ids = None if class_name else \
+        [int(value) for value in request.form.getlist("student_ids") if value.isdigit()] or None
+    if not class_name and not student_ids:
+        flash("Выберите класс или учеников для архивирования", "error")
+        return redirect("/admin/students")
 
-    # Получаем логи удалений
-    students_with_data = []
-    for student in students:
-        deletion_log = DeletionLog.query.filter_by(user_id=student.id).order_by(DeletionLog.deleted_at.desc()).first()
-        students_with_data.append({
-            'student': student,
-            'deleted_by': deletion_log.deleted_by_admin_email if deletion_log else "—",
-            'deleted_at': deletion_log.deleted_at if deletion_log else student.deleted_at,
-            'refund_amount': deletion_log.refund_amount if deletion_log else 0
-        })
+    try:
+        batch_id, count, refund_total = archive_students(
+            current_user, request.form.get("reason", "").strip() or "Выпуск / массовое архивирование",
+            student_ids=student_ids, class_name=class_name
+        )
+        if not count:
+            flash("Нет активных учеников для архивирования", "warning")
+            return redirect("/admin/students")
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка при массовом архивировании: {e}")
+        flash(f"❌ Ошибка при архивировании: {str(e)}", "error")
+        return redirect("/admin/students")
 
-    return render_template("admin_archived_students.html", students=students_with_data)
+    target = f"класс {class_name}" if class_name else "выбранные ученики"
+    flash(f"✅ Архивировано учеников: {count} ({target}). Возвращено {refund_total:.2f} ₽ на счёт возвратов. "
+          f"Отменить можно в течение {current_app.config['ARCHIVE_UNDO_MINUTES']} мин.", "success")
+    return redirect("/admin/students/archived")
+
+
+@routes.route("/admin/students/archive/<batch_id>/undo", methods=["POST"])
+@login_required
+def admin_undo_archive(batch_id):
+    """Отмена массового архивирования в течение ARCHIVE_UNDO_MINUTES"""
+    if current_user.role != "admin":
+        return redirect("/")
+
+    try:
+        restored = undo_archive(batch_id, current_app.config['ARCHIVE_UNDO_MINUTES'])
+        db.session.commit()
+        flash(f"↩️ Архивирование отменено, восстановлено учеников: {restored}", "success")
+    except ArchiveUndoError as e:
+        db.session.rollback()
+        flash(str(e), "error")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка при отмене архивирования: {e}")
+        flash(f"❌ Ошибка при отмене архивирования: {str(e)}", "error")
+
+    return redirect("/admin/students/archived")
 
 
 @routes.route("/admin/student/add", methods=["GET", "POST"])
@@ -2150,18 +2270,15 @@ def admin_add_student():
 
         try:
             # Генерируем надежный пароль (12 символов)
-            import secrets
-            import string
-            alphabet = string.ascii_letters + string.digits + "!@#$%^&*"
-            password = ''.join(secrets.choice(alphabet) for _ in range(12))
+            password = generate_temporary_password()
 
             user = User(
                 full_name=full_name,
                 email=email,
-                password=generate_password_hash(password),
+                password=hasher.generate(password),
                 role="student",
                 class_name=class_name,
-                balance=float(initial_balance) if initial_balance else 0.0,
+                balance=parse_money(initial_balance) if initial_balance else 0.0,
                 has_subscription=has_subscription,
                 is_active=True
             )
@@ -2184,6 +2301,55 @@ def admin_add_student():
     return render_template("admin_add_student.html")
 
 
+@routes.route("/admin/students/import", methods=["GET", "POST"])
+@login_required
+def admin_import_students():
+    """Импорт учеников из CSV/XLSX: все строки или ни одной"""
+    if current_user.role != "admin":
+        abort(403)
+    if request.method == "GET":
+        return render_template("admin_import_students.html", max_rows=MAX_IMPORT_ROWS)
+
+    file = request.files.get("file")
+    if not file or not file.filename:
+        flash("Выберите файл CSV или XLSX", "error")
+        return redirect(request.url)
+
+    try:
+        students, errors = parse_students(read_table(file))
+    except StudentImportError as e:
+        flash(f"❌ {e}", "error")
+        return redirect(request.url)
+
+    if errors:
+        # Ничего не создаём, пока в файле есть ошибки
+        return render_template("admin_import_students.html", max_rows=MAX_IMPORT_ROWS,
+                               errors=errors, valid_count=len(students), filename=file.filename)
+    if not students:
+        flash("В файле нет ни одного ученика", "error")
+        return redirect(request.url)
+
+    try:
+        credentials = create_students(students, hash_method=current_app.config['PASSWORD_HASH_METHOD'],
+                                      workers=current_app.config['PASSWORD_HASH_WORKERS'])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка при импорте учеников: {e}")
+        flash(f"❌ Ошибка при импорте: {str(e)}", "error")
+        return redirect(request.url)
+
+    create_notification(
+        user_id=current_user.id,
+        title="✅ Ученики импортированы",
+        message=f"Из файла {file.filename} добавлено учеников: {len(credentials)}. "
+                f"Временные пароли выгружены в файл и в системе не хранятся.",
+        type="success"
+    )
+    return csv_response(f"Пароли_учеников_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.csv",
+                        CREDENTIALS_HEADER, credentials)
+
+
 @routes.route('/student/subscription/flexible')
 @login_required
 def flexible_subscription():
@@ -2213,7 +2379,8 @@ def calculate_flexible_price():
         days_count = int(data.get('days_count', 10))
         days_config = data.get('days_config', {})
 
-        # === ЗАГРУЗКА РЕАЛЬНЫХ ЦЕН ИЗ БАЗЫ ДАННЫХ ===
+        # === ЗАГРУЗКА РЕАЛЬНЫХ ЦЕН (кэш меню) ===
+        weekly_menu = get_weekly_menu()
         meal_details = {}
         selected_meals = {}
         weekly_price = 0.0
@@ -2235,45 +2402,18 @@ def calculate_flexible_price():
                 'lunch_price': 0.0
             }
 
-            # === ЗАВТРАК ===
-            breakfast = Meal.query.filter_by(day_of_week=day_key, meal_type='breakfast').first()
-            if breakfast:
-                # Загружаем ингредиенты
-                ingredients = []
-                for mi in MealIngredient.query.filter_by(meal_id=breakfast.id).all():
-                    ing = db.session.get(Ingredient, mi.ingredient_id)
-                    if ing:
-                        ingredients.append({
-                            'name': ing.name,
-                            'quantity': float(mi.quantity),
-                            'unit': mi.unit
-                        })
-
-                meal_details[day_key]['breakfast'] = {
-                    'name': breakfast.name,
-                    'price': float(breakfast.price),
-                    'ingredients': ingredients
-                }
-
-            # === ОБЕД ===
-            lunch = Meal.query.filter_by(day_of_week=day_key, meal_type='lunch').first()
-            if lunch:
-                # Загружаем ингредиенты
-                ingredients = []
-                for mi in MealIngredient.query.filter_by(meal_id=lunch.id).all():
-                    ing = db.session.get(Ingredient, mi.ingredient_id)
-                    if ing:
-                        ingredients.append({
-                            'name': ing.name,
-                            'quantity': float(mi.quantity),
-                            'unit': mi.unit
-                        })
-
-                meal_details[day_key]['lunch'] = {
-                    'name': lunch.name,
-                    'price': float(lunch.price),
-                    'ingredients': ingredients
-                }
+            # === БЛЮДА ДНЯ ИЗ КЭША МЕНЮ ===
+            for meal_type in ['breakfast', 'lunch']:
+                meal = weekly_menu[day_key][meal_type]
+                if meal:
+                    meal_details[day_key][meal_type] = {
+                        'name': meal['name'],
+                        'price': float(meal['price']),
+                        'ingredients': [
+                            {'name': ing['name'], 'quantity': float(ing['quantity']), 'unit': ing['unit']}
+                            for ing in meal['ingredients']
+                        ]
+                    }
 
             # === РАСЧЁТ ВЫБРАННЫХ ПРИЁМОВ ===
             day_settings = days_config.get(day_key, {})
@@ -2332,6 +2472,7 @@ def calculate_flexible_price():
 
 @routes.route('/student/subscription/flexible/purchase', methods=['POST'])
 @login_required
+@idempotent
 def purchase_flexible_subscription():
     """Покупка гибкого абонемента с проверкой на уже оплаченные приёмы"""
     if current_user.role != 'student':
@@ -2374,10 +2515,8 @@ def purchase_flexible_subscription():
         }
 
         # === ПЕРЕСЧЁТ СТОИМОСТИ И ФОРМИРОВАНИЕ ЗАКАЗОВ БЕЗ ДУБЛИРОВАНИЯ ===
-        recalculated_total = 0.0
-        meals_to_create = []
-        skipped_meals = []  # Для информирования пользователя
-
+        # Выбранные приёмы по датам: days_count учебных дней начиная с start_date
+        slots = []
         current_date = start_date
         actual_days_processed = 0
 
@@ -2385,75 +2524,27 @@ def purchase_flexible_subscription():
             if current_date.weekday() < 5:  # Только будние дни
                 day_key = day_map[current_date.weekday()]
                 day_config = days_config.get(day_key, {})
-
-                # Проверка завтрака
-                if day_config.get('breakfast'):
-                    # Проверяем, не оплачен ли уже этот приём
-                    existing = Order.query.filter_by(
-                        student_id=current_user.id,
-                        serving_date=current_date,
-                        meal_type='breakfast',
-                        status='paid'
-                    ).first()
-
-                    if existing:
-                        skipped_meals.append((current_date, '🕗 завтрак'))
-                    else:
-                        meal = Meal.query.filter_by(day_of_week=day_key, meal_type='breakfast').first()
-                        if meal:
-                            # Собираем ингредиенты
-                            ingredients_list = []
-                            for mi in MealIngredient.query.filter_by(meal_id=meal.id).all():
-                                ing = db.session.get(Ingredient, mi.ingredient_id)
-                                if ing:
-                                    ingredients_list.append({
-                                        "name": ing.name,
-                                        "qty": mi.quantity,
-                                        "unit": mi.unit
-                                    })
-                            meals_to_create.append({
-                                'day_key': day_key,
-                                'meal_type': 'breakfast',
-                                'serving_date': current_date,
-                                'meal': meal,
-                                'ingredients': ingredients_list
-                            })
-                            recalculated_total += meal.price
-
-                # Проверка обеда
-                if day_config.get('lunch'):
-                    existing = Order.query.filter_by(
-                        student_id=current_user.id,
-                        serving_date=current_date,
-                        meal_type='lunch',
-                        status='paid'
-                    ).first()
-
-                    if existing:
-                        skipped_meals.append((current_date, '🕐 обед'))
-                    else:
-                        meal = Meal.query.filter_by(day_of_week=day_key, meal_type='lunch').first()
-                        if meal:
-                            ingredients_list = []
-                            for mi in MealIngredient.query.filter_by(meal_id=meal.id).all():
-                                ing = db.session.get(Ingredient, mi.ingredient_id)
-                                if ing:
-                                    ingredients_list.append({
-                                        "name": ing.name,
-                                        "qty": mi.quantity,
-                                        "unit": mi.unit
-                                    })
-                            meals_to_create.append({
-                                'day_key': day_key,
-                                'meal_type': 'lunch',
-                                'serving_date': current_date,
-                                'meal': meal,
-                                'ingredients': ingredients_list
-                            })
-                            recalculated_total += meal.price
-
+                for meal_type in ('breakfast', 'lunch'):
+                    if day_config.get(meal_type):
+                        slots.append((current_date, day_key, meal_type))
                 actual_days_processed += 1
             current_date += timedelta(days=1)
+        last_serving_date = current_date - timedelta(days=1)
+
+        # Уже оплаченные приёмы периода — по маскам недель (строка на неделю),
+        # чтобы не брать за них деньги
+        paid_weeks = order_weeks.load(current_user.id, start_date, last_serving_date)
+        paid = {(serving_date, meal_type) for serving_date, _, meal_type in slots
+                if paid_weeks.get(order_weeks.week_start(serving_date), (0, 0, 0))[0]
+                & order_weeks.slot_bit(serving_date, meal_type)}
+        menu = load_menu(['breakfast', 'lunch'])
+
+        meal_labels = {'breakfast': '🕗 завтрак', 'lunch': '🕐 обед'}
+        skipped_meals = [(serving_date, meal_labels[meal_type])
+                         for serving_date, _, meal_type in slots if (serving_date, meal_type) in paid]
+        meals_to_create = [(serving_date, day_key, meal_type) for serving_date, day_key, meal_type in slots
+                           if (serving_date, meal_type) not in paid and (day_key, meal_type) in menu]
+        recalculated_total = money_sum(menu[(day_key, meal_type)][0].price for _, day_key, meal_type in meals_to_create)
 
         # === ИНФОРМИРОВАНИЕ О ПРОПУЩЕННЫХ УЖЕ ОПЛАЧЕННЫХ ПРИЁМАХ ===
         if skipped_meals:
@@ -2475,7 +2566,6 @@ def purchase_flexible_subscription():
             return redirect('/student/subscription/flexible')
 
         # === СОЗДАНИЕ ЗАПИСИ ОБ АБОНЕМЕНТЕ ===
-        last_serving_date = current_date - timedelta(days=1)
         new_sub = FlexibleSubscription(
             student_id=current_user.id,
             days_count=days_count,
@@ -2490,26 +2580,36 @@ def purchase_flexible_subscription():
         db.session.flush()  # ← Получаем ID без коммита
 
         # === СОЗДАНИЕ ЗАКАЗОВ ТОЛЬКО ДЛЯ НЕОПЛАЧЕННЫХ ПРИЁМОВ ===
-        orders_created = []
-        for item in meals_to_create:
-            order = Order(
-                student_id=current_user.id,
-                day_of_week=item['day_key'],
-                meal_type=item['meal_type'],
-                serving_date=item['serving_date'],
-                status='paid',
-                paid_at=datetime.utcnow(),
-                meal_name=item['meal'].name,
-                meal_price=item['meal'].price,
-                meal_ingredients=json.dumps(item['ingredients'], ensure_ascii=False),
-                payment_source='flexible'  # ← СОЗДАН ГИБКИМ АБОНЕМЕНТОМ
-            )
-            db.session.add(order)
-            orders_created.append(order)
+        # Одной командой; приёмы, оплаченные параллельным запросом, пропускает уникальный индекс
+        paid_at = datetime.utcnow()
+        orders_created = insert_paid_orders([{
+            "student_id": current_user.id,
+            "day_of_week": day_key,
+            "meal_type": meal_type,
+            "serving_date": serving_date,
+            "paid_at": paid_at,
+            "meal_name": menu[(day_key, meal_type)][0].name,
+            "meal_price": menu[(day_key, meal_type)][0].price,
+            "meal_ingredients": menu[(day_key, meal_type)][1],
+            "payment_source": "flexible"  # ← СОЗДАН ГИБКИМ АБОНЕМЕНТОМ
+        } for serving_date, day_key, meal_type in meals_to_create])
+
+        if not orders_created:
+            db.session.rollback()
+            flash('ℹ️ Все выбранные приёмы уже оплачены. Абонемент не создан.', 'info')
+            return redirect('/student/subscription/flexible')
+        if len(orders_created) < len(meals_to_create):
+            # Часть приёмов оплачена между проверкой и вставкой — абонемент только на созданные
+            recalculated_total = money_sum(row.meal_price for row in orders_created)
+            new_sub.total_price = recalculated_total
+            new_sub.total_meals = len(orders_created)
 
         # === СПИСАНИЕ С БАЛАНСА ПЕРЕСЧИТАННОЙ СУММЫ ===
         current_user.balance -= recalculated_total
+        invalidate_daily_reports_range(start_date, last_serving_date)
         db.session.commit()
+        bump_subscription(current_user.id)
+        ORDERS_PAID.inc(len(orders_created), source="flexible")
 
         # === УВЕДОМЛЕНИЕ ===
         create_notification(
@@ -2532,6 +2632,7 @@ def purchase_flexible_subscription():
 
 
 @routes.route('/api/flexible-subscription/status')
+@conditional(subscription_etag)
 @login_required
 def flexible_subscription_status():
     """Получение статуса гибкого абонемента"""
@@ -2575,6 +2676,9 @@ def admin_payments():
     # Все ученики
     students = User.query.filter_by(role="student", is_active=True).order_by(User.full_name).all()
 
+    # Классы для массовой оплаты
+    classes = sorted({student.class_name for student in students if student.class_name})
+
     # Статистика
     total_flexible = len(flexible_subs)
     total_orders = len(orders)
@@ -2588,10 +2692,24 @@ def admin_payments():
         total_flexible=total_flexible,
         total_orders=total_orders,
         total_students=total_students,
-        day_names=DAY_NAMES_RU
+        day_names=DAY_NAMES_RU,
+        classes=classes,
+        max_bulk_days=MAX_BULK_DAYS,
+        max_cancel_days=MAX_CANCEL_DAYS
     )
 
 
+@routes.route("/admin/payments/export.csv")
+@login_required
+def admin_payments_export():
+    """Потоковая выгрузка журнала оплат в CSV"""
+    if current_user.role != "admin":
+        return redirect("/")
+
+    filename = f"Журнал_оплат_{datetime.today().strftime('%Y-%m-%d')}.csv"
+    return csv_response(filename, PAYMENT_HEADER, payment_rows())
+
+
 @routes.route("/admin/payment/flexible/<int:sub_id>/cancel", methods=["POST"])
 @login_required
 def admin_cancel_flexible_subscription(sub_id):
@@ -2627,6 +2745,10 @@ def admin_cancel_flexible_subscription(sub_id):
         order.status = 'cancelled'
         order.is_collected = False  # На случай, если уже выдан
         orders_cancelled_count += 1
+    order_weeks.clear((order.student_id, order.serving_date, order.meal_type) for order in orders_to_cancel)
+
+    # Поздняя отмена меняет итоги уже закрытых дней
+    invalidate_daily_reports_range(subscription.start_date.date(), subscription.expires_at.date())
 
     # Возврат средств на баланс
     refund_amount = subscription.total_price
@@ -2636,6 +2758,7 @@ def admin_cancel_flexible_subscription(sub_id):
     subscription.is_active = False
 
     db.session.commit()
+    bump_subscription(student.id)
 
     # Уведомление ученику
     create_notification(
@@ -2679,6 +2802,8 @@ def admin_cancel_order(order_id):
 
     # Отмена заказа
     order.status = "cancelled"
+    order_weeks.clear([(order.student_id, order.serving_date, order.meal_type)])
+    invalidate_daily_reports(order.serving_date)
 
     # ЛОГИРОВАНИЕ (ИСПРАВЛЕНО: action_type → reason)
     log = DeletionLog(
@@ -2715,7 +2840,7 @@ def admin_add_payment():
         return redirect("/admin/payments")
 
     student_id = request.form.get("student_id", type=int)
-    amount = request.form.get("amount", type=float)
+    amount = request.form.get("amount", type=parse_money)
     payment_type = request.form.get("payment_type")
 
     if not student_id:
@@ -2777,33 +2902,16 @@ def admin_add_payment():
 
         day_of_week = days_map[serving_date.weekday()]
 
-        # Проверка существования меню
+        # Проверка существования меню (вместе с рецептом для фиксации в заказе)
 
-        meal = Meal.query.filter_by(day_of_week=day_of_week, meal_type=meal_type).first()
+        menu = load_menu([meal_type])
 
-        if not meal:
+        if (day_of_week, meal_type) not in menu:
             flash("Меню для выбранной даты и приёма не найдено", "error")
 
             return redirect("/admin/payments")
 
-        # Проверка, не оплачен ли уже этот приём на эту дату
-
-        existing_order = Order.query.filter_by(
-
-            student_id=student_id,
-
-            serving_date=serving_date,
-
-            meal_type=meal_type,
-
-            status="paid"
-
-        ).first()
-
-        if existing_order:
-            flash(f"Этот приём пищи уже оплачен на {serving_date.strftime('%d.%m.%Y')}", "error")
-
-            return redirect("/admin/payments")
+        meal, ingredients = menu[(day_of_week, meal_type)]
 
         # === КЛЮЧЕВАЯ ПРОВЕРКА: достаточно ли средств на балансе? ===
 
@@ -2822,87 +2930,171 @@ def admin_add_payment():
 
             return redirect("/admin/payments")
 
-        # === БАЛАНС ДОСТАТОЧНЫЙ - СПИСЫВАЕМ ДЕНЬГИ И СОЗДАЁМ ЗАКАЗ ===
-
-        old_balance = student.balance
-
-        student.balance -= meal.price
+        # === СОЗДАЁМ ЗАКАЗ: повторную оплату того же приёма отсекает уникальный индекс ===
+
+        inserted = insert_paid_orders([{
+            "student_id": student_id,
+            "day_of_week": day_of_week,
+            "meal_type": meal_type,
+            "serving_date": serving_date,
+            "paid_at": datetime.utcnow(),
+            "meal_name": meal.name,
+            "meal_price": meal.price,
+            "meal_ingredients": ingredients,
+            "payment_source": "single"
+        }])
+
+        if not inserted:
+            db.session.rollback()
+            flash(f"Этот приём пищи уже оплачен на {serving_date.strftime('%d.%m.%Y')}", "error")
 
-        # Собираем ингредиенты для фиксации в заказе
+            return redirect("/admin/payments")
 
-        ingredients_list = []
+        # === БАЛАНС ДОСТАТОЧНЫЙ - СПИСЫВАЕМ ДЕНЬГИ ===
 
-        for mi in MealIngredient.query.filter_by(meal_id=meal.id).all():
+        student.balance -= meal.price
 
-            ing = db.session.get(Ingredient, mi.ingredient_id)
+        invalidate_daily_reports(serving_date)
 
-            if ing:
-                ingredients_list.append({
+        db.session.commit()
+        ORDERS_PAID.inc(source="single")
 
-                    "name": ing.name,
+        # Уведомление ученику
 
-                    "qty": mi.quantity,
+        create_notification(
 
-                    "unit": mi.unit
+            user_id=student.id,
 
-                })
+            title="✅ Оплата добавлена администратором",
 
-        # Создаём заказ
+            message=f"{'Завтрак' if meal_type == 'breakfast' else 'Обед'} на {serving_date.strftime('%d.%m.%Y')} оплачен администратором. Сумма: {meal.price:.2f} ₽",
 
-        order = Order(
+            type="success"
 
-            student_id=student_id,
+        )
 
-            day_of_week=day_of_week,
+        flash(
 
-            meal_type=meal_type,
+            f"✅ Оплата для {student.full_name} на {serving_date.strftime('%d.%m.%Y')} создана. "
 
-            serving_date=serving_date,
+            f"Списано: {meal.price:.2f} ₽. Новый баланс: {student.balance:.2f} ₽",
 
-            status="paid",
+            "success"
 
-            paid_at=datetime.utcnow(),
+        )
 
-            meal_name=meal.name,
+        return redirect("/admin/payments")
 
-            meal_price=meal.price,
 
-            meal_ingredients=json.dumps(ingredients_list, ensure_ascii=False)
+@routes.route("/admin/payments/bulk", methods=["POST"])
+@login_required
+def admin_bulk_payment():
+    """Массовая оплата: пополнение баланса или питание на период для класса или выбранных учеников"""
+    if current_user.role != "admin":
+        flash("Доступ запрещён", "error")
+        return redirect("/admin/payments")
 
-        )
+    class_name = request.form.get("class_name", "").strip() or None
+    student_ids = [int(value) for value in request.form.getlist("student_ids") if value.isdigit()] or None
+    payment_type = request.form.get("payment_type")
 
-        db.session.add(order)
+    try:
+        students = select_students(student_ids=student_ids, class_name=class_name)
+        if not students:
+            raise BulkPaymentError("Нет активных учеников для оплаты")
+        target = f"класс {class_name}" if class_name else f"выбрано учеников: {len(students)}"
 
-        db.session.commit()
+        if payment_type == "balance":
+            total = bulk_top_up(students, request.form.get("amount", type=parse_money))
+            db.session.commit()
+            flash(f"✅ Баланс пополнен {len(students)} ученикам ({target}) на сумму {total:.2f} ₽", "success")
 
-        # Уведомление ученику
+        elif payment_type == "order":
+            try:
+                date_from = datetime.strptime(request.form.get("date_from", ""), "%Y-%m-%d").date()
+                date_to = datetime.strptime(request.form.get("date_to", ""), "%Y-%m-%d").date()
+            except ValueError:
+                raise BulkPaymentError("Неверный формат даты")
+            charge = request.form.get("subsidized") != "on"
 
-        create_notification(
+            created, total, short = bulk_assign_meals(students, serving_days(date_from, date_to),
+                                                      request.form.getlist("meal_types"), charge=charge)
+            if created:
+                invalidate_daily_reports_range(date_from, date_to)
+            db.session.commit()
+            if created:
+                ORDERS_PAID.inc(created, source="bulk")
+                for student_id, _, _ in students:
+                    bump_subscription(student_id)
 
-            user_id=student.id,
+            if charge:
+                flash(f"✅ Оплачено заказов: {created} на сумму {total:.2f} ₽ ({target})", "success")
+            else:
+                flash(f"✅ Назначено приёмов пищи: {created} ({target}) за счёт программы льготного питания",
+                      "success")
+            if short:
+                names = ", ".join(f"{name} (нужно {need:.2f} ₽, есть {has:.2f} ₽)" for name, need, has in short[:10])
+                more = f" и ещё {len(short) - 10}" if len(short) > 10 else ""
+                flash(f"Не оплачено из-за нехватки средств: {names}{more}", "warning")
 
-            title="✅ Оплата добавлена администратором",
+        else:
+            raise BulkPaymentError("Неизвестный тип оплаты")
 
-            message=f"{'Завтрак' if meal_type == 'breakfast' else 'Обед'} на {serving_date.strftime('%d.%m.%Y')} оплачен администратором. Сумма: {meal.price:.2f} ₽",
+    except BulkPaymentError as e:
+        db.session.rollback()
+        flash(str(e), "error")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка при массовой оплате: {e}")
+        flash(f"❌ Ошибка при массовой оплате: {str(e)}", "error")
 
-            type="success"
+    return redirect("/admin/payments")
 
-        )
 
-        flash(
+@routes.route("/admin/payments/cancel-days", methods=["POST"])
+@login_required
+def admin_cancel_days():
+    """Массовая отмена питания на дату или период (карантин, внеплановый выходной) с возвратом средств"""
+    if current_user.role != "admin":
+        flash("Доступ запрещён", "error")
+        return redirect("/admin/payments")
 
-            f"✅ Оплата для {student.full_name} на {serving_date.strftime('%d.%m.%Y')} создана. "
+    try:
+        date_from = datetime.strptime(request.form.get("date_from", ""), "%Y-%m-%d").date()
+        date_to = datetime.strptime(request.form.get("date_to") or request.form.get("date_from", ""), "%Y-%m-%d").date()
+    except ValueError:
+        flash("Неверный формат даты", "error")
+        return redirect("/admin/payments")
 
-            f"Списано: {meal.price:.2f} ₽. Новый баланс: {student.balance:.2f} ₽",
+    reason = request.form.get("reason", "").strip() or "занятия отменены"
+    class_name = request.form.get("class_name", "").strip() or None
 
-            "success"
+    try:
+        cancelled, student_ids, total = cancel_days(current_user, date_from, date_to, reason,
+                                                       class_name=class_name)
+        if not cancelled:
+            flash("На выбранные даты нет оплаченных заказов", "warning")
+            return redirect("/admin/payments")
+        db.session.commit()
+    except CancellationError as e:
+        db.session.rollback()
+        flash(str(e), "error")
+        return redirect("/admin/payments")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка при массовой отмене: {e}")
+        flash(f"❌ Ошибка при массовой отмене: {str(e)}", "error")
+        return redirect("/admin/payments")
 
-        )
+    for student_id in student_ids:
+        bump_subscription(student_id)
 
-        return redirect("/admin/payments")
+    flash(f"✅ Отменено заказов: {cancelled} у {len(student_ids)} учеников. Возвращено {total:.2f} ₽", "success")
+    return redirect("/admin/payments")
 
 
 @routes.route("/api/menu/<day_of_week>/<meal_type>")
+@conditional(menu_etag)
 @login_required
 def get_menu_info(day_of_week, meal_type):
     """API: получение информации о меню для конкретного дня и приёма пищи"""
@@ -2959,18 +3151,19 @@ def confirm_consumption(order_id):
     # Подтверждаем получение
     order.student_confirmed = True
     order.confirmed_at = datetime.utcnow()
+    order_weeks.mark([(order.student_id, order.serving_date, order.meal_type)], "confirmed")
+    # Подтверждение может прийти после закрытия дня — пересчитаем посещаемость
+    invalidate_daily_reports(order.serving_date)
     db.session.commit()
 
     # Уведомление повару
-    cook_users = User.query.filter_by(role="cook").all()
-    for cook in cook_users:
-        create_notification(
-            user_id=cook.id,
-            title="✅ Питание подтверждено учеником",
-            message=f"Ученик {current_user.full_name} подтвердил получение {'завтрака' if order.meal_type == 'breakfast' else 'обеда'} на {DAY_NAMES_RU.get(order.day_of_week, order.day_of_week)} ({order.serving_date.strftime('%d.%m')}).",
-            type="success",
-            order_id=order.id
-        )
+    broadcast_notification(
+        ["cook"],
+        title="✅ Питание подтверждено учеником",
+        message=f"Ученик {current_user.full_name} подтвердил получение {'завтрака' if order.meal_type == 'breakfast' else 'обеда'} на {DAY_NAMES_RU.get(order.day_of_week, order.day_of_week)} ({order.serving_date.strftime('%d.%m')}).",
+        type="success",
+        order_id=order.id
+    )
 
     flash("✅ Питание успешно подтверждено! Теперь вы можете оставить отзыв.", "success")
     return redirect("/student")
@@ -30,58 +30,9 @@ class NotificationsManager {
             this.loadNotifications();
             // Поллинг
             setInterval(() => this.checkForUpdates(), this.pollInterval);
-
-            // Добавляем стили один раз при инициализации
-            this.addStyles();
         }
     }
 
-    addStyles() {
-        // Проверяем, есть ли уже стили
-        if (document.getElementById('notifications-styles')) {
-            return;
-        }
-
-        const style = document.createElement('style');
-        style.id = 'notifications-styles';
-        style.textContent = `
-            .notification-item {
-                position: relative;
-            }
-
-            .notification-item-delete {
-                position: absolute;
-                right: 12px;
-                top: 50%;
-                transform: translateY(-50%);
-                background: #e74c3c;
-                color: white;
-                border: none;
-                border-radius: 50%;
-                width: 24px;
-                height: 24px;
-                font-size: 14px;
-                cursor: pointer;
-                opacity: 0;
-                transition: all 0.2s;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                z-index: 10;
-            }
-
-            .notification-item:hover .notification-item-delete {
-                opacity: 1;
-            }
-
-            .notification-item-delete:hover {
-                background: #c0392b;
-                transform: translateY(-50%) scale(1.1);
-            }
-        `;
-        document.head.appendChild(style);
-    }
-
     toggleDropdown() {
         if (this.dropdownOpen) {
             this.closeDropdown();
@@ -0,0 +1,191 @@
+# student_import.py
+
+import csv
+import io
+import re
+
+from sqlalchemy import insert
+
+from database import db, casefold
+from models import User
+from money import parse_money
+from passwords import generate_temporary_password, hash_passwords
+
+try:
+    import openpyxl
+except ImportError:  # openpyxl необязателен — без него принимаем только CSV
+    openpyxl = None
+
+# Ограничения на один файл
+MAX_IMPORT_ROWS = 5000
+MAX_INITIAL_BALANCE = 10000
+
+# Как столбцы могут называться в таблице (без учёта регистра)
+COLUMN_ALIASES = {
+    "full_name": ("фио", "ф.и.о.", "имя", "ученик", "full_name", "name"),
+    "email": ("email", "e-mail", "почта", "эл. почта"),
+    "class_name": ("класс", "class", "class_name"),
+    "balance": ("баланс", "начальный баланс", "balance")
+}
+REQUIRED_COLUMNS = {"full_name": "ФИО", "email": "Email", "class_name": "Класс"}
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+CREDENTIALS_HEADER = ["ФИО", "Класс", "Email", "Временный пароль"]
+
+
+class StudentImportError(ValueError):
+    """Файл нельзя прочитать как таблицу учеников"""
+
+
+# === ЧТЕНИЕ ФАЙЛА ===
+
+def read_table(file):
+    """Строки таблицы из загруженного CSV или XLSX (списки строк-ячеек)"""
+    filename = (file.filename or "").lower()
+    if filename.endswith(".xlsx"):
+        return _read_xlsx(file.stream)
+    if filename.endswith(".csv") or filename.endswith(".txt"):
+        return _read_csv(file.stream.read())
+    raise StudentImportError("Поддерживаются файлы CSV и XLSX")
+
+
+def _read_csv(data):
+    # Excel в русской локали сохраняет CSV в cp1251 с разделителем «;»
+    for encoding in ("utf-8-sig", "cp1251"):
+        try:
+            text = data.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise StudentImportError("Не удалось определить кодировку CSV (ожидается UTF-8 или Windows-1251)")
+
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return [[cell.strip() for cell in row] for row in csv.reader(io.StringIO(text), dialect)]
+
+
+def _read_xlsx(stream):
+    if openpyxl is None:
+        raise StudentImportError("Импорт XLSX недоступен: установите openpyxl или сохраните таблицу как CSV")
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise StudentImportError(f"Не удалось открыть XLSX: {e}")
+    try:
+        sheet = workbook.worksheets[0]
+        return [["" if value is None else str(value).strip() for value in row]
+                for row in sheet.iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+
+
+# === ПРОВЕРКА ===
+
+def parse_students(table):
+    """Проверяет все строки сразу: (ученики, ошибки [(номер строки, текст)])"""
+    rows = [(number, row) for number, row in enumerate(table, start=1) if any(row)]
+    if not rows:
+        raise StudentImportError("Файл пуст")
+
+    header_line, header = rows[0]
+    columns = {}
+    for index, title in enumerate(header):
+        title = title.strip().lower()
+        for field, aliases in COLUMN_ALIASES.items():
+            if title in aliases and field not in columns:
+                columns[field] = index
+    missing = [name for field, name in REQUIRED_COLUMNS.items() if field not in columns]
+    if missing:
+        raise StudentImportError(f"В строке заголовка нет столбцов: {', '.join(missing)}")
+
+    if len(rows) - 1 > MAX_IMPORT_ROWS:
+        raise StudentImportError(f"Слишком много строк: не более {MAX_IMPORT_ROWS} за один импорт")
+
+    def cell(row, field):
+        index = columns.get(field)
+        return row[index].strip() if index is not None and index < len(row) else ""
+
+    students, errors = [], []
+    seen = {}
+    for number, row in rows[1:]:
+        student = {
+            "line": number,
+            "full_name": cell(row, "full_name"),
+            "email": cell(row, "email"),
+            "class_name": cell(row, "class_name"),
+            "balance": 0.0
+        }
+        problems = []
+        if not student["full_name"]:
+            problems.append("не указано ФИО")
+        if not EMAIL_RE.match(student["email"]):
+            problems.append(f"некорректный email «{student['email']}»")
+        elif student["email"].casefold() in seen:
+            problems.append(f"email повторяется (строка {seen[student['email'].casefold()]})")
+        else:
+            seen[student["email"].casefold()] = number
+        if not student["class_name"]:
+            problems.append("не указан класс")
+
+        balance = cell(row, "balance").replace(",", ".").replace(" ", "")
+        if balance:
+            try:
+                student["balance"] = parse_money(balance)
+                if not 0 <= student["balance"] <= MAX_INITIAL_BALANCE:
+                    problems.append(f"баланс должен быть от 0 до {MAX_INITIAL_BALANCE} ₽")
+            except ValueError:
+                problems.append(f"баланс «{balance}» — не число")
+
+        if problems:
+            errors.append((number, "; ".join(problems)))
+        else:
+            students.append(student)
+
+    # Уникальность email по базе — одним запросом на весь файл
+    taken = find_taken_emails([student["email"] for student in students])
+    if taken:
+        for student in students:
+            if student["email"].casefold() in taken:
+                errors.append((student["line"], f"пользователь с email {student['email']} уже существует"))
+        students = [student for student in students if student["email"].casefold() not in taken]
+        errors.sort()
+
+    return students, errors
+
+
+def find_taken_emails(emails):
+    """Какие из email уже заняты без учёта регистра (один запрос IN): {email.casefold()}"""
+    if not emails:
+        return set()
+    folded = casefold(User.email)
+    return set(db.session.scalars(db.select(folded).where(folded.in_({email.casefold() for email in emails}))))
+
+
+# === СОЗДАНИЕ ===
+
+def create_students(students, hash_method="scrypt", workers=4):
+    """Добавляет учеников одной пачкой INSERT в текущую транзакцию.
+
+    Возвращает строки для листа с паролями; коммит — за вызывающим.
+    Временные пароли нигде не сохраняются в открытом виде.
+    """
+    passwords = [generate_temporary_password() for _ in students]
+    hashes = hash_passwords(passwords, method=hash_method, workers=workers)
+
+    db.session.execute(insert(User), [{
+        "full_name": student["full_name"],
+        "email": student["email"],
+        "password": password_hash,
+        "role": "student",
+        "class_name": student["class_name"],
+        "balance": student["balance"],
+        "has_subscription": False,
+        "is_active": True
+    } for student, password_hash in zip(students, hashes)])
+
+    return [[student["full_name"], student["class_name"], student["email"], password]
+            for student, password in zip(students, passwords)]
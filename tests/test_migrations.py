@@ -0,0 +1,94 @@
+# test_migrations.py
+
+from datetime import date
+
+import pytest
+from flask import Flask
+from sqlalchemy import inspect
+
+from database import db
+import migrations
+
+# Таблицы, которые меняют шаги миграций, в том виде, в каком их создавала
+# исходная версия приложения (до migrations.py, user_version = 0)
+BASELINE_SCHEMA = [
+    """CREATE TABLE user (
+        id INTEGER NOT NULL, full_name VARCHAR(255), email VARCHAR(255), password VARCHAR(255),
+        role VARCHAR(20), balance FLOAT, has_subscription BOOLEAN, class_name VARCHAR(20),
+        timestamp DATETIME, avatar_filename VARCHAR(255), allergy TEXT, is_active BOOLEAN,
+        deleted_at DATETIME, deleted_by INTEGER,
+        PRIMARY KEY (id), UNIQUE (email))""",
+    """CREATE TABLE ingredient (
+        id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, price_per_unit FLOAT,
+        PRIMARY KEY (id), UNIQUE (name))""",
+    """CREATE TABLE meal (
+        id INTEGER NOT NULL, day_of_week VARCHAR(20), meal_type VARCHAR(20), name VARCHAR(255), price FLOAT,
+        PRIMARY KEY (id))""",
+    """CREATE TABLE deletion_logs (
+        id INTEGER NOT NULL, user_id INTEGER NOT NULL, user_email VARCHAR(120) NOT NULL,
+        user_full_name VARCHAR(200) NOT NULL, deleted_by_admin_id INTEGER NOT NULL,
+        deleted_by_admin_email VARCHAR(120) NOT NULL, refund_amount FLOAT, reason TEXT, deleted_at DATETIME,
+        PRIMARY KEY (id))""",
+    """CREATE TABLE flexible_subscriptions (
+        id INTEGER NOT NULL, student_id INTEGER NOT NULL, days_count INTEGER NOT NULL, days_config JSON NOT NULL,
+        total_price FLOAT NOT NULL, total_meals INTEGER NOT NULL, created_at DATETIME, expires_at DATETIME NOT NULL,
+        is_active BOOLEAN, start_date DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(student_id) REFERENCES user (id))""",
+    """CREATE TABLE "order" (
+        id INTEGER NOT NULL, student_id INTEGER, day_of_week VARCHAR(20), meal_type VARCHAR(20),
+        status VARCHAR(20), is_collected BOOLEAN, serving_date DATE, consumed_at DATETIME, timestamp DATETIME,
+        paid_at DATETIME, meal_name VARCHAR(100), meal_price FLOAT, meal_ingredients TEXT,
+        student_confirmed BOOLEAN, confirmed_at DATETIME, payment_source VARCHAR(20),
+        PRIMARY KEY (id), FOREIGN KEY(student_id) REFERENCES user (id))""",
+]
+
+MONDAY = date(2026, 10, 19)
+
+
+@pytest.fixture
+def baseline_app(tmp_path):
+    """Приложение на базе исходной схемы с дублями оплаченного обеда"""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'baseline.db'}"
+    db.init_app(app)
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            for statement in BASELINE_SCHEMA:
+                conn.exec_driver_sql(statement)
+            conn.exec_driver_sql(
+                "INSERT INTO user (id, full_name, email, password, role, balance, is_active) "
+                "VALUES (1, 'Иванов Пётр', 'ivan@school.ru', 'x', 'student', 10.5, 1)"
+            )
+            # Один и тот же обед оплачен дважды — такое допускала исходная версия
+            for _ in range(2):
+                conn.exec_driver_sql(
+                    'INSERT INTO "order" (student_id, day_of_week, meal_type, status, is_collected, '
+                    "serving_date, meal_price, student_confirmed, payment_source) "
+                    "VALUES (1, 'monday', 'lunch', 'paid', 0, ?, 100.0, 0, 'single')",
+                    (MONDAY.isoformat(),)
+                )
+        yield app
+
+
+def test_baseline_database_upgrades_through_all_steps(baseline_app):
+    with baseline_app.app_context():
+        # Порядок запуска как в app.py: сначала create_all, затем шаги
+        db.create_all()
+        migrations.migrate()
+
+        with db.engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA user_version").scalar() == len(migrations.MIGRATIONS)
+
+            indexes = {index["name"] for index in inspect(conn).get_indexes("order")}
+            assert {"ix_order_serving_date_status", "ux_order_paid_slot"} <= indexes
+            assert "batch_id" in {column["name"] for column in inspect(conn).get_columns("deletion_logs")}
+
+            # Дубль отменён, деньги за него возвращены (баланс уже в копейках)
+            statuses = conn.exec_driver_sql('SELECT status FROM "order" ORDER BY id').scalars().all()
+            assert statuses == ["paid", "cancelled"]
+            assert conn.exec_driver_sql("SELECT balance FROM user WHERE id = 1").scalar() == 11050
+
+            weeks = conn.exec_driver_sql("SELECT student_id, week_start, paid FROM order_weeks").all()
+            assert [tuple(row) for row in weeks] == [(1, MONDAY.isoformat(), 1 << 1)]
+